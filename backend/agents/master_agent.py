@@ -1,3 +1,5 @@
+import asyncio
+import os
 from typing import Any, List, Optional
 from pydantic import Field, ConfigDict, PrivateAttr
 from .hr_agent import HRAgent
@@ -5,10 +7,15 @@ from .product_agent import ProductAgent
 from .general_agent import GeneralAgent
 from core.llm import get_llm, OpenAILLM, GoogleLLM
 from core.vector_store import VectorStore
+from core.image_store import ImageStore, attachment_metrics
+from core.lru_cache import LRUCache
 from google.adk.agents import Agent
 from google.adk.events.event import Event
 from google.genai import types # Framework Communication Protocol
 
+# Memory for ready-to-send context image parts, so popular screenshots skip disk reads
+IMAGE_PART_CACHE_MB = int(os.getenv("IMAGE_PART_CACHE_MB", 64))
+
 class MasterAgent(Agent):
     """
     RITE AI Master Agent - Dual Engine (Gemini & OpenAI)
@@ -26,6 +33,8 @@ class MasterAgent(Agent):
     _product_agent: Any = PrivateAttr()
     _general_agent: Any = PrivateAttr()
     _vector_store: Any = PrivateAttr()
+    _image_store: Any = PrivateAttr()
+    _image_parts: Any = PrivateAttr()
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -34,12 +43,18 @@ class MasterAgent(Agent):
         self._product_agent = ProductAgent()
         self._general_agent = GeneralAgent()
         self._vector_store = VectorStore()
+        self._image_store = ImageStore(os.path.join("static", "images"))
+        self._image_parts = LRUCache(IMAGE_PART_CACHE_MB * 1024 * 1024)
         print("[MasterAgent] Initialization Complete.")
 
     @property
     def vector_store(self):
         return self._vector_store
 
+    @property
+    def image_parts(self):
+        return self._image_parts
+
     @property
     def hr_agent(self):
         return self._hr_agent
@@ -51,6 +66,31 @@ class MasterAgent(Agent):
     @property
     def general_agent(self):
         return self._general_agent
+
+    def _image_part(self, img_name: str):
+        """
+        (types.Part, original bytes, sent bytes) for a context image, served from the LRU
+        when possible. Content-addressed names never change content, so the name is the key.
+        """
+        cached = self._image_parts.get(img_name)
+        if cached:
+            return cached
+        # Downscaled rendition instead of the full-resolution original
+        attachment = self._image_store.attachment(img_name)
+        if not attachment:
+            return None
+        img_path, mime_type, original_size = attachment
+        try:
+            with open(img_path, "rb") as img_file:
+                img_bytes = img_file.read()
+        except Exception as e:
+            print(f"[MasterAgent] Failed to load metadata image {img_name}: {e}")
+            return None
+        part = types.Part(inline_data=types.Blob(mime_type=mime_type, data=img_bytes))
+        cached = (part, original_size, len(img_bytes))
+        self._image_parts.put(img_name, cached, len(img_bytes))
+        return cached
+
     def detect_intents(self, query: str):
         """
         Detects all relevant domains for the query using Semantic LLM Routing.
@@ -143,10 +183,6 @@ class MasterAgent(Agent):
 
         print(f"[MasterAgent] run_async started for session: {session_id}")
         
-        # Imports for handling context images
-        import re
-        import os
-        
         # 1. Extract User Question
         user_question = ""
         if new_message:
@@ -164,14 +200,18 @@ class MasterAgent(Agent):
         # 3. Retrieve Context from for all agents
         # If multiple agents, we gather context for each domain
         all_contexts = []
+        context_images = []
+        # One query embedding, one partition search per domain
+        contexts = self._vector_store.search_contexts(
+            query=user_question,
+            categories=[agent.domain_category for agent in selected_agents]
+        )
         for agent in selected_agents:
             print(f"[MasterAgent] Fetching context for category: {agent.domain_category}")
-            context = self._vector_store.search_as_tool(
-                query=user_question, 
-                category=agent.domain_category
-            )
+            context, images = contexts[agent.domain_category]
             if "No relevant information" not in context:
                 all_contexts.append(f"[{agent.domain_category.upper()} CONTEXT]:\n{context}")
+                context_images.extend(images)
         
         context_text = "\n\n".join(all_contexts) if all_contexts else "No relevant knowledge found."
         print(f"[MasterAgent] Context retrieved (length: {len(context_text)})")
@@ -214,35 +254,29 @@ class MasterAgent(Agent):
                     if part.inline_data:
                         final_content.append(part)
             
-            # Extract and attach images from the RAG context
-            # Regex to find ![Image](/static/images/filename)
-            image_matches = re.findall(r'!\[Image\]\(/static/images/([^)]+)\)', context_text)
-            unique_images = list(set(image_matches))
+            # Attach images referenced by the retrieved chunks (from their metadata), best ranked first
+            unique_images = list(dict.fromkeys(context_images))
             
             if unique_images:
                 print(f"[MasterAgent] Found {len(unique_images)} images in context. Attaching top 3...")
                 
-            for img_name in unique_images[:3]: # Limit to avoid overloading
-                img_path = os.path.join("static", "images", img_name)
-                if os.path.exists(img_path):
-                    try:
-                        with open(img_path, "rb") as img_file:
-                            img_bytes = img_file.read()
-                            
-                        # Guess mime type
-                        ext = os.path.splitext(img_name)[1].lower()
-                        mime_type = "image/png"
-                        if ext in ['.jpg', '.jpeg']: mime_type = "image/jpeg"
-                        elif ext == '.webp': mime_type = "image/webp"
-                        
-                        final_content.append(types.Part(
-                            inline_data=types.Blob(
-                                mime_type=mime_type,
-                                data=img_bytes
-                            )
-                        ))
-                    except Exception as e:
-                        print(f"[MasterAgent] Failed to load metadata image {img_name}: {e}")
+            attached, original_bytes, sent_bytes = 0, 0, 0
+            # A cache miss reads the file and may have to render it: keep that off the event loop
+            image_parts = await asyncio.gather(
+                *(asyncio.to_thread(self._image_part, img_name) for img_name in unique_images[:3]) # Limit to avoid overloading
+            )
+            for cached in image_parts:
+                if cached:
+                    part, original_size, sent_size = cached
+                    final_content.append(part)
+                    attached += 1
+                    original_bytes += original_size
+                    sent_bytes += sent_size
+            
+            if attached:
+                attachment_metrics.record(attached, original_bytes, sent_bytes)
+                print(f"[MasterAgent] Attached {attached} images: {sent_bytes} bytes "
+                      f"({original_bytes - sent_bytes} saved against the originals)")
             
             if unique_images:
                  final_content[0].text += "\n\n[SYSTEM]: Relevant images from the documents have been attached to this request for your reference."
@@ -0,0 +1,113 @@
+"""
+Chunking throughput and peak memory for documents from 10 KB to 50 MB.
+
+Usage:
+    python benchmarks/bench_chunking.py [file ...] [--sizes 10K,100K,1M,10M,50M] [--no-memory]
+
+Without files, synthetic product manuals (headers, numbered steps, screenshots) are
+generated at each size. Every document is chunked with ProceduralChunker and
+StructureAwareChunker, both whole-document (chunk) and streamed (iter_chunks).
+Timing and memory are measured in separate runs because tracemalloc slows Python down.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+# Add parent dir to path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.advanced_chunker import ProceduralChunker, StructureAwareChunker
+
+UNITS = {"K": 1_000, "M": 1_000_000}
+
+
+def parse_size(value: str) -> int:
+    value = value.strip().upper()
+    if value[-1] in UNITS:
+        return int(float(value[:-1]) * UNITS[value[-1]])
+    return int(value)
+
+
+def make_synthetic_manual(size: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    parts, length, section = [], 0, 0
+    while length < size:
+        section += 1
+        lines = [f"\n## Section {section}: Configure mapping set {section}\n",
+                 "Navigate to the Projects tab and follow the procedure below. " * rng.randint(1, 4)]
+        for step in range(rng.randint(3, 12)):
+            lines.append(f"{step + 1}. Click the button and select option {rng.randint(1, 99)} from the dropdown.")
+            if rng.random() < 0.3:
+                lines.append(f"![Image: screenshot of step {step + 1}](/static/images/manual_{section}_{step}.png)")
+        if rng.random() < 0.2:
+            lines.append("Note: the screenshot below shows the final state.")
+            lines.append(f"![Image: overview {section}](/static/images/manual_{section}_overview.png)")
+        block = "\n".join(lines) + "\n"
+        parts.append(block)
+        length += len(block)
+    return "".join(parts)[:size]
+
+
+def as_blocks(text: str):
+    # Paragraph-sized blocks, like the loaders produce
+    start = 0
+    while start < len(text):
+        end = text.find("\n\n", start)
+        end = len(text) if end < 0 else end + 2
+        yield text[start:end], {}
+        start = end
+
+
+def run(chunker, text: str, streaming: bool) -> int:
+    if streaming:
+        return sum(1 for _ in chunker.iter_chunks(as_blocks(text)))
+    return len(chunker.chunk(text))
+
+
+def measure(chunker, text: str, streaming: bool, memory: bool) -> tuple:
+    start = time.perf_counter()
+    count = run(chunker, text, streaming)
+    elapsed = time.perf_counter() - start
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        run(chunker, text, streaming)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return count, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--sizes", default="10K,100K,1M,10M,50M")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run")
+    args = parser.parse_args()
+
+    if args.files:
+        documents = []
+        for path in args.files:
+            with open(path, "r", encoding="utf-8") as f:
+                documents.append((os.path.basename(path), f.read()))
+    else:
+        documents = [(f"synthetic {s}", make_synthetic_manual(parse_size(s))) for s in args.sizes.split(",")]
+
+    chunkers = [("procedural", ProceduralChunker()), ("structure", StructureAwareChunker())]
+
+    print(f"{'document':<16} {'chunker':<11} {'mode':<7} {'size MB':>8} {'chunks':>8} {'chunks/s':>10} {'MB/s':>7} {'peak MB':>8}")
+    for name, text in documents:
+        size_mb = len(text) / 1e6
+        for chunker_name, chunker in chunkers:
+            for streaming in (False, True):
+                count, elapsed, peak = measure(chunker, text, streaming, not args.no_memory)
+                peak_text = f"{peak / 1e6:8.1f}" if peak is not None else f"{'-':>8}"
+                print(f"{name:<16} {chunker_name:<11} {'stream' if streaming else 'whole':<7} {size_mb:8.2f} "
+                      f"{count:8d} {count / elapsed:10.0f} {size_mb / elapsed:7.2f} {peak_text}")
+
+
+if __name__ == "__main__":
+    main()
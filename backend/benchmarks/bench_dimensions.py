@@ -0,0 +1,74 @@
+"""
+Recall against memory for smaller embeddings, on the serving index.
+
+Usage:
+    python benchmarks/bench_dimensions.py [--sample 20000] [--queries 200] [--dims 1536 1024 768 512 256 128]
+
+Samples stored full-width embeddings from the index (held-out queries are chat questions,
+topped up with chunks left out of the sample) and compares, per target dimension:
+truncation + renormalisation (what output_dimensionality / dimensions return for models
+trained for it) and a PCA fitted on the sample (models that are not), each kept as float32
+and float16. Recall@k is measured against exact search at full width; memory is the
+vectors of the whole index at that width and precision.
+"""
+import argparse
+import os
+import sys
+import numpy as np
+
+# Add parent dir to path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+from core.embedding_reduction import PCAProjection, normalize, supports_output_dimension
+from core.index_tuning import held_out_set
+
+K = 10
+
+
+def top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    scores = queries.astype(np.float32) @ corpus.astype(np.float32).T
+    return np.argpartition(-scores, k, axis=1)[:, :k]
+
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sample", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dims", type=int, nargs="+", default=[1536, 1024, 768, 512, 256, 128])
+    args = parser.parse_args()
+
+    from core.vector_store import VectorStore
+    vs = VectorStore()
+    corpus, queries, total = held_out_set(vs, args.sample, args.queries)
+    corpus, queries = normalize(corpus), normalize(queries)
+    width = corpus.shape[1]
+    truth = top_k(corpus, queries, K)
+    model = vs.embedding_model
+    print(f"{model}: {len(corpus)} of {total} chunks at {width} dims, {len(queries)} queries, recall@{K}")
+    if not supports_output_dimension(model):
+        print(f"({model} is not trained for truncation: expect the PCA rows to be the usable ones)")
+
+    print(f"\n{'dims':>5} {'method':<9} {'precision':<9} {'recall':>7} {'MB':>9}")
+    for dims in [width] + sorted((d for d in args.dims if d < width), reverse=True):
+        if dims == width:
+            variants = {"full": (corpus, queries)}
+        else:
+            variants = {"truncate": (normalize(corpus[:, :dims]), normalize(queries[:, :dims]))}
+            if dims < len(corpus):
+                pca = PCAProjection.fit(corpus, dims)
+                variants["pca"] = (pca.apply(corpus), pca.apply(queries))
+        for method, (reduced, reduced_queries) in variants.items():
+            for precision, dtype in (("float32", np.float32), ("float16", np.float16)):
+                found = top_k(reduced.astype(dtype), reduced_queries, K)
+                mb = total * dims * np.dtype(dtype).itemsize / 1e6
+                print(f"{dims:>5} {method:<9} {precision:<9} {recall(found, truth):>7.3f} {mb:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Per-document throughput of the structured .docx loader.
+
+Usage:
+    python benchmarks/bench_docx_loader.py [file.docx ...] [--copies N] [--workers N]
+
+Without files, synthetic manuals (headings, numbered steps, tables, screenshots) are generated.
+Compares the OOXML loader serially, across a process pool, and (on Windows with Word
+installed) the legacy Word COM -> HTML path.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import zipfile
+
+# Add parent dir to path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.docx_loader import load_docx_with_structure, load_docx_batch
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+A_NS = "http://schemas.openxmlformats.org/drawingml/2006/main"
+
+
+def make_synthetic_docx(path: str, sections: int = 200, images: int = 60):
+    body = []
+    for s in range(sections):
+        body.append(f'<w:p><w:pPr><w:pStyle w:val="Heading2"/></w:pPr><w:r><w:t>Section {s}</w:t></w:r></w:p>')
+        body.append('<w:p><w:r><w:t>Navigate to the Projects tab and follow the procedure below.</w:t></w:r></w:p>')
+        for step in range(6):
+            body.append(
+                '<w:p><w:pPr><w:numPr><w:ilvl w:val="0"/><w:numId w:val="1"/></w:numPr></w:pPr>'
+                f'<w:r><w:t>Step {step + 1}: Click the button and configure the mapping set {s}.{step}</w:t></w:r></w:p>'
+            )
+        if s < images:
+            body.append(f'<w:p><w:r><w:drawing><a:blip r:embed="rIdImg{s}"/></w:drawing></w:r></w:p>')
+        body.append(
+            '<w:tbl><w:tr><w:tc><w:p><w:r><w:t>Field</w:t></w:r></w:p></w:tc><w:tc><w:p><w:r><w:t>Value</w:t></w:r></w:p></w:tc></w:tr>'
+            f'<w:tr><w:tc><w:p><w:r><w:t>POD</w:t></w:r></w:p></w:tc><w:tc><w:p><w:r><w:t>{s}</w:t></w:r></w:p></w:tc></w:tr></w:tbl>'
+        )
+    document = (
+        f'<?xml version="1.0" encoding="UTF-8"?><w:document xmlns:w="{W_NS}" xmlns:r="{REL_NS}" xmlns:a="{A_NS}">'
+        f'<w:body>{"".join(body)}</w:body></w:document>'
+    )
+    styles = f'<w:styles xmlns:w="{W_NS}"><w:style w:styleId="Heading2"><w:name w:val="heading 2"/></w:style></w:styles>'
+    numbering = (
+        f'<w:numbering xmlns:w="{W_NS}"><w:abstractNum w:abstractNumId="0"><w:lvl w:ilvl="0"><w:numFmt w:val="decimal"/></w:lvl>'
+        '</w:abstractNum><w:num w:numId="1"><w:abstractNumId w:val="0"/></w:num></w:numbering>'
+    )
+    rels = "".join(
+        f'<Relationship Id="rIdImg{i}" Type="{REL_NS}/image" Target="media/image{i}.png"/>' for i in range(images)
+    )
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("word/document.xml", document)
+        z.writestr("word/styles.xml", styles)
+        z.writestr("word/numbering.xml", numbering)
+        z.writestr("word/_rels/document.xml.rels",
+                   f'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">{rels}</Relationships>')
+        for i in range(images):
+            z.writestr(f"word/media/image{i}.png", os.urandom(40_000))
+
+
+def report(label: str, n_docs: int, total_bytes: int, elapsed: float):
+    print(f"{label:<22} {n_docs / elapsed:8.2f} docs/s  {total_bytes / elapsed / 1e6:8.2f} MB/s  "
+          f"{elapsed / n_docs * 1000:8.1f} ms/doc")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--copies", type=int, default=16, help="synthetic documents to generate")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = args.files
+        if not files:
+            files = []
+            for i in range(args.copies):
+                path = os.path.join(tmp, f"manual_{i}.docx")
+                make_synthetic_docx(path)
+                files.append(path)
+        image_dir = os.path.join(tmp, "images")
+        os.makedirs(image_dir, exist_ok=True)
+        total_bytes = sum(os.path.getsize(f) for f in files)
+        print(f"{len(files)} documents, {total_bytes / 1e6:.1f} MB")
+
+        start = time.perf_counter()
+        for f in files:
+            load_docx_with_structure(f, image_dir)
+        report("ooxml serial", len(files), total_bytes, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        load_docx_batch(files, image_dir, max_workers=args.workers)
+        report("ooxml process pool", len(files), total_bytes, time.perf_counter() - start)
+
+        try:
+            import win32com.client  # noqa: F401
+        except ImportError:
+            print("Word COM not available on this platform; skipping legacy comparison.")
+            return
+
+        from core.loader import _load_doc_via_word
+        start = time.perf_counter()
+        for f in files:
+            _load_doc_via_word(f, image_dir)
+        report("word com (legacy)", len(files), total_bytes, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
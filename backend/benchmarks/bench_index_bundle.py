@@ -0,0 +1,107 @@
+"""
+Export size and restore time of index bundles.
+
+Usage:
+    python benchmarks/bench_index_bundle.py [--chunks 1000000] [--dim 768] [--precision float16 int8]
+
+Fills a scratch Chroma collection with synthetic chunks (random unit vectors, ~800 character
+documents, realistic metadata), exports it at each precision and restores every bundle into
+a fresh Chroma directory, reporting bundle size, export and restore time and chunks/s.
+Quantization loss is reported separately as recall@10 against float32 on a held-out sample.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+import numpy as np
+
+# Add parent dir to path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chromadb
+from core.index_bundle import BUNDLE_PRECISIONS, BUNDLE_FORMAT, write_collections, load_chunks, quantize, dequantize
+
+WORDS = ("click the projects tab then configure the mapping set and save the pod source target "
+         "leave policy employees may carry forward unused days approval manager").split()
+
+
+def synthetic_rows(start: int, count: int, dim: int, rng: np.random.Generator):
+    vectors = rng.standard_normal((count, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    ids = [f"doc{(start + i) // 40}_{start + i:016x}" for i in range(count)]
+    documents = [" ".join(WORDS[(start + i + j) % len(WORDS)] for j in range(130)) for i in range(count)]
+    metadatas = [{
+        "source": f"doc{(start + i) // 40}_manual.docx",
+        "category": "product" if (start + i) % 3 else "hr",
+        "chunk_index": (start + i) % 40,
+        "chunk_hash": f"{start + i:064x}"
+    } for i in range(count)]
+    return ids, documents, metadatas, vectors
+
+
+def fill(collection, chunks: int, dim: int, batch: int):
+    rng = np.random.default_rng(7)
+    for start in range(0, chunks, batch):
+        ids, documents, metadatas, vectors = synthetic_rows(start, min(batch, chunks - start), dim, rng)
+        collection.add(ids=ids, documents=documents, metadatas=metadatas, embeddings=vectors.tolist())
+
+
+def quantization_recall(precision: str, dim: int, corpus: int = 20000, queries: int = 200, k: int = 10) -> float:
+    rng = np.random.default_rng(11)
+    vectors = rng.standard_normal((corpus, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    # Queries near existing vectors, like real questions near their answer chunks
+    q = vectors[rng.choice(corpus, queries, replace=False)] + 0.5 * rng.standard_normal((queries, dim), dtype=np.float32) / np.sqrt(dim)
+    exact = np.argsort(-(q @ vectors.T), axis=1)[:, :k]
+    restored = dequantize(quantize(vectors, precision), precision)
+    approx = np.argsort(-(q @ restored.T), axis=1)[:, :k]
+    return float(np.mean([len(set(a) & set(b)) / k for a, b in zip(exact, approx)]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=1_000_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--precision", nargs="+", choices=BUNDLE_PRECISIONS, default=list(BUNDLE_PRECISIONS))
+    parser.add_argument("--batch", type=int, default=5000)
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="bench_bundle_")
+    try:
+        source = chromadb.PersistentClient(path=os.path.join(work, "source"))
+        collection = source.get_or_create_collection("rag_docs_bench")
+        t0 = time.perf_counter()
+        fill(collection, args.chunks, args.dim, args.batch)
+        fill_s = time.perf_counter() - t0
+        print(f"Filled {collection.count()} chunks ({args.dim} dims) in {fill_s:.1f}s\n")
+
+        print(f"{'precision':<10} {'bundle MB':>10} {'export s':>9} {'restore s':>10} {'chunks/s':>10} {'recall@10':>10}")
+        for precision in args.precision:
+            bundle = os.path.join(work, f"bundle_{precision}.zip")
+            t0 = time.perf_counter()
+            with zipfile.ZipFile(bundle, "w", allowZip64=True) as zf:
+                manifest = {"format": BUNDLE_FORMAT, "precision": precision, **write_collections(zf, [collection], precision)}
+            export_s = time.perf_counter() - t0
+
+            target = chromadb.PersistentClient(path=os.path.join(work, f"restore_{precision}"))
+            restored = target.get_or_create_collection("rag_docs_bench")
+            batch = min(args.batch, target.get_max_batch_size()) if hasattr(target, "get_max_batch_size") else args.batch
+            t0 = time.perf_counter()
+            with zipfile.ZipFile(bundle) as zf:
+                loaded = load_chunks(zf, manifest, restored.add, batch_size=batch)
+            restore_s = time.perf_counter() - t0
+            assert restored.count() == loaded == manifest["chunks"]
+
+            print(f"{precision:<10} {os.path.getsize(bundle) / 1e6:>10.1f} {export_s:>9.1f} {restore_s:>10.1f} "
+                  f"{loaded / restore_s:>10.0f} {quantization_recall(precision, args.dim):>10.3f}")
+            shutil.rmtree(os.path.join(work, f"restore_{precision}"), ignore_errors=True)
+            os.remove(bundle)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
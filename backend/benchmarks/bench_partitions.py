@@ -0,0 +1,95 @@
+"""
+HR query latency and recall as the product manual set grows: one shared collection
+filtered with where={"category": "hr"} against a collection per category.
+
+Usage:
+    python benchmarks/bench_partitions.py [--hr 5000] [--product 0 20000 100000 300000] [--dim 768] [--queries 200]
+
+Vectors are synthetic unit vectors clustered per category (product chunks are many
+near-duplicates of a few topics, like screenshots of the same screens); recall@5 is
+measured against exact brute-force search over the HR chunks.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+
+# Add parent dir to path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chromadb
+
+K = 5
+
+
+def clustered(rng: np.random.Generator, count: int, dim: int, centers: np.ndarray, spread: float) -> np.ndarray:
+    picks = centers[rng.integers(0, len(centers), count)]
+    vectors = picks + spread * rng.standard_normal((count, dim), dtype=np.float32) / np.sqrt(dim)
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def add(collection, vectors: np.ndarray, category: str, start: int, batch: int = 5000):
+    for i in range(0, len(vectors), batch):
+        part = vectors[i:i + batch]
+        collection.add(
+            ids=[f"{category}_{start + i + j}" for j in range(len(part))],
+            embeddings=part.tolist(),
+            metadatas=[{"category": category, "source": f"{category}_{(start + i + j) // 40}"} for j in range(len(part))]
+        )
+
+
+def measure(collection, queries: np.ndarray, truth: list, where: dict = None) -> tuple:
+    latencies, recall = [], []
+    for q, expected in zip(queries, truth):
+        t0 = time.perf_counter()
+        result = collection.query(query_embeddings=[q.tolist()], n_results=K, where=where, include=[])
+        latencies.append((time.perf_counter() - t0) * 1000)
+        recall.append(len(set(result["ids"][0]) & expected) / K)
+    return np.percentile(latencies, 50), np.percentile(latencies, 99), float(np.mean(recall))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hr", type=int, default=5000)
+    parser.add_argument("--product", type=int, nargs="+", default=[0, 20000, 100000, 300000])
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(3)
+    shared_center = rng.standard_normal(args.dim).astype(np.float32)
+    # Both categories share vocabulary ("configure", "approval"...): their clusters overlap
+    hr_centers = shared_center + rng.standard_normal((40, args.dim)).astype(np.float32)
+    product_centers = shared_center + rng.standard_normal((15, args.dim)).astype(np.float32)
+    hr = clustered(rng, args.hr, args.dim, hr_centers, 2.0)
+    queries = clustered(rng, args.queries, args.dim, np.concatenate([hr_centers, product_centers]), 2.5)
+    truth = [set(f"hr_{i}" for i in np.argsort(-(hr @ q))[:K]) for q in queries]
+
+    work = tempfile.mkdtemp(prefix="bench_partitions_")
+    try:
+        client = chromadb.PersistentClient(path=work)
+        shared = client.get_or_create_collection("shared")
+        partition = client.get_or_create_collection("shared-hr")
+        add(shared, hr, "hr", 0)
+        add(partition, hr, "hr", 0)
+
+        print(f"{args.hr} HR chunks, {args.dim} dims, {args.queries} HR queries, recall@{K} vs exact\n")
+        print(f"{'product':>8} | {'shared p50 ms':>13} {'p99 ms':>7} {'recall':>7} | "
+              f"{'partition p50 ms':>16} {'p99 ms':>7} {'recall':>7}")
+        added = 0
+        for target in sorted(args.product):
+            if target > added:
+                add(shared, clustered(rng, target - added, args.dim, product_centers, 1.5), "product", added)
+                added = target
+            s50, s99, s_recall = measure(shared, queries, truth, where={"category": "hr"})
+            p50, p99, p_recall = measure(partition, queries, truth)
+            print(f"{target:>8} | {s50:>13.2f} {s99:>7.2f} {s_recall:>7.3f} | {p50:>16.2f} {p99:>7.2f} {p_recall:>7.3f}")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
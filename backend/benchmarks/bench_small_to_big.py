@@ -0,0 +1,127 @@
+"""
+Section-level chunks against small-to-big retrieval (step/paragraph children expanded
+to their parent sections) on real manuals: hit rate, precision and context size.
+
+Usage:
+    python benchmarks/bench_small_to_big.py [manual.docx ...] [--queries 200] [--offline]
+
+Defaults to every file in uploads/. Queries are steps and paragraphs of the manuals with
+a third of their words dropped; a context unit (chunk or parent section) is relevant
+if it contains the passage the query came from. Precision is the share of relevant units
+handed to the model, tokens the context size (chars / 4). Embeddings come from the
+configured provider (both chunk sets are embedded once); --offline uses hashed
+bag-of-words vectors instead, which needs no API key.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import zlib
+import numpy as np
+
+# Add parent dir to path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+from core.loader import iter_file_blocks
+from core.advanced_chunker import ProceduralChunker, PARENT_TEXT_KEY
+from core.parent_store import expand_results, section_id, SMALL_TO_BIG_MAX_PARENTS
+
+K = 5
+EMBED_BATCH = 64
+
+
+def hashed_embeddings(texts, dim: int = 1024) -> np.ndarray:
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for i, text in enumerate(texts):
+        for word in text.lower().split():
+            vectors[i, zlib.crc32(word.encode("utf-8")) % dim] += 1.0
+    return vectors
+
+
+def embed(texts, task_type: str, offline: bool) -> np.ndarray:
+    if offline:
+        vectors = hashed_embeddings(texts)
+    else:
+        from core.llm import get_llm
+        llm = get_llm()
+        vectors = np.asarray([v for i in range(0, len(texts), EMBED_BATCH)
+                              for v in llm.get_embedding(texts[i:i + EMBED_BATCH], task_type=task_type)], dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+def chunk_manuals(paths, small_to_big: bool):
+    """(chunk, metadata) pairs of every manual, plus the parent section texts by section id."""
+    chunker = ProceduralChunker(small_to_big=small_to_big)
+    chunks, parents = [], {}
+    with tempfile.TemporaryDirectory() as image_dir:
+        for path in paths:
+            source = os.path.basename(path)
+            for chunk, meta in chunker.iter_chunks(iter_file_blocks(path, image_dir)):
+                meta = dict(meta or {})
+                if "section_index" in meta:
+                    meta["section_id"] = section_id(source, meta["section_index"])
+                if PARENT_TEXT_KEY in meta:
+                    parents[meta["section_id"]] = meta.pop(PARENT_TEXT_KEY)
+                chunks.append((chunk, meta))
+    return chunks, parents
+
+
+def make_queries(children, count: int, rng: random.Random):
+    """Noisy copies of child passages; the passage's start identifies the relevant context."""
+    bodies = [chunk.partition("\n\n")[2] for chunk, _ in children]
+    bodies = [b for b in bodies if len(b.split()) >= 6]
+    queries = []
+    for body in rng.sample(bodies, min(count, len(bodies))):
+        words = body.split()
+        kept = [w for w in words if rng.random() > 0.33] or words
+        queries.append((" ".join(kept), body[:60]))
+    return queries
+
+
+def evaluate(name, results_for, queries):
+    hits, precision, tokens = [], [], []
+    for i, (_, key) in enumerate(queries):
+        units = [doc for doc, _ in results_for(i)]
+        relevant = [key in " ".join(doc.split()) for doc in units]
+        hits.append(any(relevant))
+        precision.append(sum(relevant) / len(units) if units else 0.0)
+        tokens.append(sum(len(doc) for doc in units) / 4)
+    print(f"{name:<30} {np.mean(hits):>7.3f} {np.mean(precision):>10.3f} {np.mean(tokens):>12.0f} {np.percentile(tokens, 95):>9.0f}")
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--offline", action="store_true", help="hashed bag-of-words vectors, no API calls")
+    args = parser.parse_args()
+
+    paths = args.files or [os.path.join("uploads", f) for f in sorted(os.listdir("uploads")) if not f.startswith(".")]
+    sections, _ = chunk_manuals(paths, small_to_big=False)
+    children, parents = chunk_manuals(paths, small_to_big=True)
+    queries = make_queries(children, args.queries, random.Random(7))
+    # Passages are matched whitespace-insensitively (chunks and parents are cut differently)
+    queries = [(q, " ".join(key.split())) for q, key in queries]
+    print(f"{len(paths)} files: {len(sections)} section chunks, {len(children)} child chunks, "
+          f"{len(parents)} parent sections, {len(queries)} queries\n")
+
+    query_vectors = embed([q for q, _ in queries], "retrieval_query", args.offline)
+    section_vectors = embed([c for c, _ in sections], "retrieval_document", args.offline)
+    child_vectors = embed([c for c, _ in children], "retrieval_document", args.offline)
+    section_rank = np.argsort(-(query_vectors @ section_vectors.T), axis=1)
+    child_rank = np.argsort(-(query_vectors @ child_vectors.T), axis=1)
+
+    print(f"{'context':<30} {'hit@k':>7} {'precision':>10} {'mean tokens':>12} {'p95 tok':>9}")
+    evaluate(f"section chunks, top {K}", lambda i: [sections[j] for j in section_rank[i][:K]], queries)
+    evaluate(f"child chunks, top {K}", lambda i: [children[j] for j in child_rank[i][:K]], queries)
+    for child_k in (5, 10):
+        evaluate(f"small-to-big, {child_k} -> {SMALL_TO_BIG_MAX_PARENTS} parents",
+                 lambda i: expand_results([children[j] for j in child_rank[i][:child_k]], parents), queries)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Flat top-k over every chunk against two-stage retrieval (summary index -> documents ->
+sections -> chunks of those sections) as the number of documents grows.
+
+Usage:
+    python benchmarks/bench_two_stage.py [--documents 100 300 1000] [--sections 8] [--chunks 5] [--dim 768]
+                                         [--top-documents 4 8 16] [--queries 200]
+
+Vectors are synthetic: each document has a topic, its sections are variations of it and
+their chunks variations of those, like manuals of one product line. Queries are noisy
+copies of random chunks; recall@5 is measured against exact brute-force search.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+
+# Add parent dir to path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chromadb
+from core.summary_index import summary_entries, select_scope, TWO_STAGE_TOP_SECTIONS
+
+K = 5
+
+
+def unit(vectors: np.ndarray) -> np.ndarray:
+    return (vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)).astype(np.float32)
+
+
+def corpus(rng: np.random.Generator, documents: int, sections: int, chunks: int, dim: int):
+    """Yields (source, metadatas, embeddings) per document."""
+    product_line = rng.standard_normal(dim)
+    for d in range(documents):
+        topic = product_line + 1.5 * rng.standard_normal(dim)
+        section_centers = topic + 1.0 * rng.standard_normal((sections, dim))
+        vectors = np.repeat(section_centers, chunks, axis=0) + 1.2 * rng.standard_normal((sections * chunks, dim))
+        source = f"{d}_manual.docx"
+        metadatas = [{"source": source, "category": "product", "section_id": f"{source}#{s}",
+                      "section": f"Section {s}", "chunk_index": s * chunks + c}
+                     for s in range(sections) for c in range(chunks)]
+        yield source, metadatas, unit(vectors)
+
+
+def build(client, rng, documents: int, sections: int, chunks: int, dim: int):
+    flat = client.get_or_create_collection(f"chunks_{documents}")
+    summaries = client.get_or_create_collection(f"summaries_{documents}")
+    all_vectors, all_ids = [], []
+    for source, metadatas, vectors in corpus(rng, documents, sections, chunks, dim):
+        ids = [f"{source}_{m['chunk_index']}" for m in metadatas]
+        flat.add(ids=ids, metadatas=metadatas, embeddings=vectors.tolist())
+        entries = summary_entries(source, metadatas, vectors)
+        summaries.add(ids=entries["ids"], metadatas=entries["metadatas"], embeddings=entries["embeddings"])
+        all_vectors.append(vectors)
+        all_ids.extend(ids)
+    return flat, summaries, np.concatenate(all_vectors), all_ids
+
+
+def measure(search, queries: np.ndarray, truth: list) -> tuple:
+    latencies, recall = [], []
+    for q, expected in zip(queries, truth):
+        t0 = time.perf_counter()
+        found = search(q.tolist())
+        latencies.append((time.perf_counter() - t0) * 1000)
+        recall.append(len(set(found) & expected) / K)
+    return np.percentile(latencies, 50), np.percentile(latencies, 99), float(np.mean(recall))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, nargs="+", default=[100, 300, 1000])
+    parser.add_argument("--sections", type=int, default=8)
+    parser.add_argument("--chunks", type=int, default=5, help="chunks per section")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--top-documents", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--top-sections", type=int, default=TWO_STAGE_TOP_SECTIONS)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="bench_two_stage_")
+    try:
+        client = chromadb.PersistentClient(path=work)
+        print(f"{args.sections} sections x {args.chunks} chunks per document, {args.dim} dims, "
+              f"{args.queries} queries, top {args.top_sections} sections, recall@{K} vs exact\n")
+        print(f"{'documents':>9} {'chunks':>7} | {'search':<14} {'p50 ms':>7} {'p99 ms':>7} {'recall':>7}")
+        for documents in args.documents:
+            rng = np.random.default_rng(5)
+            flat, summaries, vectors, ids = build(client, rng, documents, args.sections, args.chunks, args.dim)
+            picks = rng.choice(len(vectors), args.queries, replace=False)
+            queries = unit(vectors[picks] + 0.5 * rng.standard_normal((args.queries, args.dim)) / np.sqrt(args.dim))
+            truth = [set(ids[i] for i in np.argsort(-(vectors @ q))[:K]) for q in queries]
+
+            def flat_search(q):
+                return flat.query(query_embeddings=[q], n_results=K, include=[])["ids"][0]
+
+            rows = [("flat", measure(flat_search, queries, truth))]
+            for top in args.top_documents:
+                def two_stage(q, top=top):
+                    scope = select_scope(summaries, q, top_documents=top, top_sections=args.top_sections)
+                    return flat.query(query_embeddings=[q], n_results=K, where=scope, include=[])["ids"][0]
+                rows.append((f"two-stage/{top}", measure(two_stage, queries, truth)))
+
+            for name, (p50, p99, recall) in rows:
+                print(f"{documents:>9} {len(vectors):>7} | {name:<14} {p50:>7.2f} {p99:>7.2f} {recall:>7.3f}")
+            client.delete_collection(flat.name)
+            client.delete_collection(summaries.name)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,56 @@
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+import itertools
+import os
 import re
-from typing import List
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+from .chunker import chunk_text
+
+# Streaming: text is buffered up to this size, then chunked at the next safe block boundary
+STREAM_WINDOW_CHARS = 64_000
+
+# Small-to-big: manuals are indexed as one child chunk per step or paragraph, and the
+# section each came from is stored whole (parent_text) to be handed to the model instead
+SMALL_TO_BIG_ENABLED = os.getenv("SMALL_TO_BIG_ENABLED", "true").lower() == "true"
+# Paragraphs longer than this are split into several children
+CHILD_CHUNK_SIZE = int(os.getenv("CHILD_CHUNK_SIZE", 400))
+# Shorter pieces are merged into the next one (a lone "Click Save." embeds poorly)
+CHILD_MIN_CHARS = 80
+PARENT_TEXT_KEY = "parent_text"
+
+# Shared cleaning patterns (compiled once instead of on every call)
+CONTROL_CHARS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]')
+MULTI_NEWLINE = re.compile(r'\n{3,}')
+SPACE_BEFORE_PUNCT = re.compile(r'\s+([.,;!?])')
+BULLET_PREFIX = re.compile(r'^\s*[-*•]\s+', re.MULTILINE)
+
+
+def iter_windowed_chunks(chunk_fn: Callable[[str], List[str]], blocks: Iterable[Tuple[str, dict]],
+                         is_boundary: Callable[[str], bool] = lambda text: True,
+                         window_chars: int = STREAM_WINDOW_CHARS) -> Iterator[Tuple[str, dict]]:
+    """
+    Incremental chunking over a stream of (text block, metadata) pairs.
+    Blocks are buffered into windows that end at a boundary block once the window is
+    large enough, or whenever block metadata changes (e.g. a new PDF page), so chunks
+    are yielded as the document is still being read and memory stays bounded.
+    chunk_fn may return (chunk, extra) pairs instead of strings; those are passed through as is.
+    """
+    buffer, size, meta = [], 0, None
+
+    def flush():
+        window = "".join(buffer)
+        return chunk_fn(window) or chunk_text(window)
+
+    for text, block_meta in blocks:
+        if buffer and (block_meta != meta or (size >= window_chars and is_boundary(text))):
+            for chunk in flush():
+                yield chunk, meta
+            buffer, size = [], 0
+        meta = block_meta
+        buffer.append(text)
+        size += len(text)
+    if buffer:
+        for chunk in flush():
+            yield chunk, meta
 
 class StructureAwareChunker:
     """
@@ -30,22 +80,15 @@ class StructureAwareChunker:
         """
         Standardizes text format for consistent chunking.
         """
-        # Normalize line endings
-        text = text.replace('\r\n', '\n').replace('\r', '\n')
+        # Normalize line endings and remove control characters
+        text = CONTROL_CHARS.sub('', text.replace('\r\n', '\n').replace('\r', '\n'))
         
-        # Remove control characters
-        text = re.sub(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]', '', text)
-        
-        # Fix multiple spaces but keep structure (newlines)
-        lines = []
-        for line in text.split('\n'):
-            clean_line = re.sub(r'\s+', ' ', line).strip()
-            lines.append(clean_line)
-            
-        text = '\n'.join(lines)
-        text = re.sub(r'\n{3,}', '\n\n', text)
-        text = re.sub(r'\s+([.,;!?])', r'\1', text)
-        text = re.sub(r'^\s*[-*•]\s+', '- ', text, flags=re.MULTILINE)
+        # Fix multiple spaces but keep structure (newlines).
+        # str.split() collapses the same whitespace as re '\s+' without a regex pass per line
+        text = '\n'.join(' '.join(line.split()) for line in text.split('\n'))
+        text = MULTI_NEWLINE.sub('\n\n', text)
+        text = SPACE_BEFORE_PUNCT.sub(r'\1', text)
+        text = BULLET_PREFIX.sub('- ', text)
         
         return text
 
@@ -57,15 +100,21 @@ class StructureAwareChunker:
         chunks = self.splitter.split_text(cleaned_text)
         return [c for c in chunks if len(c) > 50]
 
+    def iter_chunks(self, blocks: Iterable[Tuple[str, dict]]) -> Iterator[Tuple[str, dict]]:
+        """Streaming variant of chunk(): any block end is a safe place to cut a window."""
+        return iter_windowed_chunks(self.chunk, blocks)
+
 
 class ProceduralChunker:
     """
     Step-Aware + Hierarchical + Image-Aware Procedural Chunker for product manuals.
     Preserves sequential steps, parent-child relationships, and image references.
     """
-    def __init__(self, chunk_size: int = 1500, chunk_overlap: int = 300):
+    def __init__(self, chunk_size: int = 1500, chunk_overlap: int = 300,
+                 small_to_big: bool = SMALL_TO_BIG_ENABLED, child_size: int = CHILD_CHUNK_SIZE):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.small_to_big = small_to_big
         
         # Patterns for detecting structure
         self.step_pattern = re.compile(
@@ -86,139 +135,203 @@ class ProceduralChunker:
             separators=[r"\n\n", r"\n", r"(?<=\. )", r" ", ""],
             is_separator_regex=True
         )
+        self.child_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=child_size,
+            chunk_overlap=0,
+            separators=[r"\n", r"(?<=\. )", r" ", ""],
+            is_separator_regex=True
+        )
 
     def clean_text(self, text: str) -> str:
         """Clean and normalize text while preserving image references."""
-        text = text.replace('\r\n', '\n').replace('\r', '\n')
-        text = re.sub(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]', '', text)
+        text = CONTROL_CHARS.sub('', text.replace('\r\n', '\n').replace('\r', '\n'))
         
         lines = []
         for line in text.split('\n'):
-            # Don't strip whitespace from image lines - preserve them
-            if self.image_pattern.search(line):
+            # Don't collapse whitespace inside image lines - only strip them
+            if '![' in line and self.image_pattern.search(line):
                 lines.append(line.strip())
             else:
-                clean_line = re.sub(r'\s+', ' ', line).strip()
-                lines.append(clean_line)
+                lines.append(' '.join(line.split()))
         
         text = '\n'.join(lines)
-        text = re.sub(r'\n{3,}', '\n\n', text)
+        text = MULTI_NEWLINE.sub('\n\n', text)
         # Don't mess with punctuation near image references
-        text = re.sub(r'\s+([.,;!?])', r'\1', text)
+        text = SPACE_BEFORE_PUNCT.sub(r'\1', text)
         
         return text
 
-    def parse_hierarchy(self, text: str) -> List[dict]:
+    def _parse_sections(self, text: str) -> List[dict]:
         """
-        Parse text into hierarchical sections with steps and images.
-        Returns list of sections with their content, steps, and image metadata.
+        Single pass over the lines. Content and steps are collected in list buffers
+        (joined once per section) and the offset of each image line inside the
+        section content is recorded as it is read, so chunk() never rescans the section.
         """
         sections = []
-        current_section = {"header": "Introduction", "content": "", "steps": [], "images": []}
-        
-        lines = text.split('\n')
+
+        def new_section(header):
+            return {"header": header, "content": [], "content_len": 0, "steps": [], "images": [], "image_lines": []}
+
+        def close_section(section):
+            section["content"] = "".join(section["content"])
+            sections.append(section)
+
+        current_section = new_section("Introduction")
         current_step = None
-        
-        for line in lines:
+
+        for line in text.split('\n'):
             # Check if it's an image
             if self.image_pattern.search(line):
                 image_ref = line.strip()
                 current_section["images"].append(image_ref)
                 # Also add to current step if in one
                 if current_step is not None:
-                    current_step += line + '\n'
+                    current_step.append(line + '\n')
                 else:
-                    current_section["content"] += line + '\n'
+                    current_section["image_lines"].append((current_section["content_len"], line))
+                    current_section["content"].append(line + '\n')
+                    current_section["content_len"] += len(line) + 1
             # Check if it's a header
             elif self.header_pattern.match(line):
+                # The last step of a section ends at the next header
+                if current_step:
+                    current_section["steps"].append("".join(current_step))
                 # Save previous section if it has content
-                if current_section["content"].strip() or current_section["steps"]:
-                    sections.append(current_section)
-                
+                if "".join(current_section["content"]).strip() or current_section["steps"]:
+                    close_section(current_section)
+
                 # Start new section
-                current_section = {"header": line.strip(), "content": "", "steps": [], "images": []}
+                current_section = new_section(line.strip())
                 current_step = None
             # Check if it's a step
             elif self.step_pattern.match(line):
                 if current_step:
-                    current_section["steps"].append(current_step)
-                current_step = line.strip() + '\n'
+                    current_section["steps"].append("".join(current_step))
+                current_step = [line.strip() + '\n']
             else:
                 # Regular content
                 if current_step is not None:
-                    current_step += line + '\n'
+                    current_step.append(line + '\n')
                 else:
-                    current_section["content"] += line + '\n'
-        
+                    current_section["content"].append(line + '\n')
+                    current_section["content_len"] += len(line) + 1
+
         # Add last step and section
         if current_step:
-            current_section["steps"].append(current_step)
-        if current_section["content"].strip() or current_section["steps"]:
-            sections.append(current_section)
-        
+            current_section["steps"].append("".join(current_step))
+        if "".join(current_section["content"]).strip() or current_section["steps"]:
+            close_section(current_section)
+
         return sections
 
+    def parse_hierarchy(self, text: str) -> List[dict]:
+        """
+        Parse text into hierarchical sections with steps and images.
+        Returns list of sections with their content, steps, and image metadata.
+        """
+        return [
+            {"header": s["header"], "content": s["content"], "steps": s["steps"], "images": s["images"]}
+            for s in self._parse_sections(text)
+        ]
+
+    def _group_steps(self, header: str, steps: List[str], chunks: List[str], start_with_step: bool):
+        """
+        Packs consecutive steps under the section header up to chunk_size.
+        Parts are collected in a list with a running length instead of growing a string.
+        start_with_step: an oversized step starts its own chunk (image-anchored sections);
+        otherwise the step is appended after flushing.
+        """
+        prefix = f"{header}\n\n"
+        parts, length, has_steps = [prefix], len(prefix), False
+        for step in steps:
+            if length + len(step) > self.chunk_size and (start_with_step or has_steps):
+                # Save current chunk if it has content
+                if has_steps:
+                    chunks.append("".join(parts).strip())
+                if start_with_step:
+                    # This ensures image-containing steps get header context
+                    parts, length, has_steps = [prefix, step, "\n"], len(prefix) + len(step) + 1, True
+                    continue
+                parts, length = [prefix], len(prefix)
+            parts.append(step)
+            parts.append("\n")
+            length += len(step) + 1
+            has_steps = True
+        if has_steps:
+            chunks.append("".join(parts).strip())
+
+    def _image_positions(self, image_lines: List[Tuple[int, str]], images: List[str], base: int) -> List[Tuple[int, str]]:
+        """
+        First position of each image reference in the section text, sorted.
+        Equivalent to section_text.find(img) per image, but only the content lines that
+        share the reference's markdown are checked. A reference can sit inside a longer
+        line (clean_text joins a line onto a following image line), so the earliest
+        containing line wins rather than the reference's own line.
+        """
+        # Every '![' in a regular line starts one of its matches; other lines are always checked
+        by_markdown, irregular = {}, []
+        for offset, line in image_lines:
+            matches = {m.group() for m in self.image_pattern.finditer(line)}
+            if line.count('![') != len(self.image_pattern.findall(line)):
+                irregular.append((offset, line))
+            for markdown in matches:
+                by_markdown.setdefault(markdown, []).append((offset, line))
+
+        found = {}
+        positions = []
+        for img in images:
+            if img not in found:
+                found[img] = None
+                candidates = by_markdown.get(self.image_pattern.search(img).group(), [])
+                for offset, line in sorted(candidates + irregular) if irregular else candidates:
+                    if img in line:
+                        found[img] = base + offset + line.index(img)
+                        break
+            if found[img] is not None:
+                positions.append((found[img], img))
+        positions.sort()
+        return positions
+
     def chunk(self, text: str) -> List[str]:
         """
         IMAGE-ANCHORED + STEP-AWARE Chunking.
         Images serve as anchor points - each image gets context before and after.
         Steps are preserved as complete units with their images.
         """
+        return [chunk for chunk, _ in self.chunk_sections(text)]
+
+    def chunk_sections(self, text: str) -> List[Tuple[str, Optional[dict]]]:
+        """chunk() with the parsed section each chunk came from (None for unstructured text)."""
         cleaned_text = self.clean_text(text)
         
         # Parse into hierarchical sections
-        sections = self.parse_hierarchy(cleaned_text)
+        sections = self._parse_sections(cleaned_text)
         
         if not sections:
             # Fallback to standard splitting
-            return self.splitter.split_text(cleaned_text)
+            return [(chunk, None) for chunk in self.splitter.split_text(cleaned_text)]
         
         chunks = []
+        sectioned = []
         
         for section in sections:
+            start = len(chunks)
             header = section["header"]
             content = section["content"]
             steps = section["steps"]
             images = section["images"]
             
-            # IMAGE-ANCHORED STRATEGY:
-            # If section has images, ensure each image gets context
-            if images and steps:
-                # Combine header + content + steps
-                section_text = f"{header}\n\n{content}\n\n" + "\n".join(steps)
-                
-                # Check if we need to split
-                if len(section_text) > self.chunk_size:
-                    # Smart splitting: Keep images with their steps
-                    # Add header + content (may have images)
+            if steps:
+                # Length of header + content + steps, without building the text first
+                section_len = len(header) + len(content) + 4 + sum(len(step) for step in steps) + len(steps) - 1
+                if section_len > self.chunk_size:
                     if content.strip():
-                        intro_chunk = f"{header}\n\n{content}"
-                        chunks.append(intro_chunk)
-                    
-                    # Process steps individually, grouping when possible
-                    current_chunk = f"{header}\n\n"
-                    for step in steps:
-                        # Check if step has an image
-                        has_image = any(img in step for img in images)
-                        
-                        # If adding this step exceeds size
-                        if len(current_chunk) + len(step) > self.chunk_size:
-                            # Save current chunk if it has content
-                            if current_chunk.strip() != f"{header}":
-                                chunks.append(current_chunk.strip())
-                            
-                            # Start new chunk with header + this step
-                            # This ensures image-containing steps get header context
-                            current_chunk = f"{header}\n\n{step}\n"
-                        else:
-                            # Add step to current chunk
-                            current_chunk += step + "\n"
-                    
-                    # Add final chunk
-                    if current_chunk.strip() != f"{header}":
-                        chunks.append(current_chunk.strip())
+                        chunks.append(f"{header}\n\n{content}")
+                    # IMAGE-ANCHORED STRATEGY: keep images with their steps
+                    self._group_steps(header, steps, chunks, start_with_step=bool(images))
                 else:
                     # Small enough - keep entire section together
+                    section_text = f"{header}\n\n{content}\n\n" + "\n".join(steps)
                     chunks.append(section_text.strip())
                     
             elif images:
@@ -226,55 +339,24 @@ class ProceduralChunker:
                 section_text = f"{header}\n\n{content}".strip()
                 
                 if len(section_text) > self.chunk_size:
-                    # Split carefully around images
-                    # Find image positions
-                    image_positions = []
-                    for img in images:
-                        pos = section_text.find(img)
-                        if pos >= 0:
-                            image_positions.append((pos, img))
+                    # Image lines were located while parsing (content follows "header\n\n")
+                    image_positions = self._image_positions(section["image_lines"], images, len(header) + 2)
                     
                     if image_positions:
-                        # Sort by position
-                        image_positions.sort()
-                        
                         # Create chunks anchored around images
-                        last_end = 0
                         for pos, img in image_positions:
                             # Context before image (at least 200 chars if possible)
                             context_start = max(0, pos - 300)
                             context_end = min(len(section_text), pos + len(img) + 300)
                             
-                            chunk_text = section_text[context_start:context_end]
                             # Prepend header
-                            chunk_text = f"{header}\n\n{chunk_text}"
+                            chunk_text = f"{header}\n\n{section_text[context_start:context_end]}"
                             chunks.append(chunk_text.strip())
-                            last_end = context_end
                     else:
                         # Fallback
                         chunks.extend(self.splitter.split_text(section_text))
                 else:
                     chunks.append(section_text)
-                    
-            elif steps:
-                # Steps but no images - regular step-aware chunking
-                section_text = f"{header}\n\n{content}\n\n" + "\n".join(steps)
-                
-                if len(section_text) > self.chunk_size:
-                    if content.strip():
-                        chunks.append(f"{header}\n\n{content}")
-                    
-                    current_chunk = f"{header}\n\n"
-                    for step in steps:
-                        if len(current_chunk) + len(step) > self.chunk_size and current_chunk.strip() != f"{header}":
-                            chunks.append(current_chunk.strip())
-                            current_chunk = f"{header}\n\n"
-                        current_chunk += step + "\n"
-                    
-                    if current_chunk.strip() != f"{header}":
-                        chunks.append(current_chunk.strip())
-                else:
-                    chunks.append(section_text.strip())
             else:
                 # No images, no steps - standard content
                 section_text = f"{header}\n\n{content}".strip()
@@ -282,9 +364,81 @@ class ProceduralChunker:
                     chunks.extend(self.splitter.split_text(section_text))
                 else:
                     chunks.append(section_text)
+            sectioned.extend((chunk, section) for chunk in chunks[start:])
         
         # Filter and return
-        return [c for c in chunks if len(c) > 50]
+        return [(c, section) for c, section in sectioned if len(c) > 50]
+
+    @staticmethod
+    def section_text(section: dict) -> str:
+        """A parsed section as one text: header, content, then its steps."""
+        return (f"{section['header']}\n\n{section['content']}\n\n" + "\n".join(section["steps"])).strip()
+
+    def child_chunks(self, text: str) -> List[Tuple[str, Optional[dict]]]:
+        """
+        Small-to-big chunking: one child per step and per content paragraph, each under
+        its section header, with the parsed section it belongs to (its parent).
+        Images stay in the step or paragraph that references them.
+        """
+        cleaned_text = self.clean_text(text)
+        sections = self._parse_sections(cleaned_text)
+        if not sections:
+            return [(chunk, None) for chunk in self.splitter.split_text(cleaned_text)]
+
+        children = []
+        for section in sections:
+            pieces = [p.strip() for p in section["content"].split("\n\n")] + [s.strip() for s in section["steps"]]
+            merged, pending = [], ""
+            for piece in pieces:
+                if not piece:
+                    continue
+                pending = f"{pending}\n{piece}" if pending else piece
+                if len(pending) >= CHILD_MIN_CHARS:
+                    merged.append(pending)
+                    pending = ""
+            if pending:
+                if merged:
+                    merged[-1] = f"{merged[-1]}\n{pending}"
+                else:
+                    merged.append(pending)
+            for piece in merged:
+                # Steps stay whole up to chunk_size; long paragraphs are cut into child-sized parts
+                parts = [piece] if len(piece) <= self.chunk_size and self.step_pattern.match(piece) \
+                    else self.child_splitter.split_text(piece)
+                children.extend((f"{section['header']}\n\n{part}", section) for part in parts)
+        return [(c, section) for c, section in children if len(c) > 50]
+
+    def iter_chunks(self, blocks: Iterable[Tuple[str, dict]]) -> Iterator[Tuple[str, dict]]:
+        """
+        Streaming variant of chunk(). Windows are only cut before a header block,
+        so a section and its steps and images are never split across windows.
+        Chunk metadata carries the section header and the section's ordinal in the
+        document (section_index), so retrieval can group chunks by section. In
+        small-to-big mode the first child of each section also carries the section's
+        full text (PARENT_TEXT_KEY), which ingestion stores apart from the chunk.
+        """
+        def starts_section(text: str) -> bool:
+            first_line = text.lstrip('\n').split('\n', 1)[0]
+            return bool(self.header_pattern.match(first_line))
+
+        split = self.child_chunks if self.small_to_big else self.chunk_sections
+
+        def window_sections(window: str) -> List[Tuple[str, Optional[dict]]]:
+            return split(window) or [(chunk, None) for chunk in chunk_text(window)]
+
+        section_index, last_section = -1, None
+        for (chunk, section), meta in iter_windowed_chunks(window_sections, blocks, is_boundary=starts_section):
+            if section is None:
+                last_section = None
+                yield chunk, meta
+                continue
+            extra = {"section": section["header"][:200]}
+            if section is not last_section:
+                section_index += 1
+                last_section = section
+                if self.small_to_big:
+                    extra[PARENT_TEXT_KEY] = self.section_text(section)
+            yield chunk, {**(meta or {}), **extra, "section_index": section_index}
 
 
 
@@ -330,9 +484,9 @@ class DynamicChunker:
         else:
             return 'hr'
     
-    def chunk(self, text: str, category: str = "auto") -> List[str]:
+    def get_chunker(self, text: str, category: str = "auto"):
         """
-        Chunks text based on explicit category or auto-detection.
+        Picks the chunker for an explicit category, or auto-detects it from a text sample.
         """
         doc_type = category.lower()
         
@@ -341,10 +495,33 @@ class DynamicChunker:
         
         if doc_type == 'product':
             print(f"[DynamicChunker] Detected/Category: Product Manual -> Using ProceduralChunker")
-            return self.procedural_chunker.chunk(text)
+            return self.procedural_chunker
         else:
             print(f"[DynamicChunker] Detected/Category: HR Policy -> Using StructureAwareChunker")
-            return self.structure_chunker.chunk(text)
+            return self.structure_chunker
+
+    def chunk(self, text: str, category: str = "auto") -> List[str]:
+        """
+        Chunks text based on explicit category or auto-detection.
+        """
+        return self.get_chunker(text, category).chunk(text)
+
+    def iter_chunks(self, blocks: Iterable[Tuple[str, dict]], category: str = "auto") -> Iterator[Tuple[str, dict]]:
+        """
+        Streaming chunking over (text block, metadata) pairs.
+        Only the first ~2000 characters are buffered to pick the strategy.
+        """
+        blocks = iter(blocks)
+        head, sample_len = [], 0
+        for block in blocks:
+            head.append(block)
+            sample_len += len(block[0])
+            if sample_len >= 2000:
+                break
+        if not head:
+            return
+        chunker = self.get_chunker("".join(text for text, _ in head), category)
+        yield from chunker.iter_chunks(itertools.chain(head, blocks))
 
 
 class TaskBasedChunker(StructureAwareChunker):
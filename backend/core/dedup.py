@@ -0,0 +1,315 @@
+import base64
+import json
+import os
+import re
+import threading
+import zlib
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+# Estimated Jaccard similarity (over word shingles) above which two chunks count as near-duplicates
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", 0.9))
+DEDUP_SHINGLE_WORDS = int(os.getenv("DEDUP_SHINGLE_WORDS", 5))
+# 64 permutations in 16 bands of 4 rows: candidates from ~0.5 similarity, then verified
+DEDUP_NUM_PERM = 64
+DEDUP_BANDS = 16
+# The journal is folded into the snapshot once it is larger than the snapshot and at least this big
+DEDUP_JOURNAL_MIN_BYTES = int(os.getenv("DEDUP_JOURNAL_MIN_BYTES", 8 * 1024 * 1024))
+
+WORD_PATTERN = re.compile(r'\w+')
+
+
+def _shingles(text: str, size: int = DEDUP_SHINGLE_WORDS) -> List[str]:
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) <= size:
+        return [" ".join(words)]
+    return [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+
+
+class MinHasher:
+    """MinHash signatures over word shingles, using multiply-shift hashing in numpy."""
+    def __init__(self, num_perm: int = DEDUP_NUM_PERM, bands: int = DEDUP_BANDS, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.bands = bands
+        self._a = rng.integers(1, 2**63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2**63, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in _shingles(text)), dtype=np.uint64)
+        # uint64 arithmetic wraps; the high 32 bits form the permuted hash
+        permuted = (np.outer(self._a, hashes) + self._b[:, None]) >> np.uint64(32)
+        return permuted.min(axis=1).astype(np.uint32)
+
+    def band_keys(self, signature: np.ndarray) -> List[tuple]:
+        return [(i, band.tobytes()) for i, band in enumerate(signature.reshape(self.bands, -1))]
+
+    @staticmethod
+    def similarity(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+        return float(np.count_nonzero(sig_a == sig_b)) / len(sig_a)
+
+
+class _LSHBuckets:
+    def __init__(self, hasher: MinHasher):
+        self.hasher = hasher
+        self._buckets: Dict[tuple, List[str]] = {}
+
+    def add(self, key: str, signature: np.ndarray):
+        for band in self.hasher.band_keys(signature):
+            self._buckets.setdefault(band, []).append(key)
+
+    def remove(self, key: str, signature: np.ndarray):
+        for band in self.hasher.band_keys(signature):
+            members = self._buckets.get(band)
+            if members and key in members:
+                members.remove(key)
+                if not members:
+                    del self._buckets[band]
+
+    def candidates(self, signature: np.ndarray) -> Iterable[str]:
+        seen = set()
+        for band in self.hasher.band_keys(signature):
+            for key in self._buckets.get(band, ()):
+                if key not in seen:
+                    seen.add(key)
+                    yield key
+
+
+hasher = MinHasher()
+
+
+class CorpusDedupIndex:
+    """
+    Persistent MinHash/LSH index over every indexed chunk, keyed by chunk id.
+    Each entry records the chunk's source, category, collection and signature, so a
+    new chunk can find a near-identical one elsewhere in the corpus and reuse its
+    embedding. Also keeps the running count of embeddings saved by deduplication.
+
+    Changes are appended to a journal next to the JSON snapshot (one line per document
+    written or removed) and replayed on load; the snapshot is only rewritten once the
+    journal outgrows it, so a write costs its own size, not the corpus'.
+    """
+    def __init__(self, storage_path: str = "dedup_index.json", threshold: float = DEDUP_THRESHOLD):
+        self.storage_path = storage_path
+        self.journal_path = storage_path + ".journal"
+        self.threshold = threshold
+        self._lock = threading.RLock()
+        self._chunks: Dict[str, dict] = {}
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._buckets = _LSHBuckets(hasher)
+        # source / collection -> chunk ids, so removals do not scan the corpus
+        self._by_source: Dict[str, set] = {}
+        self._by_collection: Dict[str, set] = {}
+        self.saved_embeddings = 0
+        self._snapshot_bytes = 0
+        self._journal_bytes = 0
+        self._load()
+
+    def _load(self):
+        if os.path.exists(self.storage_path):
+            try:
+                with open(self.storage_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except Exception as e:
+                print(f"[Dedup] Error loading index: {e}")
+                data = {}
+            self.saved_embeddings = data.get("saved_embeddings", 0)
+            for chunk_id, entry in data.get("chunks", {}).items():
+                self._put(chunk_id, entry)
+            self._snapshot_bytes = os.path.getsize(self.storage_path)
+        if os.path.exists(self.journal_path):
+            torn = False
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self._apply(json.loads(line))
+                    except ValueError:
+                        # A line torn by a crash mid-append: everything before it is intact
+                        torn = True
+            self._journal_bytes = os.path.getsize(self.journal_path)
+            if torn:
+                # Don't append after a partial line
+                self.checkpoint()
+
+    def _put(self, chunk_id: str, entry: dict):
+        signature = np.frombuffer(base64.b64decode(entry["signature"]), dtype=np.uint32)
+        if len(signature) != hasher.num_perm:
+            return
+        self._discard(chunk_id)
+        self._chunks[chunk_id] = entry
+        self._signatures[chunk_id] = signature
+        self._buckets.add(chunk_id, signature)
+        self._by_source.setdefault(entry["source"], set()).add(chunk_id)
+        self._by_collection.setdefault(entry["collection"], set()).add(chunk_id)
+
+    def _discard(self, chunk_id: str):
+        entry = self._chunks.pop(chunk_id, None)
+        if entry is None:
+            return
+        self._buckets.remove(chunk_id, self._signatures.pop(chunk_id))
+        for index, key in ((self._by_source, entry["source"]), (self._by_collection, entry["collection"])):
+            ids = index.get(key)
+            if ids is not None:
+                ids.discard(chunk_id)
+                if not ids:
+                    del index[key]
+
+    def _apply(self, record: dict):
+        """Applies one journal record to the in-memory index."""
+        op = record["op"]
+        if op == "add":
+            for chunk_id, signature in record["chunks"].items():
+                self._put(chunk_id, {"source": record["source"], "category": record["category"],
+                                     "collection": record["collection"], "signature": signature})
+        elif op == "remove":
+            for chunk_id in record["ids"]:
+                self._discard(chunk_id)
+        elif op == "retag":
+            for chunk_id in self._by_collection.pop(record["old"], set()):
+                self._chunks[chunk_id]["collection"] = record["new"]
+                self._by_collection.setdefault(record["new"], set()).add(chunk_id)
+        elif op == "saved":
+            self.saved_embeddings += record["count"]
+
+    def _write(self, record: dict):
+        """Applies a change and appends it to the journal (compacting into the snapshot once the journal is the bigger file)."""
+        self._apply(record)
+        line = json.dumps(record) + "\n"
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(line)
+        self._journal_bytes += len(line)
+        if self._journal_bytes > max(self._snapshot_bytes, DEDUP_JOURNAL_MIN_BYTES):
+            self.checkpoint()
+
+    def dumps(self) -> str:
+        """The whole index as one snapshot document."""
+        with self._lock:
+            return json.dumps({"saved_embeddings": self.saved_embeddings, "chunks": self._chunks})
+
+    def checkpoint(self):
+        """Rewrites the snapshot from memory and empties the journal."""
+        with self._lock:
+            tmp_path = self.storage_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.dumps())
+            os.replace(tmp_path, self.storage_path)
+            # A crash between the two leaves a journal the snapshot already holds: replaying it
+            # is harmless, except that the saved-embeddings counter may count it twice
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+            self._snapshot_bytes = os.path.getsize(self.storage_path)
+            self._journal_bytes = 0
+
+    @staticmethod
+    def restore(storage_path: str, snapshot: bytes):
+        """Replaces an index's files with a snapshot (from dumps()); the journal belonged to the old index."""
+        with open(storage_path + ".tmp", "wb") as out:
+            out.write(snapshot)
+        os.replace(storage_path + ".tmp", storage_path)
+        if os.path.exists(storage_path + ".journal"):
+            os.remove(storage_path + ".journal")
+
+    def remove_files(self):
+        with self._lock:
+            for path in (self.storage_path, self.journal_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def find(self, signature: np.ndarray, category: str, collection: str,
+             exclude_sources: Iterable[str] = ()) -> Optional[str]:
+        """Returns the id of the most similar indexed chunk above the threshold, if any."""
+        exclude = set(exclude_sources)
+        best_id, best = None, self.threshold
+        with self._lock:
+            for chunk_id in self._buckets.candidates(signature):
+                entry = self._chunks[chunk_id]
+                if entry["category"] != category or entry["collection"] != collection or entry["source"] in exclude:
+                    continue
+                score = hasher.similarity(signature, self._signatures[chunk_id])
+                if score >= best:
+                    best_id, best = chunk_id, score
+        return best_id
+
+    def add(self, source: str, category: str, collection: str, signatures: Dict[str, np.ndarray]):
+        if not signatures:
+            return
+        chunks = {
+            chunk_id: base64.b64encode(signature.astype(np.uint32).tobytes()).decode("ascii")
+            for chunk_id, signature in signatures.items()
+        }
+        with self._lock:
+            self._write({"op": "add", "source": source, "category": category, "collection": collection,
+                         "chunks": chunks})
+
+    def remove_ids(self, ids: Iterable[str]):
+        with self._lock:
+            ids = [chunk_id for chunk_id in ids if chunk_id in self._chunks]
+            if ids:
+                self._write({"op": "remove", "ids": ids})
+
+    def remove_source(self, source: str):
+        with self._lock:
+            self.remove_ids(list(self._by_source.get(source, ())))
+
+    def remove_collection(self, collection: str):
+        with self._lock:
+            self.remove_ids(list(self._by_collection.get(collection, ())))
+
+    def retag_collection(self, old: str, new: str) -> int:
+        """Moves signatures to another collection (after an online re-index; signatures are model independent)."""
+        with self._lock:
+            moved = len(self._by_collection.get(old, ()))
+            if moved and old != new:
+                self._write({"op": "retag", "old": old, "new": new})
+            return moved
+
+    def record_saved(self, count: int):
+        if count:
+            with self._lock:
+                self._write({"op": "saved", "count": count})
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {"indexed_chunks": len(self._chunks), "saved_embeddings": self.saved_embeddings}
+
+
+class DocumentDeduplicator:
+    """
+    Dedup stage for one document, between chunking and embedding.
+    Near-duplicates of an earlier chunk of the same document are dropped; chunks
+    that nearly match a chunk elsewhere in the corpus (same category and collection)
+    are still stored but reuse that chunk's embedding.
+    """
+    def __init__(self, corpus: Optional[CorpusDedupIndex], category: str, collection: str,
+                 exclude_sources: Iterable[str] = (), threshold: float = DEDUP_THRESHOLD):
+        self.corpus = corpus
+        self.category = category
+        self.collection = collection
+        self.exclude_sources = list(exclude_sources)
+        self.threshold = threshold
+        self._signatures: Dict[int, np.ndarray] = {}
+        self._buckets = _LSHBuckets(hasher)
+        self.dropped = 0
+        self.reused = 0
+
+    def signature(self, chunk: str) -> np.ndarray:
+        return hasher.signature(chunk)
+
+    def is_duplicate(self, signature: np.ndarray) -> bool:
+        """True if an earlier chunk of this document is a near-duplicate; otherwise remembers this one."""
+        for key in self._buckets.candidates(signature):
+            if hasher.similarity(signature, self._signatures[int(key)]) >= self.threshold:
+                self.dropped += 1
+                return True
+        key = len(self._signatures)
+        self._signatures[key] = signature
+        self._buckets.add(str(key), signature)
+        return False
+
+    def find_in_corpus(self, signature: np.ndarray) -> Optional[str]:
+        if self.corpus is None:
+            return None
+        return self.corpus.find(signature, self.category, self.collection, self.exclude_sources)
@@ -0,0 +1,210 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+import PIL.Image
+import PIL.ImageChops
+
+DESCRIPTION_CACHE_ENABLED = os.getenv("DESCRIPTION_CACHE_ENABLED", "true").lower() == "true"
+# Max differing bits (of 64) for two screenshots to count as visually identical
+DESCRIPTION_CACHE_MAX_DISTANCE = int(os.getenv("DESCRIPTION_CACHE_MAX_DISTANCE", 2))
+# Perceptual candidates are confirmed pixel by pixel on grayscale images this wide;
+# re-encoding noise stays under the max difference, a changed word or digit does not
+DESCRIPTION_CACHE_VERIFY_WIDTH = 320
+DESCRIPTION_CACHE_MAX_PIXEL_DIFF = int(os.getenv("DESCRIPTION_CACHE_MAX_PIXEL_DIFF", 24))
+# The journal is folded into the snapshot once it is larger than the snapshot and at least this big
+DESCRIPTION_CACHE_JOURNAL_MIN_BYTES = int(os.getenv("DESCRIPTION_CACHE_JOURNAL_MIN_BYTES", 1024 * 1024))
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(HASH_BLOCK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def dhash(img: PIL.Image.Image) -> int:
+    """64-bit difference hash: brightness gradients of a 9x8 grayscale thumbnail."""
+    small = img.convert("L").resize((9, 8), PIL.Image.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def _verify_image(img: PIL.Image.Image) -> PIL.Image.Image:
+    width = min(DESCRIPTION_CACHE_VERIFY_WIDTH, img.width)
+    height = max(1, round(img.height * width / img.width))
+    return img.convert("L").resize((width, height), PIL.Image.BOX)
+
+
+def same_pixels(path_a: str, path_b: str, max_diff: int = DESCRIPTION_CACHE_MAX_PIXEL_DIFF) -> bool:
+    """True if two images of the same size differ by at most max_diff grey levels anywhere."""
+    try:
+        with PIL.Image.open(path_a) as a, PIL.Image.open(path_b) as b:
+            if a.size != b.size:
+                return False
+            low, high = PIL.ImageChops.difference(_verify_image(a), _verify_image(b)).getextrema()
+            return high <= max_diff
+    except Exception:
+        return False
+
+
+class DescriptionCache:
+    """
+    Persistent cache of vision-model image descriptions.
+    Exact lookups use the file's SHA-256; a perceptual lookup (dHash, same pixel
+    dimensions, Hamming distance <= DESCRIPTION_CACHE_MAX_DISTANCE) reuses the
+    description of a visually identical screenshot saved under different bytes.
+    dHash alone cannot tell a changed label apart, so a perceptual candidate is only
+    accepted after comparing its pixels with the image it was described from.
+
+    New descriptions are appended to a journal next to the JSON snapshot and replayed
+    on load; the snapshot is only rewritten once the journal outgrows it.
+    """
+    def __init__(self, storage_path: str = "image_descriptions.json", max_distance: int = DESCRIPTION_CACHE_MAX_DISTANCE):
+        self.storage_path = storage_path
+        self.journal_path = storage_path + ".journal"
+        self.max_distance = max_distance
+        self._lock = threading.RLock()
+        self._entries: Dict[str, Dict] = {}
+        # dHash split into 8 byte-segments: within the max distance at least one segment matches exactly
+        self._segments: Dict[Tuple[int, int], set] = {}
+        self.stats = {"exact_hits": 0, "perceptual_hits": 0, "misses": 0}
+        self._snapshot_bytes = 0
+        self._journal_bytes = 0
+        self._load()
+
+    def _load(self):
+        if os.path.exists(self.storage_path):
+            try:
+                with open(self.storage_path, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except Exception as e:
+                print(f"[DescriptionCache] Error loading cache: {e}")
+                self._entries = {}
+            self._snapshot_bytes = os.path.getsize(self.storage_path)
+        if os.path.exists(self.journal_path):
+            torn = False
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        self._entries[record["sha"]] = record["entry"]
+                    except (ValueError, KeyError, TypeError):
+                        # A line torn by a crash mid-append: everything before it is intact
+                        torn = True
+            self._journal_bytes = os.path.getsize(self.journal_path)
+            if torn:
+                # Don't append after a partial line
+                self.checkpoint()
+        for sha, entry in self._entries.items():
+            self._index(sha, entry)
+
+    def dumps(self) -> str:
+        """The whole cache as one snapshot document."""
+        with self._lock:
+            return json.dumps(self._entries)
+
+    def checkpoint(self):
+        """Rewrites the snapshot from memory and empties the journal."""
+        with self._lock:
+            tmp_path = self.storage_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.dumps())
+            os.replace(tmp_path, self.storage_path)
+            # A crash between the two leaves a journal the snapshot already holds: replaying it is harmless
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+            self._snapshot_bytes = os.path.getsize(self.storage_path)
+            self._journal_bytes = 0
+
+    @staticmethod
+    def restore(storage_path: str, snapshot: bytes):
+        """Replaces a cache's files with a snapshot (from dumps()); the journal belonged to the old cache."""
+        with open(storage_path + ".tmp", "wb") as out:
+            out.write(snapshot)
+        os.replace(storage_path + ".tmp", storage_path)
+        if os.path.exists(storage_path + ".journal"):
+            os.remove(storage_path + ".journal")
+
+    def _index(self, sha: str, entry: Dict):
+        if entry.get("dhash") is None:
+            return
+        for i in range(8):
+            self._segments.setdefault((i, (entry["dhash"] >> (i * 8)) & 0xFF), set()).add(sha)
+
+    @staticmethod
+    def fingerprint(image_path: str) -> Tuple[str, Optional[int], Optional[Tuple[int, int]]]:
+        """Returns (sha256, dhash, (width, height)). Unreadable images get no perceptual hash."""
+        sha = file_sha256(image_path)
+        try:
+            with PIL.Image.open(image_path) as img:
+                return sha, dhash(img), img.size
+        except Exception:
+            return sha, None, None
+
+    def lookup(self, sha: str, phash: Optional[int] = None, size: Optional[Tuple[int, int]] = None,
+               image_path: Optional[str] = None) -> Optional[str]:
+        matches = []
+        with self._lock:
+            entry = self._entries.get(sha)
+            if entry:
+                self.stats["exact_hits"] += 1
+                return entry["description"]
+
+            if phash is not None and size is not None and image_path:
+                candidates = set()
+                for i in range(8):
+                    candidates |= self._segments.get((i, (phash >> (i * 8)) & 0xFF), set())
+                for candidate in candidates:
+                    other = self._entries[candidate]
+                    if tuple(other.get("size") or ()) != tuple(size) or not other.get("path"):
+                        continue
+                    distance = bin(other["dhash"] ^ phash).count("1")
+                    if distance <= self.max_distance:
+                        matches.append((distance, other["path"], other["description"]))
+
+        # Decoding both images is slow: other describe workers keep using the cache meanwhile
+        for _, other_path, description in sorted(matches, key=lambda m: m[0]):
+            if same_pixels(image_path, other_path):
+                with self._lock:
+                    self.stats["perceptual_hits"] += 1
+                return description
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, sha: str, description: str, phash: Optional[int] = None,
+            size: Optional[Tuple[int, int]] = None, image_path: Optional[str] = None):
+        with self._lock:
+            entry = {
+                "description": description,
+                "dhash": phash,
+                "size": list(size) if size else None,
+                "path": image_path,
+                "created_at": time.time()
+            }
+            self._entries[sha] = entry
+            self._index(sha, entry)
+            line = json.dumps({"sha": sha, "entry": entry}) + "\n"
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write(line)
+            self._journal_bytes += len(line)
+            if self._journal_bytes > max(self._snapshot_bytes, DESCRIPTION_CACHE_JOURNAL_MIN_BYTES):
+                self.checkpoint()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), **self.stats}
@@ -0,0 +1,157 @@
+import copy
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+
+class DocumentCatalog:
+    """
+    Persistent catalog of uploaded documents, keyed by source id
+    (the stored upload filename used as the Chroma 'source' metadata).
+
+    Each entry records: source_id, display_name, category, size, content_hash,
+    chunk_count, image_count, images (content-addressed image files it references),
+    embedding_model, collection and ingest timings.
+    Keeps an in-memory content-hash index so identical uploads can be
+    recognised without touching the vector store, and lets listings and stats
+    be answered in O(documents) instead of scanning every chunk.
+    """
+    def __init__(self, storage_path: str = "document_catalog.json"):
+        self.storage_path = storage_path
+        self._lock = threading.RLock()
+        self._documents: Dict[str, Dict] = {}
+        self._by_hash: Dict[str, str] = {}
+        self._txn_depth = 0
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.storage_path):
+            return
+        try:
+            with open(self.storage_path, "r", encoding="utf-8") as f:
+                self._documents = json.load(f)
+        except Exception as e:
+            print(f"[DocumentCatalog] Error loading catalog: {e}")
+            self._documents = {}
+        self._rebuild_hash_index()
+
+    def _rebuild_hash_index(self):
+        self._by_hash = {
+            entry["content_hash"]: source_id
+            for source_id, entry in self._documents.items()
+            if entry.get("content_hash")
+        }
+
+    def _save(self):
+        # Write to a temp file and swap it in so a crash never leaves a half-written catalog
+        tmp_path = self.storage_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._documents, f, indent=2)
+        os.replace(tmp_path, self.storage_path)
+
+    def _commit(self):
+        # Inside a transaction the write happens once, when the outermost block succeeds
+        if self._txn_depth == 0:
+            self._save()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Groups catalog changes with the vector store / disk operations they describe.
+        On error every catalog change made inside the block is rolled back.
+        """
+        with self._lock:
+            snapshot = copy.deepcopy(self._documents)
+            self._txn_depth += 1
+            try:
+                yield self
+            except Exception:
+                self._documents = snapshot
+                self._rebuild_hash_index()
+                raise
+            finally:
+                self._txn_depth -= 1
+            self._commit()
+
+    def get(self, source_id: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._documents.get(source_id)
+            return dict(entry) if entry else None
+
+    def find_by_hash(self, content_hash: str) -> Optional[Dict]:
+        """Returns the catalog entry for a document with identical bytes, if any."""
+        with self._lock:
+            source_id = self._by_hash.get(content_hash)
+            return self.get(source_id) if source_id else None
+
+    def find_by_display_name(self, display_name: str) -> List[Dict]:
+        """Returns all entries uploaded under an original filename, newest first."""
+        with self._lock:
+            matches = [dict(e) for e in self._documents.values() if e.get("display_name") == display_name]
+        return sorted(matches, key=lambda e: e.get("updated_at", 0), reverse=True)
+
+    def list_documents(self) -> List[Dict]:
+        with self._lock:
+            return [dict(entry) for entry in self._documents.values()]
+
+    def upsert(self, source_id: str, **fields) -> Dict:
+        """Creates or updates the entry for a source id."""
+        with self._lock:
+            entry = self._documents.get(source_id, {"source_id": source_id, "created_at": time.time()})
+            old_hash = entry.get("content_hash")
+            entry.update(fields)
+            entry["updated_at"] = time.time()
+            self._documents[source_id] = entry
+
+            if old_hash and old_hash != entry.get("content_hash") and self._by_hash.get(old_hash) == source_id:
+                del self._by_hash[old_hash]
+            if entry.get("content_hash"):
+                self._by_hash[entry["content_hash"]] = source_id
+
+            self._commit()
+            return dict(entry)
+
+    def remove(self, source_id: str) -> bool:
+        with self._lock:
+            entry = self._documents.pop(source_id, None)
+            if not entry:
+                return False
+            if self._by_hash.get(entry.get("content_hash")) == source_id:
+                del self._by_hash[entry["content_hash"]]
+            self._commit()
+            return True
+
+    def restore(self, documents: Dict[str, Dict]):
+        """Replaces the whole catalog, entries kept as given (used to restore an index bundle)."""
+        with self._lock:
+            self._documents = {source_id: dict(entry) for source_id, entry in documents.items()}
+            self._rebuild_hash_index()
+            self._commit()
+
+    def clear(self):
+        with self._lock:
+            self._documents = {}
+            self._by_hash = {}
+            self._commit()
+
+    def get_stats(self) -> Dict:
+        """Aggregate index statistics computed from the catalog alone."""
+        with self._lock:
+            entries = list(self._documents.values())
+        by_category = {}
+        for e in entries:
+            cat = by_category.setdefault(e.get("category", "unknown"), {"documents": 0, "chunks": 0, "bytes": 0})
+            cat["documents"] += 1
+            cat["chunks"] += e.get("chunk_count", 0)
+            cat["bytes"] += e.get("size", 0)
+        return {
+            "documents": len(entries),
+            "chunks": sum(e.get("chunk_count", 0) for e in entries),
+            "images": sum(e.get("image_count", 0) for e in entries),
+            "bytes": sum(e.get("size", 0) for e in entries),
+            "embedding_models": sorted({e["embedding_model"] for e in entries if e.get("embedding_model")}),
+            "by_category": by_category
+        }
@@ -0,0 +1,330 @@
+import os
+import posixpath
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+from .image_store import ImageStore
+
+# OOXML namespaces
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+R_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+A_NS = "http://schemas.openxmlformats.org/drawingml/2006/main"
+V_NS = "urn:schemas-microsoft-com:vml"
+PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+W = f"{{{W_NS}}}"
+P_TAG = f"{W}p"
+TBL_TAG = f"{W}tbl"
+BODY_TAG = f"{W}body"
+SDT_TAG = f"{W}sdt"
+SDT_CONTENT_TAG = f"{W}sdtContent"
+T_TAG = f"{W}t"
+TAB_TAG = f"{W}tab"
+BR_TAGS = (f"{W}br", f"{W}cr")
+BLIP_TAG = f"{{{A_NS}}}blip"
+IMAGEDATA_TAG = f"{{{V_NS}}}imagedata"
+EMBED_ATTR = f"{{{R_NS}}}embed"
+RID_ATTR = f"{{{R_NS}}}id"
+
+HEADING_NAME = re.compile(r'^heading\s*(\d)$', re.IGNORECASE)
+
+
+def _read_xml(package: zipfile.ZipFile, name: str) -> Optional[ET.Element]:
+    try:
+        with package.open(name) as f:
+            return ET.parse(f).getroot()
+    except KeyError:
+        return None
+
+
+def _heading_styles(package: zipfile.ZipFile) -> Dict[str, int]:
+    """Maps paragraph style ids to heading levels using styles.xml."""
+    levels = {}
+    root = _read_xml(package, "word/styles.xml")
+    if root is None:
+        return levels
+    for style in root.iter(f"{W}style"):
+        style_id = style.get(f"{W}styleId")
+        name_el = style.find(f"{W}name")
+        name = name_el.get(f"{W}val", "") if name_el is not None else ""
+        match = HEADING_NAME.match(name.strip())
+        if match:
+            levels[style_id] = int(match.group(1))
+        elif name.strip().lower() == "title":
+            levels[style_id] = 1
+        else:
+            outline = style.find(f"{W}pPr/{W}outlineLvl")
+            if outline is not None:
+                levels[style_id] = int(outline.get(f"{W}val", 0)) + 1
+    return levels
+
+
+def _style_numberings(package: zipfile.ZipFile) -> Dict[str, Tuple[Optional[str], int]]:
+    """
+    Maps paragraph style ids to the (numId, ilvl) their numbering comes from in styles.xml
+    (Word's List Number / List Bullet styles), following basedOn chains.
+    """
+    root = _read_xml(package, "word/styles.xml")
+    if root is None:
+        return {}
+    own, based_on = {}, {}
+    for style in root.iter(f"{W}style"):
+        style_id = style.get(f"{W}styleId")
+        num_pr = style.find(f"{W}pPr/{W}numPr")
+        if num_pr is not None:
+            num_el, ilvl_el = num_pr.find(f"{W}numId"), num_pr.find(f"{W}ilvl")
+            own[style_id] = (num_el.get(f"{W}val") if num_el is not None else None,
+                             int(ilvl_el.get(f"{W}val", 0)) if ilvl_el is not None else 0)
+        parent = style.find(f"{W}basedOn")
+        if parent is not None:
+            based_on[style_id] = parent.get(f"{W}val")
+    numberings = {}
+    for style_id in set(own) | set(based_on):
+        seen, current = set(), style_id
+        while current is not None and current not in own and current not in seen:
+            seen.add(current)
+            current = based_on.get(current)
+        if current in own:
+            numberings[style_id] = own[current]
+    return numberings
+
+
+def _numbering_levels(package: zipfile.ZipFile) -> Dict[Tuple[str, int], Tuple[str, int]]:
+    """Maps (numId, ilvl) to the level's number format and start value, with the num's overrides applied."""
+    root = _read_xml(package, "word/numbering.xml")
+    if root is None:
+        return {}
+
+    def level_of(lvl: ET.Element, default: Tuple[str, int]) -> Tuple[str, int]:
+        fmt, start = lvl.find(f"{W}numFmt"), lvl.find(f"{W}start")
+        return (fmt.get(f"{W}val", default[0]) if fmt is not None else default[0],
+                int(start.get(f"{W}val", default[1])) if start is not None else default[1])
+
+    abstract_levels = {}
+    for abstract in root.iter(f"{W}abstractNum"):
+        abstract_levels[abstract.get(f"{W}abstractNumId")] = {
+            int(lvl.get(f"{W}ilvl", 0)): level_of(lvl, ("decimal", 1)) for lvl in abstract.findall(f"{W}lvl")
+        }
+    levels = {}
+    for num in root.iter(f"{W}num"):
+        abstract_ref = num.find(f"{W}abstractNumId")
+        num_levels = dict(abstract_levels.get(abstract_ref.get(f"{W}val") if abstract_ref is not None else None, {}))
+        for override in num.findall(f"{W}lvlOverride"):
+            ilvl = int(override.get(f"{W}ilvl", 0))
+            level = num_levels.get(ilvl, ("decimal", 1))
+            lvl = override.find(f"{W}lvl")
+            if lvl is not None:
+                level = level_of(lvl, level)
+            start = override.find(f"{W}startOverride")
+            if start is not None:
+                level = (level[0], int(start.get(f"{W}val", level[1])))
+            num_levels[ilvl] = level
+        for ilvl, level in num_levels.items():
+            levels[(num.get(f"{W}numId"), ilvl)] = level
+    return levels
+
+
+def _image_relationships(package: zipfile.ZipFile) -> Dict[str, str]:
+    """Maps relationship ids to image part names inside the package."""
+    rels = {}
+    root = _read_xml(package, "word/_rels/document.xml.rels")
+    if root is None:
+        return rels
+    for rel in root.iter(f"{{{PKG_REL_NS}}}Relationship"):
+        if rel.get("TargetMode") == "External" or not rel.get("Type", "").endswith("/image"):
+            continue
+        rels[rel.get("Id")] = posixpath.normpath(posixpath.join("word", rel.get("Target")))
+    return rels
+
+
+def _paragraph_text(p: ET.Element) -> str:
+    parts = []
+    for el in p.iter():
+        if el.tag == T_TAG and el.text:
+            parts.append(el.text)
+        elif el.tag == TAB_TAG:
+            parts.append("\t")
+        elif el.tag in BR_TAGS:
+            parts.append("\n")
+    return "".join(parts).strip()
+
+
+def _paragraph_images(p: ET.Element) -> List[str]:
+    rel_ids = []
+    for el in p.iter():
+        if el.tag == BLIP_TAG and el.get(EMBED_ATTR):
+            rel_ids.append(el.get(EMBED_ATTR))
+        elif el.tag == IMAGEDATA_TAG and el.get(RID_ATTR):
+            rel_ids.append(el.get(RID_ATTR))
+    return rel_ids
+
+
+class _DocxMarkdownWriter:
+    """Turns body-level OOXML elements into the same markdown the Word HTML path produced."""
+    def __init__(self, package: zipfile.ZipFile, filepath: str, output_image_dir: Optional[str]):
+        self.package = package
+        self.filepath = filepath
+        self.output_image_dir = output_image_dir
+        self.heading_levels = _heading_styles(package)
+        self.style_numberings = _style_numberings(package)
+        self.numbering_levels = _numbering_levels(package)
+        # numId -> ilvl -> last number given, so ordered items count up like Word shows them
+        self._list_counters: Dict[str, Dict[int, int]] = {}
+        self.image_rels = _image_relationships(package)
+        self.image_store = ImageStore(output_image_dir) if output_image_dir else None
+        self._written_images = {}
+        self._in_list = False
+
+    def _export_image(self, rel_id: str) -> Optional[str]:
+        part_name = self.image_rels.get(rel_id)
+        if not part_name or not self.output_image_dir:
+            return None
+        if part_name not in self._written_images:
+            try:
+                # Copy straight out of the zip, no temp HTML round-trip
+                with self.package.open(part_name) as src:
+                    self._written_images[part_name] = self.image_store.put_stream(src, posixpath.splitext(part_name)[1])
+            except KeyError:
+                print(f"Image not found in package: {part_name}")
+                return None
+        return self._written_images[part_name]
+
+    def _end_list(self) -> str:
+        if self._in_list:
+            self._in_list = False
+            return "\n"
+        return ""
+
+    def _list_marker(self, num_id: str, ilvl: int) -> str:
+        fmt, start = self.numbering_levels.get((num_id, ilvl), ("decimal", 1))
+        indent = "   " * ilvl
+        if fmt == "bullet":
+            return f"{indent}* "
+        if fmt == "none":
+            return indent
+        counters = self._list_counters.setdefault(num_id, {})
+        # A new item restarts the levels nested below it
+        for deeper in [level for level in counters if level > ilvl]:
+            del counters[deeper]
+        counters[ilvl] = counters.get(ilvl, start - 1) + 1
+        return f"{indent}{counters[ilvl]}. "
+
+    def paragraph(self, p: ET.Element) -> str:
+        text = _paragraph_text(p)
+        rel_ids = _paragraph_images(p)
+        if not text and not rel_ids:
+            return ""
+
+        ppr = p.find(f"{W}pPr")
+        style_el = ppr.find(f"{W}pStyle") if ppr is not None else None
+        num_pr = ppr.find(f"{W}numPr") if ppr is not None else None
+        outline_el = ppr.find(f"{W}outlineLvl") if ppr is not None else None
+
+        level = None
+        if style_el is not None:
+            level = self.heading_levels.get(style_el.get(f"{W}val"))
+        if level is None and outline_el is not None:
+            level = int(outline_el.get(f"{W}val", 0)) + 1
+
+        # Numbering comes from the paragraph's own numPr or, for list styles, from its style
+        num_id, ilvl = self.style_numberings.get(style_el.get(f"{W}val") if style_el is not None else None, (None, 0))
+        if num_pr is not None:
+            num_el, ilvl_el = num_pr.find(f"{W}numId"), num_pr.find(f"{W}ilvl")
+            if num_el is not None:
+                num_id = num_el.get(f"{W}val")
+            if ilvl_el is not None:
+                ilvl = int(ilvl_el.get(f"{W}val", 0))
+
+        out = []
+        if num_id is not None and level is None and num_id != "0":
+            # List item
+            bullet = self._list_marker(num_id, ilvl)
+            self._in_list = True
+            for rel_id in rel_ids:
+                img_name = self._export_image(rel_id)
+                if img_name:
+                    out.append(f"\n![Image](/static/images/{img_name})\n")
+            if text:
+                out.append(f"{bullet}{text}\n")
+            return "".join(out)
+
+        out.append(self._end_list())
+        for rel_id in rel_ids:
+            img_name = self._export_image(rel_id)
+            if img_name:
+                out.append(f"\n![Image](/static/images/{img_name})\n")
+        if text:
+            prefix = "#" * min(level, 6) + " " if level else ""
+            out.append(f"\n{prefix}{text}\n")
+        return "".join(out)
+
+    def table(self, tbl: ET.Element) -> str:
+        out = [self._end_list(), "\n"]
+        rows = tbl.findall(f"{W}tr")
+        for i, row in enumerate(rows):
+            cells = row.findall(f"{W}tc")
+            cell_texts = [" ".join(_paragraph_text(p) for p in cell.iter(P_TAG)).strip() for cell in cells]
+            out.append("| " + " | ".join(cell_texts) + " |\n")
+            if i == 0:  # Add separator after header row
+                out.append("| " + " | ".join(["---"] * len(cells)) + " |\n")
+        out.append("\n")
+        return "".join(out)
+
+    def finish(self) -> str:
+        return self._end_list()
+
+
+def iter_docx_markdown(filepath: str, output_image_dir: str = None) -> Iterator[str]:
+    """
+    Streams a .docx as markdown blocks by reading the OOXML package directly.
+    Headings, paragraphs, lists, tables and embedded images are emitted in document
+    order; images are written from the zip into output_image_dir as they are met.
+    """
+    with zipfile.ZipFile(filepath) as package:
+        writer = _DocxMarkdownWriter(package, filepath, output_image_dir)
+        # Open elements, each with whether its children are body-level blocks
+        stack = []
+        with package.open("word/document.xml") as f:
+            for event, el in ET.iterparse(f, events=("start", "end")):
+                if event == "start":
+                    if el.tag == BODY_TAG:
+                        holds_blocks = True
+                    elif el.tag == SDT_CONTENT_TAG:
+                        # A content control around body-level blocks (cover pages, TOCs, templated sections)
+                        holds_blocks = len(stack) >= 2 and stack[-1][0].tag == SDT_TAG and stack[-2][1]
+                    else:
+                        holds_blocks = False
+                    stack.append((el, holds_blocks))
+                    continue
+                stack.pop()
+                if not stack or not stack[-1][1]:
+                    continue
+                if el.tag == P_TAG:
+                    block = writer.paragraph(el)
+                elif el.tag == TBL_TAG:
+                    block = writer.table(el)
+                else:
+                    block = ""
+                # Detach parsed blocks so memory stays bounded on large documents
+                # (a cleared element would still sit in the body's child list)
+                stack[-1][0].remove(el)
+                if block:
+                    yield block
+        tail = writer.finish()
+        if tail:
+            yield tail
+
+
+def load_docx_with_structure(filepath: str, output_image_dir: str = None) -> str:
+    """Loads a .docx as markdown without Word COM."""
+    return "".join(iter_docx_markdown(filepath, output_image_dir))
+
+
+def load_docx_batch(filepaths: List[str], output_image_dir: str = None, max_workers: int = None) -> List[str]:
+    """Parses several .docx files in parallel across processes. Results keep input order."""
+    if len(filepaths) <= 1:
+        return [load_docx_with_structure(p, output_image_dir) for p in filepaths]
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(load_docx_with_structure, filepaths, [output_image_dir] * len(filepaths)))
@@ -0,0 +1,169 @@
+import os
+import re
+from typing import List, Optional, Tuple
+import numpy as np
+
+# Width of stored embeddings. 0 keeps the model's own; a smaller width is requested from
+# the provider where the model supports it (output_dimensionality / dimensions) and
+# otherwise comes from a PCA fitted offline (python manage_index.py fit-pca).
+EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", 0))
+EMBEDDING_PCA_DIR = os.getenv("EMBEDDING_PCA_DIR", "embedding_pca")
+# Embeddings a PCA is fitted on
+PCA_FIT_SAMPLE = 20000
+FETCH_BATCH = 1000
+EMBED_BATCH = 64
+
+# Full output width per model family, for zero vectors returned when embedding fails
+NATIVE_DIMENSIONS = {
+    "gemini-embedding-001": 3072,
+    "text-embedding-004": 768,
+    "text-embedding-005": 768,
+    "text-embedding-3-large": 3072,
+    "text-embedding-3-small": 1536,
+    "text-embedding-ada-002": 1536,
+}
+# Models trained to be cut to fewer dimensions (Matryoshka), which the APIs do server-side
+_REDUCIBLE = ("gemini-embedding", "text-embedding-004", "text-embedding-005", "text-embedding-3")
+
+
+def native_dimension(embedding_model: str) -> Optional[int]:
+    for name, dimension in NATIVE_DIMENSIONS.items():
+        if name in str(embedding_model):
+            return dimension
+    return None
+
+
+def supports_output_dimension(embedding_model: str) -> bool:
+    """Whether the provider can return this model's embeddings at a smaller width."""
+    return any(name in str(embedding_model) for name in _REDUCIBLE)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Unit-length rows; zero rows (failed embeddings) stay zero."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+def pca_path(embedding_model: str, dimension: int, directory: str = EMBEDDING_PCA_DIR) -> str:
+    slug = re.sub(r'[^a-zA-Z0-9._-]+', '-', str(embedding_model)).strip('-._')
+    return os.path.join(directory, f"{slug}_{dimension}.npz")
+
+
+class PCAProjection:
+    """Linear projection onto the top principal components of a sample of full-width embeddings."""
+    def __init__(self, mean: np.ndarray, components: np.ndarray):
+        self.mean = mean.astype(np.float32)
+        self.components = components.astype(np.float32)
+
+    @property
+    def dimension(self) -> int:
+        return self.components.shape[0]
+
+    @classmethod
+    def fit(cls, vectors: np.ndarray, dimension: int) -> "PCAProjection":
+        vectors = np.asarray(vectors, dtype=np.float32)
+        vectors = vectors[np.linalg.norm(vectors, axis=1) > 0]
+        if dimension >= min(vectors.shape):
+            raise ValueError(f"A {dimension}-dimension PCA needs more than {dimension} non-zero embeddings "
+                             f"of more than {dimension} dimensions (have {vectors.shape[0]} x {vectors.shape[1]})")
+        mean = vectors.mean(axis=0)
+        # Right singular vectors of the centred sample are the principal axes, strongest first
+        _, s, vt = np.linalg.svd(vectors - mean, full_matrices=False)
+        projection = cls(mean, vt[:dimension])
+        projection.explained_variance = float((s[:dimension] ** 2).sum() / (s ** 2).sum())
+        return projection
+
+    def apply(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        projected = (vectors - self.mean) @ self.components.T
+        projected[~vectors.any(axis=1)] = 0.0
+        return normalize(projected)
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # np.savez appends .npz to names without it
+        tmp_path = path[:-len(".npz")] + ".tmp.npz"
+        np.savez(tmp_path, mean=self.mean, components=self.components)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "PCAProjection":
+        with np.load(path) as data:
+            return cls(data["mean"], data["components"])
+
+
+def sample_embeddings(vector_store, count: int, seed: int = 0) -> Tuple[np.ndarray, List[str], int]:
+    """Stored embeddings of up to count random chunks of the serving index: (vectors, ids, chunks in the index)."""
+    rng = np.random.default_rng(seed)
+    ids = vector_store.get_chunks(include=[])["ids"]
+    picked = [ids[i] for i in rng.permutation(len(ids))[:count]]
+    vectors, found = [], []
+    for start in range(0, len(picked), FETCH_BATCH):
+        batch = vector_store.get_chunks(ids=picked[start:start + FETCH_BATCH], include=["embeddings"])
+        vectors.extend(batch["embeddings"])
+        found.extend(batch["ids"])
+    return np.asarray(vectors, dtype=np.float32), found, len(ids)
+
+
+def fit_pca(vector_store, dimension: int, sample: int = PCA_FIT_SAMPLE) -> Optional[str]:
+    """
+    Fits the configured model's PCA to `dimension` on a sample of the corpus: the stored
+    embeddings when the serving index is that model at full width, else the sampled
+    chunks embedded again. Returns the path written (None if the model needs no PCA).
+    """
+    model = vector_store.configured_embedding_model
+    if supports_output_dimension(model):
+        print(f"[PCA] {model} returns {dimension}-dimension embeddings itself. No PCA needed.")
+        return None
+    vectors, ids, _ = sample_embeddings(vector_store, sample)
+    if not ids:
+        raise ValueError("Nothing is indexed to fit a PCA on")
+    if vector_store.embedding_model != model or vectors.shape[1] <= dimension:
+        from .llm import get_llm
+        llm = get_llm()
+        documents = vector_store.get_chunks(ids=ids, include=["documents"])["documents"]
+        print(f"[PCA] Embedding {len(documents)} sampled chunks with {model}...")
+        vectors = np.asarray([v for i in range(0, len(documents), EMBED_BATCH)
+                              for v in llm.get_embedding(documents[i:i + EMBED_BATCH])], dtype=np.float32)
+    projection = PCAProjection.fit(vectors, dimension)
+    path = pca_path(model, dimension)
+    projection.save(path)
+    print(f"[PCA] {model}: {vectors.shape[1]} -> {dimension} dims on {len(vectors)} embeddings, "
+          f"{projection.explained_variance:.1%} of the variance kept. Saved {path}.")
+    return path
+
+
+class EmbeddingReducer:
+    """
+    Brings provider embeddings to the store's dimension: wider vectors go through the
+    model's fitted PCA, vectors the provider already cut (or a PCA produced) are
+    renormalised. Without a target dimension, or at the model's full width, vectors
+    pass through as returned.
+    """
+    def __init__(self, embedding_model: str, dimension: Optional[int] = None):
+        self.embedding_model = embedding_model
+        self.dimension = dimension or None
+        self._projection = None
+
+    def configure(self, embedding_model: str, dimension: Optional[int]):
+        if (embedding_model, dimension or None) != (self.embedding_model, self.dimension):
+            self.embedding_model, self.dimension, self._projection = embedding_model, dimension or None, None
+
+    def projection(self) -> PCAProjection:
+        if self._projection is None:
+            path = pca_path(self.embedding_model, self.dimension)
+            if not os.path.exists(path):
+                raise ValueError(f"{self.embedding_model} cannot return {self.dimension}-dimension embeddings and no "
+                                 f"PCA is fitted for it: run `python manage_index.py fit-pca --dimension {self.dimension}`")
+            self._projection = PCAProjection.load(path)
+        return self._projection
+
+    def __call__(self, embeddings: List[List[float]]) -> List[List[float]]:
+        if not self.dimension or not len(embeddings):
+            return embeddings
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.shape[1] > self.dimension:
+            return self.projection().apply(vectors).tolist()
+        if vectors.shape[1] == native_dimension(self.embedding_model):
+            return embeddings
+        return normalize(vectors).tolist()
@@ -0,0 +1,41 @@
+import hashlib
+import os
+import aiofiles
+
+# Size of each block read from the upload and written to disk
+UPLOAD_BLOCK_SIZE = int(os.getenv("UPLOAD_BLOCK_SIZE", 1024 * 1024))
+
+
+async def stream_upload_to_disk(upload, dest_path: str, block_size: int = UPLOAD_BLOCK_SIZE) -> tuple[str, int]:
+    """
+    Streams an UploadFile to disk in fixed-size blocks without blocking the event loop.
+    The SHA-256 of the content is computed as the bytes pass through.
+    Returns (hex digest, size in bytes).
+    """
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(dest_path, "wb") as out:
+            while True:
+                block = await upload.read(block_size)
+                if not block:
+                    break
+                digest.update(block)
+                size += len(block)
+                await out.write(block)
+    except Exception:
+        # Never leave a truncated file behind
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        raise
+    return digest.hexdigest(), size
+
+
+
+def hash_file(filepath: str, block_size: int = UPLOAD_BLOCK_SIZE) -> str:
+    """Computes the SHA-256 of a file already on disk."""
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
@@ -1,19 +1,142 @@
 import os
+import asyncio
 import base64
+import json
 import mimetypes
+import threading
+import time
+from typing import List, Optional, Tuple
 import google.generativeai as genai
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from dotenv import load_dotenv
 import PIL.Image
+from .description_cache import DescriptionCache, DESCRIPTION_CACHE_ENABLED
 
 load_dotenv()
 
+# Images sent in one vision request (1 disables batching)
+VISION_BATCH_SIZE = int(os.getenv("VISION_BATCH_SIZE", 4))
+# Vision requests in flight at once, across all documents
+VISION_CONCURRENCY = int(os.getenv("VISION_CONCURRENCY", 4))
+# How long a partly filled batch waits for more images before it is sent
+VISION_BATCH_WAIT_MS = float(os.getenv("VISION_BATCH_WAIT_MS", 50))
+# USD per million (input, output) tokens, for the per-image cost estimate.
+# VISION_TOKEN_PRICES="<input>,<output>" overrides them for every provider.
+VISION_TOKEN_PRICES = {"gemini": (0.075, 0.30), "openai": (0.15, 0.60)}
+if os.getenv("VISION_TOKEN_PRICES"):
+    _prices = tuple(float(v) for v in os.getenv("VISION_TOKEN_PRICES").split(","))
+    VISION_TOKEN_PRICES = {provider: _prices for provider in VISION_TOKEN_PRICES}
+
+GEMINI_PROMPT = (
+    "Analyze this image for a RAG knowledge base. "
+    "Describe the visual content in detail. "
+    "If it contains text, charts, or steps, transcribe and explain them clearly."
+)
+OPENAI_PROMPT = "Describe this image in detail for a technical knowledge base. Extract text, data points, and explain workflows if present."
+BATCH_PROMPT = (
+    "You are given {count} images for a technical knowledge base, in order. "
+    "Describe each one in detail: transcribe any text, data points or steps and explain workflows if present. "
+    'Answer with JSON only, in the form {{"descriptions": ["<image 1>", ..., "<image {count}>"]}}: '
+    "exactly one description string per image, in the same order."
+)
+
+
+def _parse_batch_answer(text: str, count: int) -> Optional[List[str]]:
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        return None
+    items = data.get("descriptions") if isinstance(data, dict) else data
+    if not isinstance(items, list) or len(items) != count:
+        return None
+    if not all(isinstance(item, str) and item.strip() for item in items):
+        return None
+    return [item.strip() for item in items]
+
+
+def _load_images(paths: List[str]) -> List[PIL.Image.Image]:
+    """Decoded in-memory copies, so no file handle stays open while the request is in flight."""
+    images = []
+    for path in paths:
+        with PIL.Image.open(path) as img:
+            images.append(img.copy())
+    return images
+
+
+class VisionMetrics:
+    """Vision throughput and token cost. Throughput only counts time with a request in flight."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.images = 0
+        self.requests = 0
+        self.failed_requests = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cost_usd = 0.0
+        self.busy_s = 0.0
+        self._in_flight = 0
+        self._busy_since = 0.0
+
+    def start(self):
+        with self._lock:
+            if self._in_flight == 0:
+                self._busy_since = time.perf_counter()
+            self._in_flight += 1
+
+    def stop(self):
+        with self._lock:
+            self._in_flight -= 1
+            if self._in_flight == 0:
+                self.busy_s += time.perf_counter() - self._busy_since
+
+    def request(self, provider: str, input_tokens: int, output_tokens: int, ok: bool = True):
+        input_price, output_price = VISION_TOKEN_PRICES.get(provider, (0.0, 0.0))
+        with self._lock:
+            self.requests += 1
+            self.failed_requests += 0 if ok else 1
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+            self.cost_usd += (input_tokens * input_price + output_tokens * output_price) / 1e6
+
+    def described(self, count: int):
+        with self._lock:
+            self.images += count
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            busy_s = self.busy_s + (time.perf_counter() - self._busy_since if self._in_flight else 0.0)
+            return {
+                "images": self.images,
+                "requests": self.requests,
+                "failed_requests": self.failed_requests,
+                "images_per_request": round(self.images / self.requests, 2) if self.requests else 0.0,
+                "images_per_min": round(self.images / busy_s * 60, 2) if busy_s > 0 else 0.0,
+                "input_tokens": self.input_tokens,
+                "output_tokens": self.output_tokens,
+                "cost_usd": round(self.cost_usd, 6),
+                "cost_per_image_usd": round(self.cost_usd / self.images, 6) if self.images else 0.0
+            }
+
+
+class _AsyncVisionState:
+    """Semaphore, pending batch and pooled async client belong to one event loop."""
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.slots = asyncio.Semaphore(VISION_CONCURRENCY)
+        self.pending = []
+        self.flush_handle = None
+        self.tasks = set()
+        # Image hashes being described right now
+        self.in_progress = {}
+        self.openai_client = None
+
+
 class ImageProcessor:
     def __init__(self):
         self.active_provider = os.getenv("ACTIVE_LLM_PROVIDER", "auto").lower()
         self.gemini_key = os.getenv("GEMINI_API_KEY")
         self.openai_key = os.getenv("OPENAI_API_KEY")
-        
+
         # Initialize Gemini
         self.gemini_model = None
         if self.gemini_key:
@@ -34,20 +157,50 @@ class ImageProcessor:
             except Exception as e:
                 print(f"Failed to initialize OpenAI for images: {e}")
 
+        # Descriptions survive re-uploads and re-indexing; vision calls only for unseen images
+        self.cache = DescriptionCache(storage_path="image_descriptions.json") if DESCRIPTION_CACHE_ENABLED else None
+        self._key_locks = {}
+        self._key_locks_guard = threading.Lock()
+        self.metrics = VisionMetrics()
+        self._async = None
+
     def _encode_image(self, image_path):
         with open(image_path, "rb") as image_file:
             return base64.b64encode(image_file.read()).decode('utf-8')
 
+    def _key_lock(self, sha: str) -> threading.Lock:
+        with self._key_locks_guard:
+            return self._key_locks.setdefault(sha, threading.Lock())
+
     def generate_description(self, image_path: str) -> str:
         """
-        Generates a description using the active provider.
+        Generates a description, served from the description cache when this image
+        (or a visually identical one) was described before.
         """
         if not os.path.exists(image_path):
             return f"Image not found at {image_path}"
+        if self.cache is None:
+            return self._generate_uncached(image_path)[0]
+
+        sha, phash, size = self.cache.fingerprint(image_path)
+        # The same screenshot described concurrently is only sent to the model once
+        with self._key_lock(sha):
+            cached = self.cache.lookup(sha, phash, size, image_path)
+            if cached is not None:
+                return cached
+            description, ok = self._generate_uncached(image_path)
+            if ok:
+                self.cache.put(sha, description, phash, size, image_path)
+            return description
 
+    def _generate_uncached(self, image_path: str) -> tuple[str, bool]:
+        """
+        Generates a description using the active provider.
+        Returns (text, True) for a model description, (message, False) when none could be made.
+        """
         # Determine provider priority
         provider = self.active_provider
-        
+
         # If auto, prefer OpenAI if available (often robust for vision), else Gemini
         if provider == "auto":
             if self.gemini_model:
@@ -57,38 +210,33 @@ class ImageProcessor:
                 provider = "openai"
                 print("ImageProcessor: Auto-selecting OpenAI (Fallback)")
             else:
-                return "No AI provider configured for image processing."
-        
+                return "No AI provider configured for image processing.", False
+
         # Execute based on priority: Gemini -> OpenAI
         if provider == "gemini" or (provider == "auto" and self.gemini_model):
             try:
-                return self._process_gemini(image_path)
+                return self._process_gemini(image_path), True
             except Exception as e:
                 print(f"Gemini processing failed: {e}. Trying OpenAI fallback...")
                 if self.openai_client:
-                    return self._process_openai(image_path)
-                return f"Gemini failed and no OpenAI fallback: {str(e)}"
-        
+                    return self._process_openai(image_path), True
+                return f"Gemini failed and no OpenAI fallback: {str(e)}", False
+
         elif provider == "openai" or (provider == "auto" and self.openai_client):
             try:
-                return self._process_openai(image_path)
+                return self._process_openai(image_path), True
             except Exception as e:
                  print(f"OpenAI processing failed: {e}. Trying Gemini (if available)...")
                  if self.gemini_model:
-                     return self._process_gemini(image_path)
-                 return f"OpenAI failed: {str(e)}"
+                     return self._process_gemini(image_path), True
+                 return f"OpenAI failed: {str(e)}", False
 
-        return "Image processing unavailable (Check API keys)."
+        return "Image processing unavailable (Check API keys).", False
 
     def _process_gemini(self, image_path):
         try:
-            img = PIL.Image.open(image_path)
-            prompt = (
-                "Analyze this image for a RAG knowledge base. "
-                "Describe the visual content in detail. "
-                "If it contains text, charts, or steps, transcribe and explain them clearly."
-            )
-            response = self.gemini_model.generate_content([prompt, img])
+            with PIL.Image.open(image_path) as img:
+                response = self.gemini_model.generate_content([GEMINI_PROMPT, img])
             return response.text.strip() if response and response.text else "No description."
         except Exception as e:
              raise RuntimeError(f"Gemini processing failed: {e}")
@@ -96,25 +244,23 @@ class ImageProcessor:
     def _process_openai(self, image_path):
         try:
             base64_image = self._encode_image(image_path)
-            
+
             # Simple mimetype guess
             mime_type, _ = mimetypes.guess_type(image_path)
             if not mime_type: mime_type = "image/jpeg"
-            
-            prompt = "Describe this image in detail for a technical knowledge base. Extract text, data points, and explain workflows if present."
-            
+
             response = self.openai_client.chat.completions.create(
                 model=self.openai_model,
                 messages=[
                     {
                         "role": "user",
                         "content": [
-                            {"type": "text", "text": prompt},
+                            {"type": "text", "text": OPENAI_PROMPT},
                             {
                                 "type": "image_url",
                                 "image_url": {
                                     "url": f"data:{mime_type};base64,{base64_image}",
-                                    "detail": "auto" 
+                                    "detail": "auto"
                                 }
                             },
                         ],
@@ -126,14 +272,160 @@ class ImageProcessor:
         except Exception as e:
             raise RuntimeError(f"OpenAI processing failed: {e}")
 
+    def _providers(self) -> List[str]:
+        """Available providers in the order they are tried (Gemini first unless OpenAI is chosen)."""
+        order = ["openai", "gemini"] if self.active_provider == "openai" else ["gemini", "openai"]
+        available = {"gemini": self.gemini_model is not None, "openai": self.openai_client is not None}
+        return [provider for provider in order if available[provider]]
+
+    def _async_state(self) -> _AsyncVisionState:
+        loop = asyncio.get_running_loop()
+        if self._async is None or self._async.loop is not loop:
+            self._async = _AsyncVisionState(loop)
+        return self._async
 
     async def generate_description_async(self, image_path: str) -> str:
         """
-        Generates a description using the active provider asynchronously
-        by offloading the blocking call to a thread.
+        Async-native description: cache first, then a batched vision request.
+        Images requested around the same time share multi-image requests, and at most
+        VISION_CONCURRENCY requests are in flight.
         """
-        import asyncio
-        return await asyncio.to_thread(self.generate_description, image_path)
+        if not os.path.exists(image_path):
+            return f"Image not found at {image_path}"
+        state = self._async_state()
+        if self.cache is None:
+            return (await self._describe_batched(state, image_path))[0]
+
+        sha, phash, size = await asyncio.to_thread(self.cache.fingerprint, image_path)
+        # The same screenshot requested concurrently is only sent to the model once
+        while sha in state.in_progress:
+            await state.in_progress[sha].wait()
+        done = state.in_progress[sha] = asyncio.Event()
+        try:
+            cached = await asyncio.to_thread(self.cache.lookup, sha, phash, size, image_path)
+            if cached is not None:
+                return cached
+            description, ok = await self._describe_batched(state, image_path)
+            if ok:
+                await asyncio.to_thread(self.cache.put, sha, description, phash, size, image_path)
+            return description
+        finally:
+            del state.in_progress[sha]
+            done.set()
+
+    async def _describe_batched(self, state: _AsyncVisionState, image_path: str) -> Tuple[str, bool]:
+        future = state.loop.create_future()
+        state.pending.append((image_path, future))
+        if len(state.pending) >= VISION_BATCH_SIZE:
+            self._flush(state)
+        elif state.flush_handle is None:
+            state.flush_handle = state.loop.call_later(VISION_BATCH_WAIT_MS / 1000, self._flush, state)
+        return await future
+
+    def _flush(self, state: _AsyncVisionState):
+        if state.flush_handle is not None:
+            state.flush_handle.cancel()
+            state.flush_handle = None
+        batch, state.pending = state.pending, []
+        if batch:
+            task = state.loop.create_task(self._run_batch(state, batch))
+            state.tasks.add(task)
+            task.add_done_callback(state.tasks.discard)
+
+    async def _run_batch(self, state: _AsyncVisionState, batch: list):
+        paths = [path for path, _ in batch]
+        try:
+            results = await self._describe_many(state, paths)
+        except Exception as e:
+            results = [(f"Image description failed: {e}", False)] * len(paths)
+        except BaseException:
+            for _, future in batch:
+                future.cancel()
+            raise
+        self.metrics.described(sum(1 for _, ok in results if ok))
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def _describe_many(self, state: _AsyncVisionState, paths: List[str]) -> List[Tuple[str, bool]]:
+        """One (text, ok) per image; the whole batch moves to the next provider on failure."""
+        providers = self._providers()
+        if not providers:
+            return [("No AI provider configured for image processing.", False)] * len(paths)
+        error = None
+        for provider in providers:
+            try:
+                return [(text, True) for text in await self._describe_with(provider, state, paths)]
+            except Exception as e:
+                error = e
+                print(f"[Vision] {provider} failed for {len(paths)} images: {e}")
+        return [(f"Image description failed: {error}", False)] * len(paths)
+
+    async def _describe_with(self, provider: str, state: _AsyncVisionState, paths: List[str]) -> List[str]:
+        if len(paths) == 1:
+            prompt = GEMINI_PROMPT if provider == "gemini" else OPENAI_PROMPT
+            text = await self._request(provider, state, prompt, paths, json_answer=False)
+            return [text or "No description."]
+
+        text = await self._request(provider, state, BATCH_PROMPT.format(count=len(paths)), paths, json_answer=True)
+        descriptions = _parse_batch_answer(text, len(paths))
+        if descriptions is None:
+            # The model lost count or broke the JSON: fall back to one image per request, each taking its own slot
+            print(f"[Vision] {provider} answer did not match {len(paths)} images. Describing them one by one...")
+            answers = await asyncio.gather(*(self._describe_with(provider, state, [path]) for path in paths),
+                                           return_exceptions=True)
+            for answer in answers:
+                if isinstance(answer, BaseException):
+                    raise answer
+            descriptions = [answer[0] for answer in answers]
+        return descriptions
+
+    async def _request(self, provider: str, state: _AsyncVisionState, prompt: str, paths: List[str],
+                       json_answer: bool) -> str:
+        # One slot per request, held only while it is in flight
+        async with state.slots:
+            self.metrics.start()
+            try:
+                if provider == "gemini":
+                    text, usage = await self._request_gemini(prompt, paths, json_answer)
+                else:
+                    text, usage = await self._request_openai(state, prompt, paths, json_answer)
+            except Exception:
+                self.metrics.request(provider, 0, 0, ok=False)
+                raise
+            finally:
+                self.metrics.stop()
+        self.metrics.request(provider, *usage)
+        return text
+
+    async def _request_gemini(self, prompt: str, paths: List[str], json_answer: bool) -> Tuple[str, Tuple[int, int]]:
+        images = await asyncio.to_thread(_load_images, paths)
+        config = {"response_mime_type": "application/json"} if json_answer else None
+        response = await self.gemini_model.generate_content_async([prompt, *images], generation_config=config)
+        usage = getattr(response, "usage_metadata", None)
+        text = response.text.strip() if response and response.text else ""
+        return text, (getattr(usage, "prompt_token_count", 0) or 0, getattr(usage, "candidates_token_count", 0) or 0)
+
+    async def _request_openai(self, state: _AsyncVisionState, prompt: str, paths: List[str],
+                              json_answer: bool) -> Tuple[str, Tuple[int, int]]:
+        if state.openai_client is None:
+            # One client per loop: its connection pool is reused by every request
+            state.openai_client = AsyncOpenAI(api_key=self.openai_key)
+        content = [{"type": "text", "text": prompt}]
+        for path in paths:
+            encoded = await asyncio.to_thread(self._encode_image, path)
+            mime_type = mimetypes.guess_type(path)[0] or "image/jpeg"
+            content.append({"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{encoded}", "detail": "auto"}})
+        extra = {"response_format": {"type": "json_object"}} if json_answer else {}
+        response = await state.openai_client.chat.completions.create(
+            model=self.openai_model,
+            messages=[{"role": "user", "content": content}],
+            max_tokens=600 * len(paths),
+            **extra
+        )
+        usage = response.usage
+        text = (response.choices[0].message.content or "").strip()
+        return text, (usage.prompt_tokens if usage else 0, usage.completion_tokens if usage else 0)
 
 # Singleton instance
 image_processor = ImageProcessor()
@@ -0,0 +1,283 @@
+import hashlib
+import os
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import BinaryIO, Iterable, List, Optional, Tuple
+import PIL.Image
+
+IMAGE_URL_PREFIX = "/static/images/"
+# Content-addressed names never change content, so clients may cache them forever
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Unreferenced images younger than this may belong to an ingestion that is still running
+IMAGE_GC_GRACE_SECONDS = 3600
+
+# Renditions written next to each original: a downscaled copy sent to LLMs and a UI thumbnail
+IMAGE_LLM_MAX_EDGE = int(os.getenv("IMAGE_LLM_MAX_EDGE", 1024))
+IMAGE_THUMB_MAX_EDGE = int(os.getenv("IMAGE_THUMB_MAX_EDGE", 256))
+IMAGE_RENDITION_QUALITY = int(os.getenv("IMAGE_RENDITION_QUALITY", 80))
+# webp or jpeg
+IMAGE_RENDITION_FORMAT = os.getenv("IMAGE_RENDITION_FORMAT", "webp").lower()
+RENDITION_EXT = "jpg" if IMAGE_RENDITION_FORMAT in ("jpg", "jpeg") else "webp"
+RENDITION_MAX_EDGES = {"llm": IMAGE_LLM_MAX_EDGE, "thumb": IMAGE_THUMB_MAX_EDGE}
+
+MIME_TYPES = {".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".webp": "image/webp", ".gif": "image/gif"}
+
+CONTENT_NAME_PATTERN = re.compile(r'^[0-9a-f]{64}(\.(?:llm|thumb))?\.[a-z0-9]+$')
+IMAGE_REF_PATTERN = re.compile(r'!\[[^\]]*\]\(' + re.escape(IMAGE_URL_PREFIX) + r'([^)]+)\)')
+
+COPY_BLOCK_SIZE = 1024 * 1024
+
+
+def is_content_addressed(name: str) -> bool:
+    return bool(CONTENT_NAME_PATTERN.match(name))
+
+
+def image_refs(text: str) -> List[str]:
+    """Image file names referenced by markdown images in text."""
+    return IMAGE_REF_PATTERN.findall(text)
+
+
+def join_image_refs(names: Iterable[str]) -> str:
+    """Chunk metadata holds scalars only: image names are stored newline-separated, first use first."""
+    return "\n".join(dict.fromkeys(names))
+
+
+def split_image_refs(value: Optional[str]) -> List[str]:
+    return [name for name in (value or "").split("\n") if name]
+
+
+def rendition_name(name: str, kind: str, ext: str = RENDITION_EXT) -> str:
+    """<stem>.llm.webp / <stem>.thumb.webp for an original <stem>.<ext>."""
+    return f"{os.path.splitext(name)[0]}.{kind}.{ext}"
+
+
+def mime_type(name: str) -> str:
+    return MIME_TYPES.get(os.path.splitext(name)[1].lower(), "image/png")
+
+
+def _write_rendition(img: PIL.Image.Image, max_edge: int, dest_path: str):
+    copy = img.copy()
+    copy.thumbnail((max_edge, max_edge), PIL.Image.LANCZOS)
+    if RENDITION_EXT == "jpg" or copy.mode not in ("RGB", "RGBA"):
+        has_alpha = copy.mode in ("RGBA", "LA") or (copy.mode == "P" and "transparency" in copy.info)
+        copy = copy.convert("RGBA" if has_alpha else "RGB")
+    if RENDITION_EXT == "jpg" and copy.mode == "RGBA":
+        # Screenshots with transparency go on white, like a viewer would show them
+        background = PIL.Image.new("RGB", copy.size, "white")
+        background.paste(copy, mask=copy.getchannel("A"))
+        copy = background
+    # Temp name the garbage collector recognises if a crash leaves it behind
+    tmp_path = os.path.join(os.path.dirname(dest_path), f".incoming_{uuid.uuid4()}")
+    try:
+        if RENDITION_EXT == "jpg":
+            copy.save(tmp_path, "JPEG", quality=IMAGE_RENDITION_QUALITY, optimize=True, progressive=True)
+        else:
+            copy.save(tmp_path, "WEBP", quality=IMAGE_RENDITION_QUALITY, method=4)
+        os.replace(tmp_path, dest_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class AttachmentMetrics:
+    """Bytes of document images attached to LLM requests, against what the originals would have cost."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.images = 0
+        self.original_bytes = 0
+        self.sent_bytes = 0
+
+    def record(self, images: int, original_bytes: int, sent_bytes: int):
+        with self._lock:
+            self.requests += 1
+            self.images += images
+            self.original_bytes += original_bytes
+            self.sent_bytes += sent_bytes
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            saved = self.original_bytes - self.sent_bytes
+            return {
+                "requests": self.requests,
+                "images": self.images,
+                "original_bytes": self.original_bytes,
+                "sent_bytes": self.sent_bytes,
+                "bytes_saved": saved,
+                "bytes_saved_per_request": round(saved / self.requests) if self.requests else 0
+            }
+
+
+attachment_metrics = AttachmentMetrics()
+
+
+class ImageStore:
+    """
+    Content-addressed store for images extracted from documents.
+    Each image is saved once as <sha256>.<ext>, however many documents or versions
+    embed it. Documents reference images through their catalog entry ('images'), and
+    an image (with its renditions) is deleted when no catalog entry references it any
+    more. Renditions are written at ingest; older images get them on first use.
+    """
+    def __init__(self, images_dir: str, catalog=None):
+        self.images_dir = images_dir
+        self.catalog = catalog
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.images_dir, name)
+
+    def put_stream(self, src: BinaryIO, ext: str) -> str:
+        """Stores the bytes read from src and returns the content-addressed file name."""
+        ext = (ext or "").lower().lstrip(".") or "bin"
+        os.makedirs(self.images_dir, exist_ok=True)
+        tmp_path = self.path(f".incoming_{uuid.uuid4()}")
+        digest = hashlib.sha256()
+        try:
+            with open(tmp_path, "wb") as dest:
+                while True:
+                    block = src.read(COPY_BLOCK_SIZE)
+                    if not block:
+                        break
+                    digest.update(block)
+                    dest.write(block)
+            name = f"{digest.hexdigest()}.{ext}"
+            try:
+                # Already stored by another document (or version): refresh its mtime so release()
+                # and the garbage collector see it as in use until this ingestion is recorded
+                os.utime(self.path(name))
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                os.replace(tmp_path, self.path(name))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.make_renditions(name)
+        return name
+
+    def put_file(self, filepath: str) -> str:
+        with open(filepath, "rb") as src:
+            return self.put_stream(src, os.path.splitext(filepath)[1])
+
+    def make_renditions(self, name: str) -> dict:
+        """Writes the missing renditions of an image. Returns kind -> rendition name for those that exist."""
+        targets = {kind: rendition_name(name, kind) for kind in RENDITION_MAX_EDGES}
+        missing = [kind for kind, target in targets.items() if not os.path.exists(self.path(target))]
+        if missing:
+            try:
+                with PIL.Image.open(self.path(name)) as img:
+                    img.load()
+                    for kind in missing:
+                        _write_rendition(img, RENDITION_MAX_EDGES[kind], self.path(targets[kind]))
+            except Exception as e:
+                # Not a raster image Pillow can read (e.g. EMF): the original is used as is
+                print(f"[ImageStore] No renditions for {name}: {e}")
+        return {kind: target for kind, target in targets.items() if os.path.exists(self.path(target))}
+
+    def attachment(self, name: str) -> Optional[Tuple[str, str, int]]:
+        """
+        Picks the file to send to an LLM for an image: its LLM rendition, unless the
+        original is already smaller. Returns (path, mime type, original size in bytes).
+        """
+        path = self.path(name)
+        if not os.path.exists(path):
+            return None
+        original_bytes = os.path.getsize(path)
+        rendition = self.make_renditions(name).get("llm")
+        if rendition and os.path.getsize(self.path(rendition)) < original_bytes:
+            return self.path(rendition), mime_type(rendition), original_bytes
+        return path, mime_type(name), original_bytes
+
+    def _remove(self, name: str) -> bool:
+        try:
+            os.remove(self.path(name))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def refcounts(self) -> Counter:
+        counts = Counter()
+        if self.catalog is not None:
+            for entry in self.catalog.list_documents():
+                counts.update(set(entry.get("images") or ()))
+        return counts
+
+    def release(self, names: Iterable[str], grace_seconds: float = IMAGE_GC_GRACE_SECONDS) -> int:
+        """
+        Deletes the given images that no catalog entry references any more. Like
+        collect_garbage, images stored or reused within grace_seconds are left for a
+        later sweep: an ingestion in progress may point at them without a catalog entry yet.
+        """
+        names = {n for n in names if is_content_addressed(n)}
+        if not names:
+            return 0
+        counts = self.refcounts()
+        cutoff = time.time() - grace_seconds
+        removed = 0
+        for name in names:
+            if counts[name]:
+                continue
+            try:
+                if os.path.getmtime(self.path(name)) >= cutoff:
+                    continue
+            except FileNotFoundError:
+                pass
+            try:
+                removed += self._remove(name)
+                for kind in RENDITION_MAX_EDGES:
+                    for ext in ("webp", "jpg"):
+                        self._remove(rendition_name(name, kind, ext))
+            except Exception as e:
+                print(f"[ImageStore] Error deleting image {name}: {e}")
+        if removed:
+            print(f"[ImageStore] Released {removed} unreferenced images.")
+        return removed
+
+    def collect_garbage(self, grace_seconds: float = IMAGE_GC_GRACE_SECONDS) -> int:
+        """
+        Full sweep: deletes content-addressed images no catalog entry references and
+        leftover temp files. Files newer than grace_seconds are left alone because an
+        ingestion in progress has written them but not recorded its catalog entry yet.
+        """
+        if not os.path.exists(self.images_dir):
+            return 0
+        # Renditions live as long as their original: compare by hash
+        referenced = {name.split(".", 1)[0] for name in self.refcounts()}
+        cutoff = time.time() - grace_seconds
+        removed = 0
+        for name in os.listdir(self.images_dir):
+            if not (is_content_addressed(name) or name.startswith(".incoming_")):
+                continue
+            if name.split(".", 1)[0] in referenced:
+                continue
+            path = self.path(name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except Exception as e:
+                print(f"[ImageStore] Error deleting image {name}: {e}")
+        return removed
+
+    def get_stats(self) -> dict:
+        counts = self.refcounts()
+        stored, size, rendition_size = 0, 0, 0
+        if os.path.exists(self.images_dir):
+            for name in os.listdir(self.images_dir):
+                if not is_content_addressed(name):
+                    continue
+                if name.count(".") > 1:
+                    rendition_size += os.path.getsize(self.path(name))
+                else:
+                    stored += 1
+                    size += os.path.getsize(self.path(name))
+        return {
+            "stored_images": stored,
+            "stored_bytes": size,
+            "rendition_bytes": rendition_size,
+            # References beyond the first are copies that no longer take disk space
+            "deduplicated_references": sum(counts.values()) - len(counts)
+        }
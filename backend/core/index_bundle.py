@@ -0,0 +1,265 @@
+import io
+import json
+import os
+import time
+import zipfile
+from typing import Dict, Iterator, List, Tuple
+import numpy as np
+from .dedup import CorpusDedupIndex
+from .description_cache import DescriptionCache
+from .ingestion import IMAGES_DIR
+from .vector_store import VectorStore
+
+BUNDLE_FORMAT = 1
+# Rows per shard: a shard is the unit read into memory on export and restore
+BUNDLE_SHARD_ROWS = int(os.getenv("BUNDLE_SHARD_ROWS", 10000))
+# Vector storage in the bundle: float32 is exact, float16 halves it, int8 (per-row scale) quarters it
+BUNDLE_PRECISION = os.getenv("BUNDLE_PRECISION", "float16")
+BUNDLE_PRECISIONS = ("float32", "float16", "int8")
+# Rows per Chroma write on restore (capped by the client's own maximum batch size)
+BUNDLE_IMPORT_BATCH = int(os.getenv("BUNDLE_IMPORT_BATCH", 5000))
+
+# Image description cache restored next to the index
+DESCRIPTIONS_PATH = "image_descriptions.json"
+
+
+def quantize(embeddings: np.ndarray, precision: str) -> Dict[str, np.ndarray]:
+    if precision == "float32":
+        return {"vectors": embeddings.astype(np.float32)}
+    if precision == "float16":
+        return {"vectors": embeddings.astype(np.float16)}
+    if precision == "int8":
+        scales = np.abs(embeddings).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        vectors = np.rint(embeddings / scales[:, None]).astype(np.int8)
+        return {"vectors": vectors, "scales": scales.astype(np.float32)}
+    raise ValueError(f"Unknown bundle precision '{precision}' (use one of {', '.join(BUNDLE_PRECISIONS)})")
+
+
+def dequantize(arrays, precision: str) -> np.ndarray:
+    vectors = arrays["vectors"].astype(np.float32)
+    if precision == "int8":
+        vectors *= arrays["scales"][:, None]
+    return vectors
+
+
+def pack_strings(values: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Variable-length strings as one UTF-8 buffer plus end offsets (columnar, no per-row padding)."""
+    encoded = [v.encode("utf-8") for v in values]
+    offsets = np.cumsum([len(e) for e in encoded], dtype=np.int64)
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def unpack_strings(buffer: np.ndarray, offsets: np.ndarray) -> List[str]:
+    data = buffer.tobytes()
+    starts = np.concatenate(([0], offsets[:-1]))
+    return [data[s:e].decode("utf-8") for s, e in zip(starts.tolist(), offsets.tolist())]
+
+
+def _npz_bytes(arrays: Dict[str, np.ndarray], compressed: bool) -> bytes:
+    buf = io.BytesIO()
+    (np.savez_compressed if compressed else np.savez)(buf, **arrays)
+    return buf.getvalue()
+
+
+def write_collections(zf: zipfile.ZipFile, collections: list, precision: str = BUNDLE_PRECISION,
+                      shard_rows: int = BUNDLE_SHARD_ROWS) -> Dict:
+    """
+    Writes every chunk of the collections (an index's partitions) as shards:
+    chunks/NNNNN.text.npz (ids, documents and JSON metadata, deflated) and
+    chunks/NNNNN.vectors.npz (stored as is, vectors don't compress).
+    Returns the chunk count, dimension and shard count.
+    """
+    written, dimension, shards = 0, None, 0
+    for collection in collections:
+        ids = collection.get(include=[])["ids"] or []
+        for start in range(0, len(ids), shard_rows):
+            rows = collection.get(ids=ids[start:start + shard_rows], include=["documents", "metadatas", "embeddings"])
+            if not rows["ids"]:
+                continue
+            embeddings = np.asarray(rows["embeddings"], dtype=np.float32)
+            dimension = embeddings.shape[1]
+            text = {}
+            text["ids"], text["id_offsets"] = pack_strings(rows["ids"])
+            text["documents"], text["document_offsets"] = pack_strings([d or "" for d in rows["documents"]])
+            text["metadatas"], text["metadata_offsets"] = pack_strings([json.dumps(m or {}) for m in rows["metadatas"]])
+            zf.writestr(f"chunks/{shards:05d}.text.npz", _npz_bytes(text, compressed=True), zipfile.ZIP_STORED)
+            zf.writestr(f"chunks/{shards:05d}.vectors.npz", _npz_bytes(quantize(embeddings, precision), compressed=False),
+                        zipfile.ZIP_STORED)
+            written += len(rows["ids"])
+            shards += 1
+    return {"chunks": written, "dimension": dimension, "shards": shards}
+
+
+def read_shards(zf: zipfile.ZipFile, manifest: Dict) -> Iterator[Tuple[List[str], List[str], List[dict], np.ndarray]]:
+    """Yields (ids, documents, metadatas, float32 embeddings) per shard."""
+    for shard in range(manifest["shards"]):
+        text = np.load(io.BytesIO(zf.read(f"chunks/{shard:05d}.text.npz")))
+        vectors = np.load(io.BytesIO(zf.read(f"chunks/{shard:05d}.vectors.npz")))
+        yield (
+            unpack_strings(text["ids"], text["id_offsets"]),
+            unpack_strings(text["documents"], text["document_offsets"]),
+            [json.loads(m) for m in unpack_strings(text["metadatas"], text["metadata_offsets"])],
+            dequantize(vectors, manifest["precision"])
+        )
+
+
+def load_chunks(zf: zipfile.ZipFile, manifest: Dict, add, batch_size: int = BUNDLE_IMPORT_BATCH) -> int:
+    """
+    Bulk-loads the bundle's chunks with their stored embeddings (no embedding calls)
+    through add(ids=, documents=, metadatas=, embeddings=): a Chroma collection's add,
+    or VectorStore.add_documents to route them to their partitions.
+    """
+    loaded = 0
+    for ids, documents, metadatas, embeddings in read_shards(zf, manifest):
+        for i in range(0, len(ids), batch_size):
+            add(
+                ids=ids[i:i + batch_size],
+                documents=documents[i:i + batch_size],
+                metadatas=metadatas[i:i + batch_size],
+                embeddings=embeddings[i:i + batch_size].tolist()
+            )
+        loaded += len(ids)
+    return loaded
+
+
+def _add_dir(zf: zipfile.ZipFile, directory: str, prefix: str, compress: int) -> int:
+    count = 0
+    if os.path.exists(directory):
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if name.startswith(".") or not os.path.isfile(path):
+                continue
+            zf.write(path, f"{prefix}/{name}", compress_type=compress)
+            count += 1
+    return count
+
+
+def _extract_dir(zf: zipfile.ZipFile, prefix: str, directory: str) -> int:
+    """Extracts prefix/* into directory; files already there are kept."""
+    os.makedirs(directory, exist_ok=True)
+    count = 0
+    for member in zf.namelist():
+        if not member.startswith(prefix + "/"):
+            continue
+        name = os.path.basename(member)
+        dest = os.path.join(directory, name)
+        if not name or os.path.exists(dest):
+            continue
+        tmp_path = os.path.join(directory, f".incoming_{name}")
+        with zf.open(member) as src, open(tmp_path, "wb") as out:
+            while True:
+                block = src.read(1024 * 1024)
+                if not block:
+                    break
+                out.write(block)
+        os.replace(tmp_path, dest)
+        count += 1
+    return count
+
+
+def export_bundle(vector_store, bundle_path: str, upload_dir: str = "uploads", images_dir: str = IMAGES_DIR,
+                  precision: str = BUNDLE_PRECISION) -> Dict:
+    """
+    Writes the serving index to one zip bundle: the collection's chunks with their
+    embeddings, the document catalog, the uploaded originals, the image store, the
+    parent sections of small-to-big chunks and the dedup / image description side files, so another node starts without a single
+    embedding or vision call. Returns the bundle manifest.
+    """
+    quantize(np.zeros((1, 1), dtype=np.float32), precision)
+    t0 = time.perf_counter()
+    tmp_path = bundle_path + ".tmp"
+    with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+        chunks = write_collections(zf, vector_store.physical_collections(), precision)
+        zf.writestr("catalog.json", json.dumps({e["source_id"]: e for e in vector_store.catalog.list_documents()}))
+        # The dedup snapshot plus its journal, as one snapshot
+        zf.writestr("dedup.json", vector_store.dedup_index.dumps())
+        if os.path.exists(DESCRIPTIONS_PATH) or os.path.exists(DESCRIPTIONS_PATH + ".journal"):
+            # Snapshot plus journal, as one snapshot
+            zf.writestr("descriptions.json", DescriptionCache(DESCRIPTIONS_PATH).dumps())
+        uploads = _add_dir(zf, upload_dir, "uploads", zipfile.ZIP_DEFLATED)
+        parents = _add_dir(zf, vector_store.parents.directory, "parents", zipfile.ZIP_DEFLATED)
+        # Images are already compressed
+        images = _add_dir(zf, images_dir, "images", zipfile.ZIP_STORED)
+        manifest = {
+            "format": BUNDLE_FORMAT,
+            "created_at": time.time(),
+            "provider": vector_store.provider,
+            "collection": vector_store.collection_name,
+            "history_collection": vector_store.history_collection_name,
+            "embedding_model": vector_store.embedding_model,
+            "precision": precision,
+            "uploads": uploads,
+            "parents": parents,
+            "images": images,
+            **chunks
+        }
+        zf.writestr("manifest.json", json.dumps(manifest, indent=2))
+    os.replace(tmp_path, bundle_path)
+    manifest["bytes"] = os.path.getsize(bundle_path)
+    manifest["elapsed_s"] = round(time.perf_counter() - t0, 2)
+    print(f"[Bundle] Exported {manifest['chunks']} chunks, {uploads} uploads and {images} images "
+          f"to {bundle_path} ({manifest['bytes'] / 1e6:.1f} MB, {precision}) in {manifest['elapsed_s']}s.")
+    return manifest
+
+
+def import_bundle(vector_store, bundle_path: str, upload_dir: str = "uploads", images_dir: str = IMAGES_DIR,
+                  replace: bool = False) -> Dict:
+    """
+    Restores a bundle written by export_bundle into this node, with the server stopped.
+    The target collection must be empty unless replace is set. Returns restore stats.
+    """
+    t0 = time.perf_counter()
+    with zipfile.ZipFile(bundle_path) as zf:
+        manifest = json.loads(zf.read("manifest.json"))
+        if manifest.get("format") != BUNDLE_FORMAT:
+            raise ValueError(f"Unsupported bundle format {manifest.get('format')}")
+        if manifest["provider"] != vector_store.provider:
+            raise ValueError(f"Bundle was built for provider '{manifest['provider']}', "
+                             f"this node uses '{vector_store.provider}'")
+
+        name = manifest["collection"]
+        target = VectorStore(collection_name=name, embedding_model=manifest["embedding_model"],
+                             embedding_dimension=manifest["dimension"])
+        existing = target.get_document_count()
+        if existing:
+            if not replace:
+                raise ValueError(f"{name} already holds {existing} chunks (use replace to overwrite)")
+            target.clear_all_documents()
+
+        max_batch = getattr(target.client, "get_max_batch_size", lambda: BUNDLE_IMPORT_BATCH)()
+        t_load = time.perf_counter()
+        loaded = load_chunks(zf, manifest, target.add_documents, batch_size=min(BUNDLE_IMPORT_BATCH, max_batch))
+        load_s = time.perf_counter() - t_load
+
+        uploads = _extract_dir(zf, "uploads", upload_dir)
+        images = _extract_dir(zf, "images", images_dir)
+        _extract_dir(zf, "parents", vector_store.parents.directory)
+        vector_store.catalog.restore(json.loads(zf.read("catalog.json")))
+        members = set(zf.namelist())
+        if "dedup.json" in members:
+            CorpusDedupIndex.restore(target.dedup_index.storage_path, zf.read("dedup.json"))
+        if "descriptions.json" in members:
+            DescriptionCache.restore(DESCRIPTIONS_PATH, zf.read("descriptions.json"))
+
+    # A collection built by an online migration is served through index_state.json
+    if name != f"rag_docs_{manifest['provider']}":
+        vector_store.index_state.switch(manifest["provider"], {
+            "collection": name,
+            "history_collection": manifest["history_collection"],
+            "embedding_model": manifest["embedding_model"],
+            "dimension": manifest["dimension"]
+        })
+
+    elapsed = time.perf_counter() - t0
+    stats = {
+        "chunks": loaded,
+        "uploads": uploads,
+        "images": images,
+        "load_s": round(load_s, 2),
+        "elapsed_s": round(elapsed, 2),
+        "chunks_per_s": round(loaded / load_s) if load_s else 0
+    }
+    print(f"[Bundle] Restored {loaded} chunks into {name}, {uploads} uploads and {images} images "
+          f"in {stats['elapsed_s']}s ({stats['chunks_per_s']} chunks/s).")
+    return stats
@@ -0,0 +1,364 @@
+import asyncio
+import json
+import os
+import sqlite3
+import statistics
+import struct
+import time
+from contextlib import closing
+from typing import List, Optional
+from .vector_store import CHROMA_PATH
+from .ingestion import chunk_hash
+from .summary_index import summary_collection_name
+from .embedding_reduction import EMBEDDING_DIMENSION, sample_embeddings
+from .pending_embeddings import is_zero_embedding
+
+# Interval between scheduled maintenance passes (the first one runs this long after startup)
+MAINTENANCE_INTERVAL_SECONDS = float(os.getenv("MAINTENANCE_INTERVAL_SECONDS", 24 * 3600))
+# Collections whose HNSW graph holds at least this share of deleted vectors are rebuilt (offline only)
+MAINTENANCE_COMPACT_RATIO = float(os.getenv("MAINTENANCE_COMPACT_RATIO", 0.2))
+# ... once that is at least this many vectors (rebuilding tiny collections gains nothing)
+MAINTENANCE_COMPACT_MIN_DELETED = int(os.getenv("MAINTENANCE_COMPACT_MIN_DELETED", 1000))
+# Stored chunks searched with their own embedding to time queries and check self-recall
+MAINTENANCE_LATENCY_QUERIES = int(os.getenv("MAINTENANCE_LATENCY_QUERIES", 20))
+MAINTENANCE_STATS_PATH = "maintenance_stats.json"
+# Passes kept in MAINTENANCE_STATS_PATH
+MAINTENANCE_HISTORY = 90
+# A p99 latency this many times the median of earlier passes is reported as a regression
+LATENCY_REGRESSION_FACTOR = 2.0
+# Below this share of chunks found as their own nearest neighbours the graph is reported degraded
+MIN_SELF_RECALL = 0.95
+SELF_RECALL_K = 5
+# Rows copied per request while rebuilding a collection
+COMPACT_BATCH = 1000
+# Both contain a '-' after the partition key, so they never read as partitions of the index
+COMPACT_SUFFIX = "-compact-tmp"
+# The original keeps its rows under this name until the rebuilt copy has taken its own
+COMPACT_OLD_SUFFIX = "-compact-old"
+
+
+def dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def vector_segment_dir(chroma_path: str, collection_id) -> Optional[str]:
+    """Directory of a collection's HNSW files (only there once Chroma has persisted the graph)."""
+    db_path = os.path.join(chroma_path, "chroma.sqlite3")
+    if not os.path.exists(db_path):
+        return None
+    try:
+        with closing(sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)) as conn:
+            row = conn.execute("SELECT id FROM segments WHERE collection = ? AND scope = 'VECTOR'",
+                               (str(collection_id),)).fetchone()
+    except sqlite3.Error as e:
+        print(f"[Maintenance] Error reading Chroma segments: {e}")
+        return None
+    path = os.path.join(chroma_path, row[0]) if row else None
+    return path if path and os.path.isdir(path) else None
+
+
+def hnsw_element_count(segment_dir: str) -> Optional[int]:
+    """
+    Vectors in a persisted HNSW graph, deleted ones included: hnswlib only marks deletions
+    and Chroma never reuses their slots. Third size_t of header.bin (cur_element_count).
+    """
+    try:
+        with open(os.path.join(segment_dir, "header.bin"), "rb") as f:
+            return struct.unpack("<3Q", f.read(24))[2]
+    except (OSError, struct.error):
+        return None
+
+
+def collection_stats(collection, chroma_path: str = CHROMA_PATH) -> dict:
+    """Live vectors, graph elements, deleted ratio and size on disk of one collection."""
+    count = collection.count()
+    segment = vector_segment_dir(chroma_path, collection.id)
+    elements = hnsw_element_count(segment) if segment else None
+    # The graph on disk lags the collection by up to Chroma's sync threshold
+    deleted = max(elements - count, 0) if elements else 0
+    return {
+        "name": collection.name,
+        "vectors": count,
+        "hnsw_elements": elements,
+        "deleted": deleted,
+        "deleted_ratio": round(deleted / elements, 3) if elements else 0.0,
+        "bytes": dir_size(segment) if segment else 0,
+        "dimension": (collection.metadata or {}).get("dimension")
+    }
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class IndexMaintenance:
+    """
+    Periodic upkeep of the serving index: removes chunks (and parent sections) whose
+    upload is gone, checks stored embedding widths against the configured model,
+    and records per-pass stats (size on disk, vectors, deleted ratio, query latency,
+    self-recall) in MAINTENANCE_STATS_PATH, warning when a pass looks worse than the
+    ones before it. Problems it cannot fix (a model or dimension mismatch) are reported,
+    never repaired. Collections clogged with deleted vectors are only rebuilt by
+    `manage_index.py maintain`, with the server stopped: the server reports them.
+    """
+    def __init__(self, vector_store, reconciler=None,
+                 stats_path: str = MAINTENANCE_STATS_PATH, chroma_path: str = CHROMA_PATH):
+        self.vector_store = vector_store
+        self.reconciler = reconciler
+        self.stats_path = stats_path
+        self.chroma_path = chroma_path
+        self.history = self._load()
+        self._lock = asyncio.Lock()
+
+    def _load(self) -> List[dict]:
+        if os.path.exists(self.stats_path):
+            try:
+                with open(self.stats_path, "r") as f:
+                    return json.load(f).get("passes", [])
+            except Exception as e:
+                print(f"[Maintenance] Error loading {self.stats_path}: {e}")
+        return []
+
+    def _save(self):
+        self.history = self.history[-MAINTENANCE_HISTORY:]
+        try:
+            with open(self.stats_path + ".tmp", "w") as f:
+                json.dump({"passes": self.history}, f, indent=2)
+            os.replace(self.stats_path + ".tmp", self.stats_path)
+        except Exception as e:
+            print(f"[Maintenance] Error saving {self.stats_path}: {e}")
+
+    def _collections(self) -> list:
+        """The serving index's partitions, its summary collection and the chat history."""
+        vs = self.vector_store
+        collections = list(vs.physical_collections())
+        existing = {c.name for c in vs.client.list_collections()}
+        for name in (summary_collection_name(vs.collection_name), vs.history_collection_name):
+            if name in existing:
+                collections.append(vs._open(name))
+        return collections
+
+    def index_stats(self) -> List[dict]:
+        return [collection_stats(c, self.chroma_path) for c in self._collections()]
+
+    def measure_queries(self, queries: int = MAINTENANCE_LATENCY_QUERIES) -> dict:
+        """
+        Searches the index with the stored embeddings of random chunks: query latency as the
+        server sees it (every partition, pending filter included) and how often each chunk
+        comes back among its own nearest neighbours, which drops as the graph degrades.
+        """
+        vs = self.vector_store
+        vectors, ids, _ = sample_embeddings(vs, queries, seed=int(time.time()))
+        if not ids:
+            return {"queries": 0}
+        rows = vs.get_chunks(ids=ids, include=["documents"])
+        documents = dict(zip(rows["ids"], rows["documents"]))
+        latencies, hits, searched = [], 0, 0
+        for chunk_id, vector in zip(ids, vectors):
+            if is_zero_embedding(vector) or chunk_id not in documents:
+                continue
+            start = time.perf_counter()
+            found = vs.query_embeddings([list(map(float, vector))], n_results=SELF_RECALL_K)[0]
+            latencies.append((time.perf_counter() - start) * 1000)
+            digest = chunk_hash(documents[chunk_id])
+            hits += any(meta.get("chunk_hash") == digest for _, meta in found)
+            searched += 1
+        if not searched:
+            return {"queries": 0}
+        return {
+            "queries": searched,
+            "p50_ms": round(_percentile(latencies, 0.5), 2),
+            "p99_ms": round(_percentile(latencies, 0.99), 2),
+            "self_recall": round(hits / searched, 3)
+        }
+
+    def check_dimensions(self) -> List[str]:
+        """Stored embedding widths against the collection's record, the serving dimension and the configured model."""
+        vs = self.vector_store
+        problems = []
+        expected = vs.embedding_dimension
+        widths = set()
+        for collection in self._collections():
+            rows = collection.get(limit=5, include=["embeddings"])
+            stored = {len(e) for e in rows["embeddings"] if not is_zero_embedding(e)} if rows["ids"] else set()
+            recorded = (collection.metadata or {}).get("dimension")
+            for width in stored:
+                if (expected and width != expected) or (recorded and width != recorded):
+                    problems.append(f"{collection.name} holds {width}-dimension embeddings, "
+                                    f"{recorded or expected} expected")
+            if collection.name != vs.history_collection_name:
+                widths |= stored
+
+        if vs.embedding_model != vs.configured_embedding_model:
+            problems.append(f"Configured embedding model {vs.configured_embedding_model} is not indexed yet "
+                            f"(serving {vs.embedding_model}): run `python upgrade_model.py --online`")
+        elif EMBEDDING_DIMENSION and EMBEDDING_DIMENSION != expected:
+            problems.append(f"Configured EMBEDDING_DIMENSION {EMBEDDING_DIMENSION} is not indexed yet "
+                            f"(serving {expected or 'native'}): run `python upgrade_model.py --online`")
+        try:
+            probe = vs.embed_documents(["dimension probe"])[0]
+        except Exception as e:
+            problems.append(f"Embedding probe failed: {e}")
+        else:
+            # A zero vector is a provider failure, not a width: the re-embed worker deals with those
+            if not is_zero_embedding(probe) and widths and len(probe) not in widths:
+                problems.append(f"{vs.embedding_model} now returns {len(probe)}-dimension embeddings, the index "
+                                f"holds {sorted(widths)}: queries will fail until it is rebuilt")
+        return problems
+
+    def _leftovers(self) -> List[str]:
+        """Collections an interrupted rebuild left behind."""
+        return [c.name for c in self.vector_store.client.list_collections()
+                if c.name.endswith(COMPACT_SUFFIX) or c.name.endswith(COMPACT_OLD_SUFFIX)]
+
+    def recover_interrupted(self) -> int:
+        """
+        Finishes or undoes rebuilds a crash stopped: an original parked under its -compact-old
+        name gets its name back unless the rebuilt copy already has it (a search may have
+        reopened the name empty meanwhile: that one gives way), and copies that never took the
+        name are dropped. Returns the collections recovered.
+        """
+        client = self.vector_store.client
+        existing = {c.name for c in client.list_collections()}
+        recovered = 0
+        for parked in (n for n in existing if n.endswith(COMPACT_OLD_SUFFIX)):
+            name = parked[:-len(COMPACT_OLD_SUFFIX)]
+            if name in existing and client.get_collection(name).count():
+                client.delete_collection(parked)
+            else:
+                if name in existing:
+                    client.delete_collection(name)
+                client.get_collection(parked).modify(name=name)
+                print(f"[Maintenance] Restored {name} from an interrupted rebuild.")
+                recovered += 1
+        for tmp_name in (n for n in existing if n.endswith(COMPACT_SUFFIX)):
+            client.delete_collection(tmp_name)
+        self.vector_store._partition_cache = None
+        return recovered
+
+    def compact(self, collection) -> bool:
+        """
+        Rebuilds a collection without its deleted vectors: Chroma has no compaction, so the
+        rows are copied with their embeddings into a fresh collection (same metadata, so the
+        same HNSW parameters). The original is then parked under another name, the copy takes
+        its name, and only then is the original dropped. Needs the server stopped: writes made
+        meanwhile (updates in place included) would be lost with the original.
+        """
+        client = self.vector_store.client
+        name = collection.name
+        tmp_name, old_name = name + COMPACT_SUFFIX, name + COMPACT_OLD_SUFFIX
+        target = client.create_collection(name=tmp_name, embedding_function=self.vector_store.embedding_fn_doc,
+                                          metadata=collection.metadata)
+        ids = collection.get(include=[])["ids"] or []
+        for start in range(0, len(ids), COMPACT_BATCH):
+            rows = collection.get(ids=ids[start:start + COMPACT_BATCH], include=["documents", "metadatas", "embeddings"])
+            if rows["ids"]:
+                target.add(ids=rows["ids"], documents=rows["documents"], metadatas=rows["metadatas"],
+                           embeddings=rows["embeddings"])
+        if collection.count() != len(ids) or target.count() != len(ids):
+            client.delete_collection(tmp_name)
+            print(f"[Maintenance] {name} changed while it was rebuilt (is the server running?). Skipped.")
+            return False
+
+        collection.modify(name=old_name)
+        try:
+            target.modify(name=name)
+        except Exception:
+            collection.modify(name=name)
+            client.delete_collection(tmp_name)
+            raise
+        client.delete_collection(old_name)
+        self.vector_store._partition_cache = None
+        return True
+
+    def _compact_degraded(self, stats: List[dict]) -> List[str]:
+        compacted = []
+        by_name = {c.name: c for c in self._collections()}
+        for entry in stats:
+            if entry["deleted_ratio"] < MAINTENANCE_COMPACT_RATIO or entry["deleted"] < MAINTENANCE_COMPACT_MIN_DELETED:
+                continue
+            start = time.time()
+            if entry["name"] in by_name and self.compact(by_name[entry["name"]]):
+                compacted.append(entry["name"])
+                print(f"[Maintenance] Rebuilt {entry['name']}: {entry['deleted']} deleted vectors dropped "
+                      f"in {time.time() - start:.1f}s.")
+        return compacted
+
+    def _warnings(self, report: dict) -> List[str]:
+        warnings = []
+        previous = [p["queries"]["p99_ms"] for p in self.history if p.get("queries", {}).get("p99_ms")]
+        p99 = report["queries"].get("p99_ms")
+        if p99 and previous and p99 > LATENCY_REGRESSION_FACTOR * statistics.median(previous):
+            warnings.append(f"p99 query latency {p99} ms, {statistics.median(previous)} ms usually")
+        recall = report["queries"].get("self_recall")
+        if recall is not None and recall < MIN_SELF_RECALL:
+            warnings.append(f"Only {recall:.0%} of sampled chunks are found as their own neighbours")
+        for entry in report["collections"]:
+            if entry["deleted_ratio"] >= MAINTENANCE_COMPACT_RATIO and entry["name"] not in report["compacted"]:
+                warnings.append(f"{entry['name']}: {entry['deleted_ratio']:.0%} of its HNSW graph is deleted vectors "
+                                f"(stop the server and run `python manage_index.py maintain` to rebuild it)")
+        for name in report["leftovers"]:
+            warnings.append(f"{name} is left from an interrupted rebuild: run `python manage_index.py maintain` "
+                            f"with the server stopped")
+        return warnings
+
+    async def run_once(self, compact: bool = False) -> dict:
+        """
+        One maintenance pass; returns its report (also appended to MAINTENANCE_STATS_PATH).
+        compact rebuilds degraded collections: only for the offline command, never the server.
+        """
+        async with self._lock:
+            start = time.time()
+            report = {"at": start, "collection": self.vector_store.collection_name,
+                      "embedding_model": self.vector_store.embedding_model}
+            if self.reconciler:
+                report["orphans"] = await self.reconciler.remove_orphans()
+            report["problems"] = await asyncio.to_thread(self.check_dimensions)
+            if compact:
+                await asyncio.to_thread(self.recover_interrupted)
+            report["leftovers"] = await asyncio.to_thread(self._leftovers)
+            stats = await asyncio.to_thread(self.index_stats)
+            report["compacted"] = await asyncio.to_thread(self._compact_degraded, stats) if compact else []
+            if report["compacted"]:
+                stats = await asyncio.to_thread(self.index_stats)
+            report["collections"] = stats
+            report["vectors"] = sum(c["vectors"] for c in stats)
+            report["deleted_ratio"] = round(
+                sum(c["deleted"] for c in stats) / max(sum(c["hnsw_elements"] or 0 for c in stats), 1), 3)
+            report["disk_bytes"] = dir_size(self.chroma_path)
+            report["queries"] = await asyncio.to_thread(self.measure_queries)
+            report["warnings"] = self._warnings(report)
+            report["elapsed_s"] = round(time.time() - start, 2)
+
+            self.history.append(report)
+            self._save()
+            for problem in report["problems"]:
+                print(f"[Maintenance] Problem: {problem}")
+            for warning in report["warnings"]:
+                print(f"[Maintenance] Warning: {warning}")
+            print(f"[Maintenance] {report['vectors']} vectors, {report['disk_bytes'] / 1e6:.1f} MB on disk, "
+                  f"{report['deleted_ratio']:.0%} deleted, p99 {report['queries'].get('p99_ms', '-')} ms "
+                  f"({len(report['compacted'])} collections rebuilt, {report['elapsed_s']}s).")
+            return report
+
+    async def run_forever(self, interval: float = MAINTENANCE_INTERVAL_SECONDS):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"[Maintenance] Maintenance pass failed: {e}")
+
+    def get_stats(self) -> Optional[dict]:
+        """The last pass, without its per-collection breakdown."""
+        if not self.history:
+            return None
+        return {k: v for k, v in self.history[-1].items() if k != "collections"}
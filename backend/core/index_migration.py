@@ -0,0 +1,265 @@
+import asyncio
+import os
+import random
+import time
+from typing import Dict, List, Optional
+from .vector_store import VectorStore
+from .document_catalog import DocumentCatalog
+from .ingestion import chunk_hash
+from .ingestion_executor import IngestionExecutor
+from .file_store import hash_file
+from .index_state import versioned_collection_name
+from .reconciler import guess_category
+from .pending_embeddings import is_zero_embedding
+
+# Documents indexed between two checkpoints of an online migration
+MIGRATION_CHECKPOINT_DOCS = int(os.getenv("MIGRATION_CHECKPOINT_DOCS", 8))
+# Chunks sampled to check that the shadow collection retrieves them
+MIGRATION_SAMPLE_SIZE = int(os.getenv("MIGRATION_SAMPLE_SIZE", 50))
+MIGRATION_RECALL_K = int(os.getenv("MIGRATION_RECALL_K", 5))
+# Below this sampled recall the switch is refused
+MIGRATION_MIN_RECALL = float(os.getenv("MIGRATION_MIN_RECALL", 0.9))
+# Chat history entries copied per request
+HISTORY_COPY_BATCH = 256
+
+
+class OnlineMigration:
+    """
+    Blue/green re-index for an embedding model change. The configured model builds a
+    shadow collection named after the model and its dimension while the live one keeps
+    serving. Each finished document is checkpointed in index_state.json, so a rerun
+    resumes where the last one stopped. The switch only happens once the chunk counts
+    add up and a sample of chunks is retrieved by the new index; the old collection is
+    left in place for rollback.
+
+    The migration never writes the document catalog: the server's reconciler restamps
+    it after the switch and indexes anything uploaded in the meantime.
+    """
+    def __init__(self, upload_dir: str, image_dir: str, catalog_path: str = "document_catalog.json"):
+        self.upload_dir = upload_dir
+        self.image_dir = image_dir
+        self.catalog_path = catalog_path
+        self.live = VectorStore()
+        self.state = self.live.index_state
+        self.provider = self.live.provider
+        self.target_model = self.live.configured_embedding_model
+        self.shadow: Optional[VectorStore] = None
+        self.record: Optional[Dict] = None
+
+    def _disk_sources(self) -> set:
+        if not os.path.exists(self.upload_dir):
+            return set()
+        return {
+            f for f in os.listdir(self.upload_dir)
+            if not f.startswith('.') and os.path.isfile(os.path.join(self.upload_dir, f))
+        }
+
+    def _live_dimension(self) -> Optional[int]:
+        try:
+            embeddings = self.live.get_chunks(include=["embeddings"], limit=1)["embeddings"]
+        except Exception:
+            return None
+        return len(embeddings[0]) if len(embeddings) else None
+
+    def _current(self) -> Dict:
+        """The serving index, described the way index_state.json records it."""
+        return self.state.active(self.provider) or {
+            "collection": self.live.collection_name,
+            "history_collection": self.live.history_collection_name,
+            "embedding_model": self.live.embedding_model,
+            "dimension": self._live_dimension()
+        }
+
+    def prepare(self) -> bool:
+        """Probes the new model's dimension and opens (or resumes) the shadow collection."""
+        probe = VectorStore(embedding_model=self.target_model)
+        try:
+            embedding = probe.embed_documents(["dimension probe"])[0]
+        except ValueError as e:
+            # EMBEDDING_DIMENSION needs a PCA that is not fitted yet
+            print(f"[Migration] {e}. Nothing was changed.")
+            return False
+        if is_zero_embedding(embedding):
+            print(f"[Migration] Embedding with {self.target_model} failed. Nothing was changed.")
+            return False
+        dimension = len(embedding)
+        collection = versioned_collection_name(f"rag_docs_{self.provider}", self.target_model, dimension)
+        if collection == self.live.collection_name:
+            print(f"[Migration] {collection} is already serving. Nothing to migrate.")
+            return False
+
+        self.shadow = VectorStore(collection_name=collection, embedding_model=self.target_model,
+                                  dedup_path=f"dedup_index.{collection}.json", embedding_dimension=dimension)
+        self.record = self.state.migration(collection)
+        if self.record:
+            print(f"[Migration] Resuming {collection}: {len(self.record['sources'])} documents already indexed.")
+        else:
+            self.record = {
+                "provider": self.provider,
+                "embedding_model": self.target_model,
+                "dimension": dimension,
+                "collection": collection,
+                "history_collection": versioned_collection_name(f"chat_history_{self.provider}",
+                                                                 self.target_model, dimension),
+                "source_collection": self.live.collection_name,
+                "started_at": time.time(),
+                "status": "building",
+                "history_copied": False,
+                "sources": {}
+            }
+            self._checkpoint()
+            print(f"[Migration] Building {collection} next to {self.live.collection_name} "
+                  f"({self.live.embedding_model} -> {self.target_model}, {dimension} dims).")
+        return True
+
+    def _checkpoint(self):
+        self.state.save_migration(self.record["collection"], self.record)
+
+    def _pending_jobs(self) -> List[dict]:
+        """Documents on disk the shadow collection lacks, or whose content changed since they were indexed."""
+        catalog = DocumentCatalog(storage_path=self.catalog_path)
+        jobs = []
+        for source in sorted(self._disk_sources()):
+            filepath = os.path.join(self.upload_dir, source)
+            entry = catalog.get(source) or {}
+            content_hash = entry.get("content_hash") or hash_file(filepath)
+            done = self.record["sources"].get(source)
+            if done and done["content_hash"] == content_hash:
+                continue
+            jobs.append({
+                "filepath": filepath,
+                "doc_id": source.split('_')[0],
+                "source": source,
+                "category": entry.get("category") or guess_category(source),
+                # Replaces whatever an interrupted run left of this document
+                "old_sources": [source],
+                "content_hash": content_hash
+            })
+        return jobs
+
+    def _drop_deleted(self) -> int:
+        """Removes documents deleted from uploads/ since they were indexed into the shadow."""
+        gone = set(self.record["sources"]) - self._disk_sources()
+        for source in gone:
+            self.shadow.delete_documents_by_source(source)
+            del self.record["sources"][source]
+        if gone:
+            self._checkpoint()
+        return len(gone)
+
+    async def _index(self, jobs: List[dict]) -> int:
+        executor = IngestionExecutor(self.shadow, image_dir=self.image_dir)
+        failed = 0
+        try:
+            for i in range(0, len(jobs), MIGRATION_CHECKPOINT_DOCS):
+                group = jobs[i:i + MIGRATION_CHECKPOINT_DOCS]
+                outcomes, throughput = await executor.ingest_many(group)
+                for job, stats in zip(group, outcomes):
+                    if "error" in stats:
+                        failed += 1
+                        print(f"[Migration] Failed to index {job['source']}: {stats['error']}")
+                        continue
+                    self.record["sources"][job["source"]] = {"chunks": stats["chunks"],
+                                                             "content_hash": job["content_hash"]}
+                self._checkpoint()
+                print(f"[Migration] {len(self.record['sources'])} documents indexed "
+                      f"({throughput['docs_per_min']} docs/min).")
+        finally:
+            executor.shutdown()
+        return failed
+
+    def _copy_history(self):
+        """Re-embeds chat history into the new model's history collection (existing ids are skipped)."""
+        source = self.live.history_collection
+        target = self.shadow.client.get_or_create_collection(
+            name=self.record["history_collection"],
+            embedding_function=self.shadow.embedding_fn_doc,
+            metadata=self.shadow.collection_metadata()
+        )
+        have = set(target.get(include=[])["ids"] or [])
+        ids = [i for i in (source.get(include=[])["ids"] or []) if i not in have]
+        for i in range(0, len(ids), HISTORY_COPY_BATCH):
+            batch = source.get(ids=ids[i:i + HISTORY_COPY_BATCH], include=["documents", "metadatas"])
+            target.add(ids=batch["ids"], documents=batch["documents"], metadatas=batch["metadatas"])
+        return len(ids)
+
+    def verify(self) -> bool:
+        """Counts must add up and sampled chunks must come back as their own nearest neighbours."""
+        expected = sum(s["chunks"] for s in self.record["sources"].values())
+        actual = self.shadow.get_document_count()
+        missing = self._disk_sources() - set(self.record["sources"])
+        print(f"[Migration] Chunks: {actual} in {self.record['collection']}, {expected} expected "
+              f"({self.live.get_document_count()} in {self.live.collection_name}).")
+        if actual != expected or missing:
+            print(f"[Migration] Verification failed: count mismatch or {len(missing)} documents not indexed.")
+            return False
+        if not actual:
+            return True
+
+        ids = self.shadow.get_chunks(include=[])["ids"]
+        sample = self.shadow.get_chunks(ids=random.sample(ids, min(MIGRATION_SAMPLE_SIZE, len(ids))),
+                                        include=["documents", "embeddings"])
+        zero = sum(1 for e in sample["embeddings"] if is_zero_embedding(e))
+        if zero:
+            print(f"[Migration] Verification failed: {zero} sampled chunks have zero embeddings.")
+            return False
+
+        results = self.shadow.query_embeddings(
+            self.shadow.embedding_fn_query(sample["documents"]),
+            n_results=min(MIGRATION_RECALL_K, actual)
+        )
+        hits = 0
+        for document, found in zip(sample["documents"], results):
+            digest = chunk_hash(document)
+            hits += any(meta.get("chunk_hash") == digest for _, meta in found)
+        recall = hits / len(sample["documents"])
+        self.record["recall"] = round(recall, 3)
+        print(f"[Migration] Sampled recall@{MIGRATION_RECALL_K}: {recall:.2f} (minimum {MIGRATION_MIN_RECALL}).")
+        return recall >= MIGRATION_MIN_RECALL
+
+    def switch(self):
+        target = {key: self.record[key] for key in ("collection", "history_collection", "embedding_model", "dimension")}
+        current = self._current()
+        self.state.switch(self.provider, target, current)
+        self.state.remove_migration(self.record["collection"])
+        # The server's reconciler moves the live signatures over; the shadow's own copy is not needed
+        self.shadow.dedup_index.remove_files()
+        print(f"[Migration] Switched to {target['collection']}. "
+              f"{current['collection']} is kept for rollback (python upgrade_model.py --rollback).")
+
+    async def run(self) -> bool:
+        if not self.prepare():
+            return False
+        self.record["status"] = "building"
+        await self._index(self._pending_jobs())
+        if not self.record["history_copied"]:
+            print(f"[Migration] Copied {self._copy_history()} chat history entries.")
+            self.record["history_copied"] = True
+            self._checkpoint()
+
+        # Catch up with uploads and deletions made while the shadow was being built
+        # (documents that failed above get a second attempt here)
+        self._drop_deleted()
+        failed = await self._index(self._pending_jobs())
+        print(f"[Migration] Copied {self._copy_history()} chat history entries made meanwhile.")
+        # Chunks whose embedding failed while building get one more try before verification
+        await asyncio.to_thread(self.shadow.pending.reembed)
+
+        self.record["status"] = "verifying"
+        if failed or not self.verify():
+            self.record["status"] = "failed"
+            self._checkpoint()
+            print("[Migration] Not switching. The live index is untouched; rerun to resume.")
+            return False
+        self.switch()
+        return True
+
+
+def rollback(vector_store: VectorStore) -> bool:
+    """Serves the previous index again (the one replaced by the last switch)."""
+    restored = vector_store.index_state.rollback(vector_store.provider)
+    if not restored:
+        print("[Migration] No previous index to roll back to.")
+        return False
+    print(f"[Migration] Rolled back to {restored['collection']} ({restored['embedding_model']}).")
+    return True
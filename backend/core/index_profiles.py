@@ -0,0 +1,66 @@
+import json
+import os
+from typing import Dict, Tuple
+
+# HNSW parameters for new collections: fast, balanced, accurate, or a profile written by
+# `python manage_index.py tune`. Existing collections keep the parameters they were built with.
+INDEX_PROFILE = os.getenv("INDEX_PROFILE", "balanced")
+INDEX_PROFILES_PATH = os.getenv("INDEX_PROFILES_PATH", "index_profiles.json")
+# Distance space of new collections. Empty keeps Chroma's default (l2); for unit-length
+# embeddings l2 and cosine rank identically. Only change it on an empty index: partitions
+# built in different spaces return distances that cannot be merged.
+HNSW_SPACE = os.getenv("HNSW_SPACE", "")
+
+# M: graph links per node (recall and memory), ef_construction: build-time beam,
+# ef_search: query-time beam (recall vs latency). Chroma's own defaults are 16 / 100 / 10.
+BUILTIN_PROFILES = {
+    "fast": {"M": 12, "ef_construction": 100, "ef_search": 24},
+    "balanced": {"M": 16, "ef_construction": 200, "ef_search": 64},
+    "accurate": {"M": 32, "ef_construction": 400, "ef_search": 200},
+}
+PROFILE_PARAMS = ("M", "ef_construction", "ef_search")
+
+
+def load_profiles(path: str = INDEX_PROFILES_PATH) -> Dict[str, dict]:
+    """Built-in profiles plus the tuned ones saved in index_profiles.json."""
+    profiles = {name: dict(params) for name, params in BUILTIN_PROFILES.items()}
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                profiles.update(json.load(f).get("profiles", {}))
+        except Exception as e:
+            print(f"[IndexProfile] Error loading {path}: {e}")
+    return profiles
+
+
+def save_profile(name: str, profile: dict, path: str = INDEX_PROFILES_PATH):
+    data = {"profiles": {}}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    data.setdefault("profiles", {})[name] = profile
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def resolve_profile(name: str = None) -> Tuple[str, dict]:
+    name = name or INDEX_PROFILE
+    profiles = load_profiles()
+    if name not in profiles:
+        print(f"[IndexProfile] Unknown index profile '{name}' (have {', '.join(profiles)}). Using balanced.")
+        name = "balanced"
+    return name, {key: int(profiles[name][key]) for key in PROFILE_PARAMS}
+
+
+def hnsw_metadata(params: dict, space: str = HNSW_SPACE) -> dict:
+    """Chroma collection metadata that sets the HNSW parameters (read when the collection is created)."""
+    metadata = {
+        "hnsw:M": params["M"],
+        "hnsw:construction_ef": params["ef_construction"],
+        "hnsw:search_ef": params["ef_search"],
+    }
+    if space:
+        metadata["hnsw:space"] = space
+    return metadata
@@ -0,0 +1,130 @@
+import copy
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, Optional
+
+
+def collection_slug(embedding_model: str) -> str:
+    # Chroma names allow [a-zA-Z0-9._-] only
+    return re.sub(r'[^a-zA-Z0-9._-]+', '-', embedding_model).strip('-._')
+
+
+def versioned_collection_name(prefix: str, embedding_model: str, dimension: int) -> str:
+    """e.g. rag_docs_openai_text-embedding-3-large_3072"""
+    return f"{prefix}_{collection_slug(embedding_model)}_{dimension}"
+
+
+class IndexState:
+    """
+    Which collections serve each provider, with the embedding model and dimension
+    they were built with, the previous ones (kept for rollback) and checkpoints of
+    online migrations. Shared through index_state.json by the API server and
+    upgrade_model.py: a switch is one atomic file replace that every VectorStore
+    picks up on its next access.
+    """
+    def __init__(self, storage_path: str = "index_state.json"):
+        self.storage_path = storage_path
+        self._lock = threading.RLock()
+        self._data = self._empty()
+        self._mtime = None
+        self.refresh()
+
+    @staticmethod
+    def _empty() -> Dict:
+        return {"active": {}, "previous": {}, "migrations": {}}
+
+    def _file_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.storage_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def refresh(self) -> bool:
+        """Reloads the file if another process changed it. Returns True if it did."""
+        with self._lock:
+            mtime = self._file_mtime()
+            if mtime == self._mtime:
+                return False
+            self._mtime = mtime
+            data = self._empty()
+            if mtime is not None:
+                try:
+                    with open(self.storage_path, "r", encoding="utf-8") as f:
+                        data.update(json.load(f))
+                except Exception as e:
+                    print(f"[IndexState] Error loading index state: {e}")
+                    return False
+            self._data = data
+            return True
+
+    def _save(self):
+        tmp_path = self.storage_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._data, f, indent=2)
+        os.replace(tmp_path, self.storage_path)
+        self._mtime = self._file_mtime()
+
+    def active(self, provider: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._data["active"].get(provider)
+            return dict(entry) if entry else None
+
+    def previous(self, provider: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._data["previous"].get(provider)
+            return dict(entry) if entry else None
+
+    def switch(self, provider: str, target: Dict, current: Optional[Dict] = None):
+        """Makes target the serving index; current (if given) is kept as the rollback target."""
+        with self._lock:
+            self.refresh()
+            if current:
+                self._data["previous"][provider] = dict(current)
+            self._data["active"][provider] = {**target, "switched_at": time.time()}
+            self._save()
+
+    def rollback(self, provider: str) -> Optional[Dict]:
+        """Swaps the active and previous index. Returns the index now serving, if any."""
+        with self._lock:
+            self.refresh()
+            previous = self._data["previous"].get(provider)
+            if not previous:
+                return None
+            current = self._data["active"].get(provider)
+            self._data["active"][provider] = {**previous, "switched_at": time.time()}
+            if current:
+                self._data["previous"][provider] = current
+            else:
+                self._data["previous"].pop(provider, None)
+            self._save()
+            return dict(previous)
+
+    def migration(self, collection: str) -> Optional[Dict]:
+        with self._lock:
+            record = self._data["migrations"].get(collection)
+            return copy.deepcopy(record) if record else None
+
+    def save_migration(self, collection: str, record: Dict):
+        """Checkpoints an online migration so an interrupted run can resume."""
+        with self._lock:
+            self.refresh()
+            self._data["migrations"][collection] = copy.deepcopy(record)
+            self._save()
+
+    def remove_migration(self, collection: str):
+        with self._lock:
+            self.refresh()
+            if self._data["migrations"].pop(collection, None) is not None:
+                self._save()
+
+    def reset(self):
+        with self._lock:
+            self._data = self._empty()
+            self._save()
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return copy.deepcopy(self._data)
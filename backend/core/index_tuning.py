@@ -0,0 +1,153 @@
+import os
+import shutil
+import tempfile
+import time
+from itertools import product
+from typing import Dict, List, Tuple
+import numpy as np
+import chromadb
+from .index_profiles import hnsw_metadata, save_profile, HNSW_SPACE
+from .embedding_reduction import sample_embeddings
+
+TUNE_SAMPLE = int(os.getenv("TUNE_SAMPLE", 10000))
+TUNE_QUERIES = int(os.getenv("TUNE_QUERIES", 200))
+TUNE_K = 5
+TUNE_MIN_RECALL = float(os.getenv("TUNE_MIN_RECALL", 0.95))
+TUNE_GRID = {"M": [8, 16, 32], "ef_construction": [100, 200], "ef_search": [16, 64, 128, 256]}
+WARMUP_QUERIES = 10
+
+
+def hnsw_memory_bytes(count: int, dimension: int, m: int) -> int:
+    """Approximate resident size of an HNSW index: float32 vectors, 2*M level-0 links, upper levels and labels."""
+    return int(count * (4 * dimension + 4 * 2 * m + 4 + 8 + 4 * m / max(m - 1, 1)))
+
+
+def exact_neighbours(corpus: np.ndarray, queries: np.ndarray, k: int, space: str = HNSW_SPACE) -> List[set]:
+    """Ground truth by brute force in the index's distance space."""
+    if space in ("cosine", "ip"):
+        if space == "cosine":
+            corpus = corpus / np.maximum(np.linalg.norm(corpus, axis=1, keepdims=True), 1e-12)
+            queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        scores = -(queries @ corpus.T)
+    else:
+        scores = (queries ** 2).sum(axis=1)[:, None] - 2 * queries @ corpus.T + (corpus ** 2).sum(axis=1)[None, :]
+    return [set(np.argpartition(row, k)[:k].tolist()) for row in scores]
+
+
+def held_out_set(vector_store, sample: int = TUNE_SAMPLE, queries: int = TUNE_QUERIES,
+                 seed: int = 0) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    A random sample of the serving index as the corpus, and held-out queries: users'
+    questions from chat history where there are enough, topped up with indexed chunks
+    left out of the corpus. Returns (corpus, queries, total chunks in the index).
+    """
+    vectors, _, total = sample_embeddings(vector_store, sample + queries, seed)
+
+    questions = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+    history = vector_store.history_collection.get(where={"role": "user"}, limit=queries, include=["embeddings"])
+    if history["embeddings"] is not None and len(history["embeddings"]):
+        asked = np.asarray(history["embeddings"], dtype=np.float32)
+        if asked.shape[1] == vectors.shape[1]:
+            questions = asked
+    held_out = max(queries - len(questions), 0)
+    corpus = vectors[held_out:]
+    return corpus, np.concatenate([questions, vectors[:held_out]]), total
+
+
+def _build(client, corpus: np.ndarray, params: Dict[str, int]):
+    collection = client.create_collection(
+        name=f"tune_{params['M']}_{params['ef_construction']}_{params['ef_search']}",
+        metadata=hnsw_metadata(params),
+        embedding_function=None
+    )
+    batch = min(5000, getattr(client, "get_max_batch_size", lambda: 5000)())
+    for start in range(0, len(corpus), batch):
+        part = corpus[start:start + batch]
+        collection.add(ids=[str(start + i) for i in range(len(part))], embeddings=part.tolist())
+    return collection
+
+
+def _measure(collection, queries: np.ndarray, truth: List[set], k: int) -> Tuple[float, float, float]:
+    latencies, recall = [], []
+    for i, q in enumerate(queries):
+        t0 = time.perf_counter()
+        found = collection.query(query_embeddings=[q.tolist()], n_results=k, include=[])["ids"][0]
+        elapsed = (time.perf_counter() - t0) * 1000
+        if i >= WARMUP_QUERIES:
+            latencies.append(elapsed)
+        recall.append(len({int(f) for f in found} & truth[i]) / k)
+    return float(np.mean(recall)), float(np.percentile(latencies, 50)), float(np.percentile(latencies, 99))
+
+
+def pareto_front(results: List[dict]) -> List[dict]:
+    """Configurations no other one beats on recall, p99 latency and memory at once."""
+    def dominates(a, b):
+        no_worse = a["recall"] >= b["recall"] and a["p99_ms"] <= b["p99_ms"] and a["memory_mb"] <= b["memory_mb"]
+        better = a["recall"] > b["recall"] or a["p99_ms"] < b["p99_ms"] or a["memory_mb"] < b["memory_mb"]
+        return no_worse and better
+    return [r for r in results if not any(dominates(o, r) for o in results)]
+
+
+def recommend(results: List[dict], min_recall: float = TUNE_MIN_RECALL) -> dict:
+    """The fastest configuration (p50, then memory) that reaches min_recall, else the most accurate one."""
+    good = [r for r in results if r["recall"] >= min_recall]
+    if good:
+        return min(good, key=lambda r: (r["p50_ms"], r["memory_mb"]))
+    return max(results, key=lambda r: (r["recall"], -r["p50_ms"]))
+
+
+def tune(vector_store, grid: Dict[str, List[int]] = None, sample: int = TUNE_SAMPLE, queries: int = TUNE_QUERIES,
+         k: int = TUNE_K, min_recall: float = TUNE_MIN_RECALL, profile_name: str = "tuned", write: bool = True) -> dict:
+    """
+    Sweeps M x ef_construction x ef_search on a sample of the serving index, each in a
+    scratch Chroma directory, reports recall@k against exact search with p50/p99 query
+    latency and the index's memory at full size, and saves the recommended profile.
+    """
+    grid = {**TUNE_GRID, **(grid or {})}
+    corpus, query_vectors, total = held_out_set(vector_store, sample, queries)
+    if len(corpus) <= k or not len(query_vectors):
+        raise ValueError(f"Not enough indexed chunks to tune ({len(corpus)} in the sample)")
+    dimension = corpus.shape[1]
+    truth = exact_neighbours(corpus, query_vectors, k)
+    print(f"[Tune] {len(corpus)} of {total} chunks ({dimension} dims), {len(query_vectors)} held-out queries, "
+          f"recall@{k} vs exact search")
+
+    results = []
+    work = tempfile.mkdtemp(prefix="tune_index_")
+    try:
+        client = chromadb.PersistentClient(path=work)
+        for m, ef_construction, ef_search in product(grid["M"], grid["ef_construction"], grid["ef_search"]):
+            params = {"M": m, "ef_construction": ef_construction, "ef_search": ef_search}
+            t0 = time.perf_counter()
+            collection = _build(client, corpus, params)
+            build_s = time.perf_counter() - t0
+            recall, p50, p99 = _measure(collection, query_vectors, truth, k)
+            client.delete_collection(collection.name)
+            results.append({**params, "recall": round(recall, 4), "p50_ms": round(p50, 2), "p99_ms": round(p99, 2),
+                            "memory_mb": round(hnsw_memory_bytes(total, dimension, m) / 1e6, 1),
+                            "build_s": round(build_s, 1)})
+            print(f"[Tune] M={m:<3} ef_construction={ef_construction:<4} ef_search={ef_search:<4} "
+                  f"recall={recall:.3f} p50={p50:.2f}ms p99={p99:.2f}ms")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    front = pareto_front(results)
+    # Off the frontier something is at least as fast, accurate and small
+    best = recommend(front, min_recall)
+    print(f"\n{'M':>3} {'ef_c':>5} {'ef_s':>5} {'recall':>7} {'p50 ms':>7} {'p99 ms':>7} {'memory MB':>10} {'build s':>8}")
+    for r in sorted(front, key=lambda r: (r["recall"], r["p50_ms"])):
+        marker = "  <- recommended" if r is best else ""
+        print(f"{r['M']:>3} {r['ef_construction']:>5} {r['ef_search']:>5} {r['recall']:>7.3f} {r['p50_ms']:>7.2f} "
+              f"{r['p99_ms']:>7.2f} {r['memory_mb']:>10.1f} {r['build_s']:>8.1f}{marker}")
+
+    profile = {
+        "M": best["M"], "ef_construction": best["ef_construction"], "ef_search": best["ef_search"],
+        "recall": best["recall"], "p50_ms": best["p50_ms"], "p99_ms": best["p99_ms"], "memory_mb": best["memory_mb"],
+        "k": k, "min_recall": min_recall, "dimension": dimension, "chunks": total,
+        "embedding_model": vector_store.embedding_model, "collection": vector_store.collection_name,
+        "tuned_at": time.time()
+    }
+    if write:
+        save_profile(profile_name, profile)
+        print(f"[Tune] Saved profile '{profile_name}'. Set INDEX_PROFILE={profile_name} to build new collections with it.")
+    return {"profile": profile, "results": results, "frontier": front}
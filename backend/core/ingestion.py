@@ -0,0 +1,475 @@
+import asyncio
+import hashlib
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Iterator, List, Optional, Tuple
+from .loader import iter_file_blocks
+from .tabular_loader import iter_table_chunks, TABULAR_EXTENSIONS
+from .advanced_chunker import DynamicChunker, PARENT_TEXT_KEY
+from .image_processor import image_processor
+from .dedup import DocumentDeduplicator, DEDUP_ENABLED
+from .image_store import image_refs, join_image_refs
+from .parent_store import section_id
+
+STATIC_DIR = "static"
+IMAGES_DIR = os.path.join(STATIC_DIR, "images")
+
+# Chunks embedded and written per vector store call
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 64))
+# Items buffered between pipeline stages (bounds memory on large documents)
+INGEST_QUEUE_DEPTH = int(os.getenv("INGEST_QUEUE_DEPTH", 32))
+# Blocks whose image descriptions may be in flight ahead of the chunker
+DESCRIBE_LOOKAHEAD = int(os.getenv("DESCRIBE_LOOKAHEAD", 8))
+
+# Markdown images: ![description](path)
+IMAGE_MD_PATTERN = re.compile(r'!\[(.*?)\]\((.*?)\)')
+
+
+async def describe_images(text_content: str, category: str, filename: str = "") -> str:
+    """
+    PROCESS IMAGES: Detect, Describe, Replace.
+    Replaces each markdown image with one carrying an AI-generated description.
+    """
+    matches = IMAGE_MD_PATTERN.findall(text_content)
+    if not matches or not (category == 'product' or 'step' in text_content.lower()):
+        return text_content
+
+    print(f"Found {len(matches)} images in {filename}. Generating descriptions concurrently...")
+
+    tasks = []
+    valid_matches = []
+
+    # Prepare tasks
+    for alt_text, img_rel_path in matches:
+        # Resolve absolute path
+        if img_rel_path.startswith('/static/'):
+            clean_path = img_rel_path.replace('/static/', '', 1)
+            full_img_path = os.path.join(STATIC_DIR, clean_path)
+        else:
+            full_img_path = img_rel_path
+
+        if os.path.exists(full_img_path):
+            tasks.append(image_processor.generate_description_async(full_img_path))
+            valid_matches.append((alt_text, img_rel_path))
+
+    if tasks:
+        # Run all descriptions in parallel, return exceptions instead of failing
+        descriptions_or_errors = await asyncio.gather(*tasks, return_exceptions=True)
+
+        processed_descriptions = []
+        for result in descriptions_or_errors:
+            if isinstance(result, Exception):
+                print(f"Image processing error: {result}")
+                processed_descriptions.append("Image description unavailable due to error.")
+            else:
+                processed_descriptions.append(result)
+
+        # Replace in content
+        for (alt_text, img_rel_path), description in zip(valid_matches, processed_descriptions):
+            original_md = f"![{alt_text}]({img_rel_path})"
+            new_md = f"![Image: {description}]({img_rel_path})"
+            text_content = text_content.replace(original_md, new_md)
+
+    print(f"Processed {len(tasks)} images concurrently.")
+    return text_content
+
+
+def count_images(text_content: str) -> int:
+    return len(IMAGE_MD_PATTERN.findall(text_content))
+
+
+def record_document(vector_store, source: str, **fields) -> dict:
+    """Writes the catalog entry for an indexed source, stamped with the active index."""
+    return vector_store.catalog.upsert(
+        source,
+        embedding_model=vector_store.embedding_model,
+        collection=vector_store.collection_name,
+        **fields
+    )
+
+
+def chunk_hash(chunk: str) -> str:
+    """Content hash used to diff chunks between document versions."""
+    return hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+
+
+def _chunk_id(doc_id: str, digest: str, used_ids: set) -> str:
+    # Identical chunks inside one document get an occurrence suffix
+    base = f"{doc_id}_{digest[:16]}"
+    chunk_id, n = base, 1
+    while chunk_id in used_ids:
+        chunk_id = f"{base}_{n}"
+        n += 1
+    used_ids.add(chunk_id)
+    return chunk_id
+
+
+def _chunk_metadata(source: str, category: str, index: int, digest: str, extra: Optional[dict] = None,
+                    chunk: str = "") -> dict:
+    metadata = {**(extra or {}), "source": source, "category": category, "chunk_index": index, "chunk_hash": digest}
+    if "section_index" in metadata:
+        # Unique across the corpus: the summary index and retrieval filter on it
+        metadata["section_id"] = section_id(source, metadata["section_index"])
+    # Retrieval attaches these images without scanning the chunk text
+    images = image_refs(chunk)
+    if images:
+        metadata["images"] = join_image_refs(images)
+    return metadata
+
+
+class ChunkWriter:
+    """
+    Writes a document's chunks to the vector store in batches as they arrive.
+    With old_sources (a new version of an existing document) chunks whose content
+    hash is already indexed are kept and only get their metadata updated; chunks
+    that vanished are deleted in finish(), after everything new has been added.
+    Near-duplicate chunks are dropped, or reuse a corpus chunk's embedding (see dedup.py).
+    Parent sections of small-to-big child chunks go to the parent store in finish().
+    """
+    def __init__(self, vector_store, doc_id: str, source: str, category: str,
+                 old_sources: Optional[List[str]] = None, batch_size: int = INGEST_BATCH_SIZE):
+        self.vector_store = vector_store
+        self.doc_id = doc_id
+        self.source = source
+        self.category = category
+        self.old_sources = old_sources or []
+        self.batch_size = batch_size
+        self.count = 0
+        self.added_ids = []
+        self.write_s = 0.0
+
+        # Pool of already indexed ids per content hash (multiset, a chunk may repeat)
+        self._old_by_hash = {}
+        self._used_ids = set()
+        if self.old_sources:
+            existing = vector_store.get_chunks_by_sources(self.old_sources)
+            for chunk_id, document in zip(existing["ids"], existing["documents"]):
+                self._old_by_hash.setdefault(chunk_hash(document), []).append(chunk_id)
+            self._used_ids.update(existing["ids"])
+
+        self._add_ids, self._add_docs, self._add_metas, self._add_reuse = [], [], [], []
+        self._keep_ids, self._keep_metas = [], []
+
+        # The document's own earlier versions are never reused: their edits are intentional
+        self.dedup = DocumentDeduplicator(
+            vector_store.dedup_index, category, vector_store.collection_name,
+            exclude_sources=self.old_sources + [source]
+        ) if DEDUP_ENABLED else None
+        self._signatures = {}
+        self.reused = 0
+        self._parents = {}
+
+    def add(self, chunk: str, extra: Optional[dict] = None):
+        if extra and PARENT_TEXT_KEY in extra:
+            extra = dict(extra)
+            self._parents[section_id(self.source, extra["section_index"])] = extra.pop(PARENT_TEXT_KEY)
+        signature = None
+        if self.dedup:
+            signature = self.dedup.signature(chunk)
+            if self.dedup.is_duplicate(signature):
+                return
+        digest = chunk_hash(chunk)
+        metadata = _chunk_metadata(self.source, self.category, self.count, digest, extra, chunk)
+        self.count += 1
+        pool = self._old_by_hash.get(digest)
+        if pool:
+            chunk_id = pool.pop(0)
+            self._keep_ids.append(chunk_id)
+            self._keep_metas.append(metadata)
+        else:
+            chunk_id = _chunk_id(self.doc_id, digest, self._used_ids)
+            self._add_ids.append(chunk_id)
+            self._add_docs.append(chunk)
+            self._add_metas.append(metadata)
+            self._add_reuse.append(self.dedup.find_in_corpus(signature) if self.dedup else None)
+        if signature is not None:
+            self._signatures[chunk_id] = signature
+
+    @property
+    def batch_ready(self) -> bool:
+        return len(self._add_docs) >= self.batch_size
+
+    def take_batch(self) -> Tuple[List[str], List[str], List[dict], List[Optional[str]]]:
+        """
+        Hands over the buffered new chunks for embedding and writing elsewhere:
+        (ids, documents, metadatas, id of a near-duplicate corpus chunk or None per chunk).
+        """
+        batch = (self._add_ids, self._add_docs, self._add_metas, self._add_reuse)
+        self._add_ids, self._add_docs, self._add_metas, self._add_reuse = [], [], [], []
+        return batch
+
+    def embed(self, documents: List[str], reuse_ids: List[Optional[str]]) -> List[List[float]]:
+        """Embeds a batch, copying the stored embedding of corpus near-duplicates instead."""
+        reusable = self.vector_store.get_embeddings([r for r in reuse_ids if r]) if any(reuse_ids) else {}
+        missing = [i for i, r in enumerate(reuse_ids) if r not in reusable]
+        embeddings = [reusable.get(r) for r in reuse_ids]
+        if missing:
+            for i, embedding in zip(missing, self.vector_store.embed_documents([documents[i] for i in missing])):
+                embeddings[i] = embedding
+        self.reused += len(documents) - len(missing)
+        return embeddings
+
+    def mark_added(self, ids: List[str]):
+        """Records chunks written on this writer's behalf, so abort() can remove them."""
+        self.added_ids.extend(ids)
+
+    def flush(self):
+        """Embeds and writes the buffered new chunks."""
+        if not self._add_docs:
+            return
+        ids, documents, metadatas, reuse_ids = self.take_batch()
+        t0 = time.perf_counter()
+        embeddings = self.embed(documents, reuse_ids)
+        self.vector_store.add_documents(documents=documents, metadatas=metadatas, ids=ids, embeddings=embeddings)
+        self.write_s += time.perf_counter() - t0
+        self.mark_added(ids)
+
+    def finish(self) -> dict:
+        self.flush()
+        if self._keep_ids:
+            self.vector_store.update_metadatas(ids=self._keep_ids, metadatas=self._keep_metas)
+        delete_ids = [chunk_id for pool in self._old_by_hash.values() for chunk_id in pool]
+        # Add before delete so a failure never leaves the document with fewer chunks than before
+        if delete_ids:
+            self.vector_store.delete_documents_by_ids(delete_ids)
+        self._old_by_hash = {}
+
+        deduplicated = self.dedup.dropped if self.dedup else 0
+        if self.dedup:
+            self.vector_store.dedup_index.add(self.source, self.category, self.vector_store.collection_name,
+                                              self._signatures)
+            self.vector_store.dedup_index.record_saved(deduplicated + self.reused)
+
+        self.vector_store.summaries.update_document(self.source)
+        self.vector_store.parents.put(self.source, self._parents)
+        for old in self.old_sources:
+            if old != self.source:
+                self.vector_store.parents.remove(old)
+
+        if self.old_sources:
+            print(f"Replaced {', '.join(self.old_sources)} with {self.source}: "
+                  f"{len(self.added_ids)} embedded, {len(self._keep_ids)} kept, {len(delete_ids)} deleted.")
+        else:
+            print(f"Indexed {self.count} chunks for {self.source} using {self.category} category.")
+        if deduplicated or self.reused:
+            print(f"[Dedup] {self.source}: {deduplicated} near-duplicate chunks dropped, "
+                  f"{self.reused} embeddings reused from the corpus.")
+        return {"chunks": self.count, "embedded": len(self.added_ids) - self.reused,
+                "kept": len(self._keep_ids), "deleted": len(delete_ids),
+                "deduplicated": deduplicated, "reused": self.reused}
+
+    def abort(self):
+        """Removes the chunks this writer added; the previous version stays untouched."""
+        if self.added_ids:
+            self.vector_store.delete_documents_by_ids(self.added_ids)
+            self.added_ids = []
+
+
+def index_document(vector_store, doc_id: str, source: str, category: str, chunks: List[str],
+                   chunk_metadatas: Optional[List[dict]] = None) -> dict:
+    """Indexes all chunks of a new document."""
+    return replace_document(vector_store, doc_id, [], source, category, chunks, chunk_metadatas)
+
+
+def replace_document(vector_store, doc_id: str, old_sources: List[str], source: str,
+                     category: str, chunks: List[str], chunk_metadatas: Optional[List[dict]] = None) -> dict:
+    """
+    Incremental re-ingestion of a new version of a logical document.
+    Chunks whose content hash is already indexed are kept (metadata updated in place),
+    only new chunks are embedded, and chunks that vanished are deleted.
+    """
+    writer = ChunkWriter(vector_store, doc_id, source, category, old_sources)
+    for chunk, extra in zip(chunks, chunk_metadatas or [{} for _ in chunks]):
+        writer.add(chunk, extra)
+        if writer.batch_ready:
+            writer.flush()
+    return writer.finish()
+
+
+class _Failed:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+_DONE = object()
+
+
+async def _iterate_in_thread(make_iter: Callable[[], Iterator], maxsize: int = INGEST_QUEUE_DEPTH) -> AsyncIterator:
+    """
+    Runs a blocking iterator in a worker thread and yields its items on the event loop.
+    The queue between them is bounded, so a slow consumer applies backpressure.
+    """
+    loop = asyncio.get_running_loop()
+    items = asyncio.Queue(maxsize)
+    stopped = False
+
+    def put(item):
+        asyncio.run_coroutine_threadsafe(items.put(item), loop).result()
+
+    def run():
+        try:
+            for item in make_iter():
+                if stopped:
+                    return
+                put(item)
+        except BaseException as e:
+            put(_Failed(e))
+        else:
+            put(_DONE)
+
+    worker = loop.run_in_executor(None, run)
+    try:
+        while True:
+            item = await items.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _Failed):
+                raise item.error
+            yield item
+    finally:
+        # Consumer gave up early: unblock and stop the producer
+        stopped = True
+        while not worker.done():
+            while not items.empty():
+                items.get_nowait()
+            await asyncio.sleep(0.01)
+
+
+async def _describe_blocks(blocks: AsyncIterator, category: str, filename: str, stats: dict) -> AsyncIterator:
+    """Describes images block by block; a few blocks are described ahead while order is kept."""
+    pending = deque()
+
+    async def passthrough(text):
+        return text
+
+    try:
+        async for text, meta in blocks:
+            image_count = count_images(text)
+            if image_count:
+                stats["image_count"] += image_count
+                stats["images"].update(image_refs(text))
+                task = asyncio.create_task(describe_images(text, category, filename))
+            else:
+                task = asyncio.create_task(passthrough(text))
+            pending.append((task, meta))
+            while pending and (len(pending) > DESCRIBE_LOOKAHEAD or pending[0][0].done()):
+                task, block_meta = pending.popleft()
+                yield await task, block_meta
+        while pending:
+            task, block_meta = pending.popleft()
+            yield await task, block_meta
+    finally:
+        for task, _ in pending:
+            task.cancel()
+        await blocks.aclose()
+
+
+async def _chunk_blocks(blocks: AsyncIterator, chunker: DynamicChunker, category: str) -> AsyncIterator:
+    """Feeds described blocks to the (blocking) streaming chunker running in a worker thread."""
+    inbox = queue.Queue(INGEST_QUEUE_DEPTH)
+    stop = threading.Event()
+
+    def send(block):
+        while not stop.is_set():
+            try:
+                inbox.put(block, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def received_blocks():
+        while not stop.is_set():
+            try:
+                block = inbox.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if block is _DONE:
+                return
+            yield block
+
+    async def feed():
+        try:
+            async for block in blocks:
+                await asyncio.to_thread(send, block)
+            await asyncio.to_thread(send, _DONE)
+        finally:
+            await blocks.aclose()
+
+    feeder = asyncio.create_task(feed())
+    chunks = _iterate_in_thread(lambda: chunker.iter_chunks(received_blocks(), category))
+    try:
+        async for item in chunks:
+            yield item
+        await feeder
+    finally:
+        # Unblocks both threads if the consumer stopped early or a stage failed
+        stop.set()
+        feeder.cancel()
+        await chunks.aclose()
+
+
+def stream_document_chunks(filepath: str, category: str, filename: str = "",
+                           chunker: Optional[DynamicChunker] = None, image_dir: str = IMAGES_DIR,
+                           stats: Optional[dict] = None) -> AsyncIterator[Tuple[str, dict]]:
+    """
+    Load -> describe images -> chunk as a pipeline of bounded stages.
+    Yields (chunk, metadata) while later parts of the document are still being read.
+    Tables skip the prose chunkers and come straight from the row-batch reader.
+    """
+    stats = stats if stats is not None else {}
+    stats.setdefault("image_count", 0)
+    stats.setdefault("images", set())
+    if filepath.lower().endswith(TABULAR_EXTENSIONS):
+        return _iterate_in_thread(lambda: iter_table_chunks(filepath))
+    chunker = chunker or DynamicChunker()
+    blocks = _iterate_in_thread(lambda: iter_file_blocks(filepath, image_dir))
+    described = _describe_blocks(blocks, category, filename, stats)
+    return _chunk_blocks(described, chunker, category)
+
+
+async def ingest_document(vector_store, filepath: str, doc_id: str, source: str, category: str,
+                          old_sources: Optional[List[str]] = None, chunker: Optional[DynamicChunker] = None,
+                          image_dir: str = IMAGES_DIR, batch_size: int = INGEST_BATCH_SIZE) -> dict:
+    """
+    Streams a document into the vector store: chunks are embedded and written in
+    batches while parsing, image description and chunking continue upstream.
+    Returns chunk stats, image count, referenced image files and timings. If anything fails (or no chunk was
+    produced) the chunks added so far are removed and old versions are left as they were.
+    """
+    t0 = time.perf_counter()
+    stats = {"image_count": 0, "images": set()}
+    writer = await asyncio.to_thread(ChunkWriter, vector_store, doc_id, source, category, old_sources, batch_size)
+    first_chunk_s = None
+    chunks = stream_document_chunks(filepath, category, source, chunker, image_dir, stats)
+    try:
+        async for chunk, meta in chunks:
+            if first_chunk_s is None:
+                first_chunk_s = time.perf_counter() - t0
+            writer.add(chunk, meta)
+            if writer.batch_ready:
+                # The producer stages keep running while this batch is embedded
+                await asyncio.to_thread(writer.flush)
+        if writer.count:
+            result = await asyncio.to_thread(writer.finish)
+        else:
+            result = {"chunks": 0, "embedded": 0, "kept": 0, "deleted": 0, "deduplicated": 0, "reused": 0}
+    except BaseException:
+        await chunks.aclose()
+        await asyncio.to_thread(writer.abort)
+        raise
+
+    total_s = time.perf_counter() - t0
+    return {
+        **result,
+        "image_count": stats["image_count"],
+        "images": sorted(stats["images"]),
+        "timings": {
+            "first_chunk_s": round(first_chunk_s or 0.0, 3),
+            "write_s": round(writer.write_s, 3),
+            "total_s": round(total_s, 3)
+        }
+    }
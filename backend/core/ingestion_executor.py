@@ -0,0 +1,232 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+from .loader import iter_file_blocks
+from .tabular_loader import iter_table_chunks, TABULAR_EXTENSIONS
+from .advanced_chunker import DynamicChunker
+from .image_store import image_refs
+from .ingestion import ChunkWriter, describe_images, count_images, ingest_document, IMAGES_DIR, INGEST_BATCH_SIZE
+
+# Processes used for parsing and chunking
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", os.cpu_count() or 1))
+# Documents whose images are being described at the same time
+INGEST_DESCRIBE_CONCURRENCY = int(os.getenv("INGEST_DESCRIBE_CONCURRENCY", 2))
+# Embedding batches in flight across all documents
+INGEST_EMBED_CONCURRENCY = int(os.getenv("INGEST_EMBED_CONCURRENCY", 4))
+# Chunks per Chroma write; embedded batches from several documents are coalesced up to this
+INGEST_WRITE_BATCH = int(os.getenv("INGEST_WRITE_BATCH", 256))
+# Files at least this big go through the in-process streaming pipeline instead of a worker
+INGEST_STREAM_MIN_BYTES = int(os.getenv("INGEST_STREAM_MIN_BYTES", 20 * 1024 * 1024))
+
+
+def _chunk_parsed_blocks(blocks: List[Tuple[str, dict]], category: str) -> List[Tuple[str, dict]]:
+    """Worker: chunks parsed (and described) blocks."""
+    return list(DynamicChunker().iter_chunks(blocks, category))
+
+
+def _parse_document(filepath: str, category: str, image_dir: str, pdf_workers: int = 1) -> dict:
+    """
+    Worker: parses a file into blocks. Without images the blocks are chunked right
+    away in the same worker; otherwise they go back to be described first.
+    pdf_workers sizes the PDF page pool this worker may start itself.
+    """
+    if filepath.lower().endswith(TABULAR_EXTENSIONS):
+        return {"chunks": list(iter_table_chunks(filepath)), "blocks": None, "image_count": 0, "images": []}
+    blocks = list(iter_file_blocks(filepath, image_dir, pdf_workers=pdf_workers))
+    image_count = sum(count_images(text) for text, _ in blocks)
+    if image_count:
+        images = sorted({name for text, _ in blocks for name in image_refs(text)})
+        return {"chunks": None, "blocks": blocks, "image_count": image_count, "images": images}
+    return {"chunks": _chunk_parsed_blocks(blocks, category), "blocks": None, "image_count": 0, "images": []}
+
+
+def throughput(documents: int, elapsed: float) -> dict:
+    return {
+        "documents": documents,
+        "elapsed_s": round(elapsed, 3),
+        "docs_per_min": round(documents / elapsed * 60, 2) if elapsed > 0 else 0.0
+    }
+
+
+class IngestionExecutor:
+    """
+    Pipelined ingestion of many documents at once.
+    Parsing and chunking run in a process pool, image description and embedding are
+    bounded async stages, and embedded batches are coalesced into few Chroma writes by
+    a single writer. Different documents move through different stages concurrently.
+    """
+    def __init__(self, vector_store, image_dir: str = IMAGES_DIR, max_workers: int = INGEST_WORKERS,
+                 batch_size: int = INGEST_BATCH_SIZE):
+        self.vector_store = vector_store
+        self.image_dir = image_dir
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self._pool = None
+        # Cores left per worker for a large PDF's own page pool (serial when the workers use them all)
+        self._pdf_workers = max(1, (os.cpu_count() or 1) // max_workers)
+        self._parse_slots = asyncio.Semaphore(max_workers * 2)
+        self._describe_slots = asyncio.Semaphore(INGEST_DESCRIBE_CONCURRENCY)
+        self._embed_slots = asyncio.Semaphore(INGEST_EMBED_CONCURRENCY)
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    async def ingest_many(self, jobs: List[dict]) -> Tuple[List[dict], dict]:
+        """
+        jobs: dicts with filepath, doc_id, source, category and optional old_sources.
+        Returns one result per job, in order (ingest stats, or {"error": ...}),
+        and the batch throughput.
+        """
+        t0 = time.perf_counter()
+        writes = asyncio.Queue()
+        writer_task = asyncio.create_task(self._write_loop(writes))
+        try:
+            results = await asyncio.gather(*(self._run_job(job, writes) for job in jobs))
+        finally:
+            await writes.put(None)
+            await writer_task
+
+        stats = throughput(sum(1 for r in results if r.get("chunks")), time.perf_counter() - t0)
+        print(f"[Ingest] {stats['documents']}/{len(jobs)} documents in {stats['elapsed_s']}s "
+              f"({stats['docs_per_min']} docs/min)")
+        return results, stats
+
+    async def _describe(self, blocks: List[Tuple[str, dict]], category: str, source: str) -> List[Tuple[str, dict]]:
+        async def describe(text):
+            return await describe_images(text, category, source) if count_images(text) else text
+        texts = await asyncio.gather(*(describe(text) for text, _ in blocks))
+        return [(text, meta) for text, (_, meta) in zip(texts, blocks)]
+
+    async def _embed_and_write(self, writer: ChunkWriter, batch: tuple, writes: asyncio.Queue):
+        ids, documents, metadatas, reuse_ids = batch
+        async with self._embed_slots:
+            embeddings = await asyncio.to_thread(writer.embed, documents, reuse_ids)
+        written = asyncio.get_running_loop().create_future()
+        await writes.put((ids, documents, metadatas, embeddings, written))
+        await written
+        writer.mark_added(ids)
+
+    async def _write_loop(self, writes: asyncio.Queue):
+        """Single writer: drains queued batches into as few Chroma writes as possible."""
+        done = False
+        while not done:
+            item = await writes.get()
+            if item is None:
+                return
+            batch, size = [item], len(item[0])
+            while size < INGEST_WRITE_BATCH and not writes.empty():
+                item = writes.get_nowait()
+                if item is None:
+                    done = True
+                    break
+                batch.append(item)
+                size += len(item[0])
+            try:
+                await asyncio.to_thread(
+                    self.vector_store.add_documents,
+                    documents=[d for b in batch for d in b[1]],
+                    metadatas=[m for b in batch for m in b[2]],
+                    ids=[i for b in batch for i in b[0]],
+                    embeddings=[e for b in batch for e in b[3]]
+                )
+                for b in batch:
+                    b[4].set_result(None)
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0][4].set_exception(e)
+                    continue
+                # One bad batch must not fail the other documents written with it
+                for ids, documents, metadatas, embeddings, written in batch:
+                    try:
+                        await asyncio.to_thread(self.vector_store.add_documents, documents=documents,
+                                                metadatas=metadatas, ids=ids, embeddings=embeddings)
+                        written.set_result(None)
+                    except Exception as single_error:
+                        written.set_exception(single_error)
+
+    async def _run_job(self, job: dict, writes: asyncio.Queue) -> dict:
+        filepath, source, category = job["filepath"], job["source"], job["category"]
+        old_sources = job.get("old_sources") or []
+        t0 = time.perf_counter()
+        try:
+            if os.path.getsize(filepath) >= INGEST_STREAM_MIN_BYTES:
+                # Too big to ship between processes: stream it with bounded memory instead
+                return await ingest_document(self.vector_store, filepath, job["doc_id"], source, category,
+                                             old_sources=old_sources, image_dir=self.image_dir,
+                                             batch_size=self.batch_size)
+
+            loop = asyncio.get_running_loop()
+            async with self._parse_slots:
+                parsed = await loop.run_in_executor(self.pool, _parse_document, filepath, category, self.image_dir,
+                                                    self._pdf_workers)
+            t_parse = time.perf_counter()
+
+            chunks = parsed["chunks"]
+            t_describe = t_chunk = t_parse
+            if chunks is None:
+                async with self._describe_slots:
+                    blocks = await self._describe(parsed["blocks"], category, source)
+                t_describe = time.perf_counter()
+                async with self._parse_slots:
+                    chunks = await loop.run_in_executor(self.pool, _chunk_parsed_blocks, blocks, category)
+                t_chunk = time.perf_counter()
+
+            result = {"chunks": 0, "embedded": 0, "kept": 0, "deleted": 0, "deduplicated": 0, "reused": 0}
+            if chunks:
+                result = await self._write_chunks(job, chunks, writes)
+            t_end = time.perf_counter()
+            return {
+                **result,
+                "image_count": parsed["image_count"],
+                "images": parsed["images"],
+                "timings": {
+                    "parse_s": round(t_parse - t0, 3),
+                    "describe_s": round(t_describe - t_parse, 3),
+                    "chunk_s": round(t_chunk - t_describe, 3),
+                    "index_s": round(t_end - t_chunk, 3),
+                    "total_s": round(t_end - t0, 3)
+                }
+            }
+        except Exception as e:
+            print(f"[Ingest] Failed to ingest {source}: {e}")
+            return {"error": str(e)}
+
+    async def _write_chunks(self, job: dict, chunks: List[Tuple[str, dict]], writes: asyncio.Queue) -> dict:
+        writer = await asyncio.to_thread(ChunkWriter, self.vector_store, job["doc_id"], job["source"],
+                                         job["category"], job.get("old_sources"), self.batch_size)
+        pending = []
+        remaining = iter(chunks)
+
+        def fill():
+            # MinHash signatures and corpus lookups per chunk: run in a thread, one batch at a time
+            for chunk, meta in remaining:
+                writer.add(chunk, meta)
+                if writer.batch_ready:
+                    return writer.take_batch()
+            return writer.take_batch()
+
+        try:
+            while True:
+                batch = await asyncio.to_thread(fill)
+                if not batch[0]:
+                    break
+                pending.append(asyncio.create_task(self._embed_and_write(writer, batch, writes)))
+            for outcome in await asyncio.gather(*pending, return_exceptions=True):
+                if isinstance(outcome, BaseException):
+                    raise outcome
+            # Keeps and deletes only once every new chunk is written
+            return await asyncio.to_thread(writer.finish)
+        except BaseException:
+            await asyncio.gather(*pending, return_exceptions=True)
+            await asyncio.to_thread(writer.abort)
+            raise
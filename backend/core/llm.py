@@ -3,10 +3,14 @@ import time
 import random
 from abc import ABC, abstractmethod
 from dotenv import load_dotenv
+from .embedding_reduction import native_dimension, supports_output_dimension
 
 load_dotenv()
 
 class BaseLLM(ABC):
+    # Embedding width to request from the provider (None: the model's own); set by the vector store
+    output_dimension = None
+
     @property
     @abstractmethod
     def model_name(self) -> str:
@@ -20,6 +24,13 @@ class BaseLLM(ABC):
     def get_embedding(self, text: str, task_type: str = "retrieval_document") -> list[float]:
         pass
 
+    def _failure_dimension(self, default: int) -> int:
+        """Width of the zero vectors returned for a failed embedding: what a success would have returned."""
+        model = getattr(self, "embedding_model", None)
+        if self.output_dimension and supports_output_dimension(model):
+            return self.output_dimension
+        return native_dimension(model) or default
+
 class GoogleLLM(BaseLLM):
     def __init__(self, model_name: str, temperature: float, max_tokens: int):
         from google import genai
@@ -87,7 +98,9 @@ class GoogleLLM(BaseLLM):
             input_texts = text if is_batch else [text]
             
             # task_type name varies in modern SDK: RETRIEVAL_DOCUMENT vs retrieval_document
-            config = types.EmbedContentConfig(task_type=task_type.upper())
+            # Supporting models are cut to output_dimensionality server-side (None: full width)
+            reduced = self.output_dimension if supports_output_dimension(self.embedding_model) else None
+            config = types.EmbedContentConfig(task_type=task_type.upper(), output_dimensionality=reduced)
             
             result = self._retry_on_429(
                 self.client.models.embed_content,
@@ -103,11 +116,7 @@ class GoogleLLM(BaseLLM):
 
         except Exception as e:
             print(f"CRITICAL: Embedding Failed for model {self.embedding_model}: {e}")
-            # HARDCODED DIMENSIONS:
-            # gemini-embedding-001 -> 3072
-            # text-embedding-004 -> 768
-            dim = 3072 if "gemini-embedding-001" in str(self.embedding_model) else 768
-            
+            dim = self._failure_dimension(768)
             if isinstance(text, list):
                 return [[0.0] * dim for _ in text]
             return [0.0] * dim
@@ -167,9 +176,13 @@ class OpenAILLM(BaseLLM):
             is_batch = isinstance(text, list)
             input_texts = text if is_batch else [text]
             
+            kwargs = {}
+            if self.output_dimension and supports_output_dimension(self.embedding_model):
+                kwargs["dimensions"] = self.output_dimension
             response = self.client.embeddings.create(
                 input=input_texts,
-                model=self.embedding_model
+                model=self.embedding_model,
+                **kwargs
             )
             
             embeddings = [data.embedding for data in response.data]
@@ -177,8 +190,7 @@ class OpenAILLM(BaseLLM):
             
         except Exception as e:
             print(f"OpenAI Embedding Error: {e}")
-            # text-embedding-3-small is 1536, text-embedding-ada-002 is 1536
-            dim = 1536 
+            dim = self._failure_dimension(1536)
             if isinstance(text, list):
                 return [[0.0] * dim for _ in text]
             return [0.0] * dim
@@ -191,7 +203,7 @@ class NoLLM(BaseLLM):
     def generate_content(self, prompt: str) -> str:
         return "No valid LLM API key found. Please configure OpenAI or Gemini in the .env file."
     def get_embedding(self, text: str, task_type: str = "retrieval_document") -> list[float]:
-        return [0.0] * 3072
+        return [0.0] * (self.output_dimension or 3072)
 
 class FallbackLLM(BaseLLM):
     def __init__(self, primary: BaseLLM, secondary: BaseLLM):
@@ -3,7 +3,11 @@ import shutil
 import uuid
 import time
 import traceback
-from pypdf import PdfReader
+from typing import Iterator, Tuple
+from .docx_loader import load_docx_with_structure, iter_docx_markdown
+from .pdf_loader import load_pdf, iter_pdf_pages
+from .tabular_loader import load_table
+from .image_store import ImageStore
 try:
     from bs4 import BeautifulSoup
 except ImportError:
@@ -21,14 +25,10 @@ def load_file(filepath: str) -> str:
             return f.read()
             
     elif ext == '.pdf':
-        text = ""
         try:
-            reader = PdfReader(filepath)
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
+            return load_pdf(filepath)
         except Exception as e:
             raise RuntimeError(f"Error reading PDF {filepath}: {e}")
-        return text
 
     elif ext == '.docx':
         try:
@@ -72,17 +72,13 @@ def load_file(filepath: str) -> str:
     
     elif ext == '.csv':
         try:
-            import pandas as pd
-            df = pd.read_csv(filepath)
-            return df.to_string()
+            return load_table(filepath)
         except Exception as e:
             raise RuntimeError(f"Error reading CSV {filepath}: {e}")
     
     elif ext == '.xlsx' or ext == '.xls':
         try:
-            import pandas as pd
-            df = pd.read_excel(filepath)
-            return df.to_string()
+            return load_table(filepath)
         except Exception as e:
             raise RuntimeError(f"Error reading Excel {filepath}: {e}")
     
@@ -103,141 +99,205 @@ def load_file_with_structure(filepath: str, output_image_dir: str = None) -> str
     """
     Loads text from a file preserving structure and extracting images (for .doc/.docx).
     Returns Markdown-formatted text.
+    .docx is read directly from its OOXML package; only legacy binary .doc needs Word COM.
     """
     ext = os.path.splitext(filepath)[1].lower()
     
-    if ext in ['.doc', '.docx']:
-        import win32com.client
-        import pythoncom
-        
-        if BeautifulSoup is None:
-            raise ImportError("The 'beautifulsoup4' library is required for structure-aware loading. Please run: pip install beautifulsoup4")
-
-        temp_html_path = filepath + ".temp.html"
-        abs_path = os.path.abspath(filepath)
-        abs_html_path = os.path.abspath(temp_html_path)
-        
+    if ext == '.docx':
         try:
-            pythoncom.CoInitialize()
-            word = None
-            try:
-                try:
-                    word = win32com.client.DispatchEx("Word.Application")
-                except:
-                    word = win32com.client.Dispatch("Word.Application")
-                
-                word.Visible = False
-                word.DisplayAlerts = 0 
-                
-                # Retry loop for 'Call rejected by callee'
-                doc = None
-                for i in range(5):
-                    try:
-                        doc = word.Documents.Open(abs_path, ReadOnly=True)
-                        break
-                    except Exception as e:
-                        if "rejected by callee" in str(e).lower() and i < 4:
-                            time.sleep(1)
-                            continue
-                        raise e
-
-                doc.SaveAs2(abs_html_path, FileFormat=10) 
-                doc.Close(False)
-                word.Quit()
-            except Exception as com_err:
-                if word:
-                    try: word.Quit()
-                    except: pass
-                raise RuntimeError(f"Word COM extraction failed: {com_err}")
-            finally:
-                pythoncom.CoUninitialize()
+            return load_docx_with_structure(filepath, output_image_dir=output_image_dir)
+        except Exception as e:
+            traceback.print_exc()
+            raise RuntimeError(f"Error processing document structure: {e}")
+    
+    elif ext == '.doc':
+        return _load_doc_via_word(filepath, output_image_dir)
+
+    else:
+        return load_file(filepath)
 
-            # 2. Parse HTML
-            if not os.path.exists(abs_html_path):
-                raise RuntimeError("HTML conversion failed - output file missing.")
-                
-            try:
-                with open(abs_html_path, 'r', encoding='utf-8') as f:
-                    soup = BeautifulSoup(f, 'html.parser')
-            except:
-                with open(abs_html_path, 'r', encoding='latin-1', errors='replace') as f:
-                    soup = BeautifulSoup(f, 'html.parser')
-                
-            markdown_content = ""
-            
-            # Process paragraphs, headers, and tables
-            for element in soup.find_all(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'table', 'ul', 'ol']):
-                text = element.get_text().strip()
-                if not text and not element.find('img'): continue
-                
-                tag_name = element.name.lower()
-                prefix = ""
-                
-                if tag_name.startswith('h') and len(tag_name) == 2:
-                    prefix = "#" * int(tag_name[1]) + " "
-                elif tag_name == 'table':
-                    # Simple table to markdown
-                    md_table = "\n"
-                    rows = element.find_all('tr')
-                    for i, row in enumerate(rows):
-                        cells = row.find_all(['td', 'th'])
-                        row_text = "| " + " | ".join([c.get_text().strip() for c in cells]) + " |"
-                        md_table += row_text + "\n"
-                        if i == 0: # Add separator after header row
-                            md_table += "| " + " | ".join(["---"] * len(cells)) + " |\n"
-                    markdown_content += md_table + "\n"
-                    continue # Skip general text processing for tables
-                elif tag_name in ['ul', 'ol']:
-                    for li in element.find_all('li'):
-                        bullet = "* " if tag_name == 'ul' else "1. "
-                        markdown_content += f"{bullet}{li.get_text().strip()}\n"
-                    markdown_content += "\n"
-                    continue
-                else:
-                    classes = element.get('class', [])
-                    if classes:
-                        cls_str = " ".join(classes).lower()
-                        if "heading1" in cls_str or "heading 1" in cls_str: prefix = "# "
-                        elif "heading2" in cls_str or "heading 2" in cls_str: prefix = "## "
-                        elif "heading3" in cls_str or "heading 3" in cls_str: prefix = "### "
-                
-                # Extract images
-                import urllib.parse
-                images = element.find_all('img')
-                for img in images:
-                    src = img.get('src')
-                    if src and output_image_dir:
-                        # Decode URL encoded src (e.g. %20 -> space)
-                        src = urllib.parse.unquote(src)
-                        
-                        img_abs_path = os.path.join(os.path.dirname(abs_html_path), src)
-                        
-                        # Fallback: sometimes Word exports images to a fixed 'document_files' folder 
-                        # regardless of HTML filename if it's not well-formed
-                        if not os.path.exists(img_abs_path):
-                             print(f"Image not found at {img_abs_path}")
-                             
-                        if os.path.exists(img_abs_path):
-                             new_img_name = f"{os.path.basename(filepath)}_{os.path.basename(img_abs_path)}"
-                             dest_path = os.path.join(output_image_dir, new_img_name)
-                             shutil.copy2(img_abs_path, dest_path)
-                             markdown_content += f"\n![Image](/static/images/{new_img_name})\n"
-                
-                if text and tag_name not in ['table', 'ul', 'ol']:
-                    markdown_content += f"\n{prefix}{text}\n"
 
-            return markdown_content
+def _iter_text_paragraphs(filepath: str) -> Iterator[str]:
+    # Paragraph-sized blocks; joined back together they reproduce the file exactly
+    with open(filepath, 'r', encoding='utf-8') as f:
+        block = []
+        for line in f:
+            block.append(line)
+            if not line.strip():
+                yield "".join(block)
+                block = []
+        if block:
+            yield "".join(block)
 
+
+def iter_file_blocks(filepath: str, output_image_dir: str = None,
+                     pdf_workers: int = None) -> Iterator[Tuple[str, dict]]:
+    """
+    Streams a document as (text block, metadata) pairs instead of one big string.
+    .docx yields markdown blocks, .pdf yields one block per non-empty page (metadata
+    carries 'page'), .txt yields paragraphs. Other types come through as a single block.
+    pdf_workers caps the page extraction pool of large PDFs (1: serial, None: every core).
+    """
+    if not os.path.exists(filepath):
+        raise FileNotFoundError(f"File not found: {filepath}")
+
+    ext = os.path.splitext(filepath)[1].lower()
+
+    if ext == '.docx':
+        try:
+            for block in iter_docx_markdown(filepath, output_image_dir=output_image_dir):
+                yield block, {}
         except Exception as e:
             traceback.print_exc()
             raise RuntimeError(f"Error processing document structure: {e}")
-        finally:
-            # Cleanup temp files
-            if os.path.exists(abs_html_path):
-                os.remove(abs_html_path)
-            possible_dir = abs_html_path.rsplit('.', 1)[0] + "_files"
-            if os.path.exists(possible_dir):
-                shutil.rmtree(possible_dir)
+
+    elif ext == '.pdf':
+        for page_number, page_text in iter_pdf_pages(filepath, max_workers=pdf_workers):
+            if page_text.strip():
+                yield page_text + "\n", {"page": page_number}
+
+    elif ext == '.txt':
+        for block in _iter_text_paragraphs(filepath):
+            yield block, {}
+
+    elif ext == '.doc':
+        yield load_file_with_structure(filepath, output_image_dir=output_image_dir), {}
 
     else:
-        return load_file(filepath)
+        yield load_file(filepath), {}
+
+
+def _load_doc_via_word(filepath: str, output_image_dir: str = None) -> str:
+    """
+    Legacy path: drives Microsoft Word through COM to save the document as HTML,
+    then parses the HTML. Needs Windows with Word installed.
+    """
+    import win32com.client
+    import pythoncom
+
+    if BeautifulSoup is None:
+        raise ImportError("The 'beautifulsoup4' library is required for structure-aware loading. Please run: pip install beautifulsoup4")
+
+    temp_html_path = filepath + ".temp.html"
+    abs_path = os.path.abspath(filepath)
+    abs_html_path = os.path.abspath(temp_html_path)
+
+    try:
+        pythoncom.CoInitialize()
+        word = None
+        try:
+            try:
+                word = win32com.client.DispatchEx("Word.Application")
+            except:
+                word = win32com.client.Dispatch("Word.Application")
+
+            word.Visible = False
+            word.DisplayAlerts = 0 
+
+            # Retry loop for 'Call rejected by callee'
+            doc = None
+            for i in range(5):
+                try:
+                    doc = word.Documents.Open(abs_path, ReadOnly=True)
+                    break
+                except Exception as e:
+                    if "rejected by callee" in str(e).lower() and i < 4:
+                        time.sleep(1)
+                        continue
+                    raise e
+
+            doc.SaveAs2(abs_html_path, FileFormat=10) 
+            doc.Close(False)
+            word.Quit()
+        except Exception as com_err:
+            if word:
+                try: word.Quit()
+                except: pass
+            raise RuntimeError(f"Word COM extraction failed: {com_err}")
+        finally:
+            pythoncom.CoUninitialize()
+
+        # 2. Parse HTML
+        if not os.path.exists(abs_html_path):
+            raise RuntimeError("HTML conversion failed - output file missing.")
+
+        try:
+            with open(abs_html_path, 'r', encoding='utf-8') as f:
+                soup = BeautifulSoup(f, 'html.parser')
+        except:
+            with open(abs_html_path, 'r', encoding='latin-1', errors='replace') as f:
+                soup = BeautifulSoup(f, 'html.parser')
+
+        markdown_content = ""
+
+        # Process paragraphs, headers, and tables
+        for element in soup.find_all(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'table', 'ul', 'ol']):
+            text = element.get_text().strip()
+            if not text and not element.find('img'): continue
+
+            tag_name = element.name.lower()
+            prefix = ""
+
+            if tag_name.startswith('h') and len(tag_name) == 2:
+                prefix = "#" * int(tag_name[1]) + " "
+            elif tag_name == 'table':
+                # Simple table to markdown
+                md_table = "\n"
+                rows = element.find_all('tr')
+                for i, row in enumerate(rows):
+                    cells = row.find_all(['td', 'th'])
+                    row_text = "| " + " | ".join([c.get_text().strip() for c in cells]) + " |"
+                    md_table += row_text + "\n"
+                    if i == 0: # Add separator after header row
+                        md_table += "| " + " | ".join(["---"] * len(cells)) + " |\n"
+                markdown_content += md_table + "\n"
+                continue # Skip general text processing for tables
+            elif tag_name in ['ul', 'ol']:
+                for li in element.find_all('li'):
+                    bullet = "* " if tag_name == 'ul' else "1. "
+                    markdown_content += f"{bullet}{li.get_text().strip()}\n"
+                markdown_content += "\n"
+                continue
+            else:
+                classes = element.get('class', [])
+                if classes:
+                    cls_str = " ".join(classes).lower()
+                    if "heading1" in cls_str or "heading 1" in cls_str: prefix = "# "
+                    elif "heading2" in cls_str or "heading 2" in cls_str: prefix = "## "
+                    elif "heading3" in cls_str or "heading 3" in cls_str: prefix = "### "
+
+            # Extract images
+            import urllib.parse
+            images = element.find_all('img')
+            for img in images:
+                src = img.get('src')
+                if src and output_image_dir:
+                    # Decode URL encoded src (e.g. %20 -> space)
+                    src = urllib.parse.unquote(src)
+
+                    img_abs_path = os.path.join(os.path.dirname(abs_html_path), src)
+
+                    # Fallback: sometimes Word exports images to a fixed 'document_files' folder 
+                    # regardless of HTML filename if it's not well-formed
+                    if not os.path.exists(img_abs_path):
+                         print(f"Image not found at {img_abs_path}")
+
+                    if os.path.exists(img_abs_path):
+                         new_img_name = ImageStore(output_image_dir).put_file(img_abs_path)
+                         markdown_content += f"\n![Image](/static/images/{new_img_name})\n"
+
+            if text and tag_name not in ['table', 'ul', 'ol']:
+                markdown_content += f"\n{prefix}{text}\n"
+
+        return markdown_content
+
+    except Exception as e:
+        traceback.print_exc()
+        raise RuntimeError(f"Error processing document structure: {e}")
+    finally:
+        # Cleanup temp files
+        if os.path.exists(abs_html_path):
+            os.remove(abs_html_path)
+        possible_dir = abs_html_path.rsplit('.', 1)[0] + "_files"
+        if os.path.exists(possible_dir):
+            shutil.rmtree(possible_dir)
@@ -0,0 +1,141 @@
+import json
+import os
+import threading
+from typing import Dict, List, Tuple
+from .lru_cache import LRUCache
+
+PARENT_STORE_DIR = os.getenv("PARENT_STORE_DIR", "parent_sections")
+# Parent sections of recently retrieved documents kept in memory
+PARENT_CACHE_MB = int(os.getenv("PARENT_CACHE_MB", 32))
+# Parent sections handed to the model per search
+SMALL_TO_BIG_MAX_PARENTS = int(os.getenv("SMALL_TO_BIG_MAX_PARENTS", 3))
+# Longer parent sections are cut to this many characters around the matched child
+PARENT_MAX_CHARS = int(os.getenv("PARENT_MAX_CHARS", 4000))
+
+
+def section_id(source: str, section_index: int) -> str:
+    """Section ids are unique across the corpus: <source>#<ordinal of the section in the document>."""
+    return f"{source}#{section_index}"
+
+
+def _source_of(section: str) -> str:
+    return section.rsplit("#", 1)[0]
+
+
+def parent_window(parent: str, child: str, max_chars: int = PARENT_MAX_CHARS) -> str:
+    """The parent, or max_chars of it centred on the child (under the section header) if longer."""
+    if len(parent) <= max_chars:
+        return parent
+    header, _, body = child.partition("\n\n")
+    pos = max(parent.find(body[:200]), 0)
+    start = max(0, min(pos - (max_chars - len(body)) // 2, len(parent) - max_chars))
+    window = parent[start:start + max_chars]
+    return window if start == 0 else f"{header}\n\n...{window}"
+
+
+def expand_results(results: List[Tuple[str, dict]], parents: Dict[str, str], max_parents: int = SMALL_TO_BIG_MAX_PARENTS,
+                   max_results: int = 5) -> List[Tuple[str, dict]]:
+    """
+    Small-to-big: (document, metadata) search results whose section has a parent are
+    replaced by that parent, each section once, at the rank of its best child, up to
+    max_parents sections. Chunks without a parent are kept as they are.
+    """
+    if not parents:
+        return results[:max_results]
+    expanded, seen = [], set()
+    for doc, meta in results:
+        section = meta.get("section_id")
+        if section in parents:
+            if section in seen or len(seen) >= max_parents:
+                continue
+            seen.add(section)
+            # The parent's images are read from its text
+            expanded.append((parent_window(parents[section], doc), {k: v for k, v in meta.items() if k != "images"}))
+        else:
+            expanded.append((doc, meta))
+        if len(expanded) >= max_results:
+            break
+    return expanded
+
+
+class ParentStore:
+    """
+    Full text of the sections that small child chunks were cut from (small-to-big retrieval),
+    one JSON file per document under PARENT_STORE_DIR. Documents are loaded whole into an
+    LRU on first use, so expanding a search result to its parent costs one stat() after that
+    (a file rewritten by another process, e.g. an online migration, is read again).
+    """
+    def __init__(self, directory: str = PARENT_STORE_DIR, cache_mb: int = PARENT_CACHE_MB):
+        self.directory = directory
+        self._cache = LRUCache(cache_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+
+    def _path(self, source: str) -> str:
+        return os.path.join(self.directory, f"{source}.json")
+
+    def put(self, source: str, sections: Dict[str, str]):
+        """Replaces a document's parent sections (an empty dict removes them)."""
+        if not sections:
+            self.remove(source)
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(source)
+        with self._lock:
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(sections, f)
+            os.replace(path + ".tmp", path)
+            self._cache.put(source, (os.stat(path).st_mtime_ns, sections), sum(len(t) for t in sections.values()))
+
+    def _load(self, source: str) -> Dict[str, str]:
+        path = self._path(source)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        cached = self._cache.get(source)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                sections = json.load(f)
+        except Exception as e:
+            print(f"[ParentStore] Error loading parents of {source}: {e}")
+            return {}
+        self._cache.put(source, (mtime, sections), sum(len(t) for t in sections.values()))
+        return sections
+
+    def get_sections(self, source: str) -> Dict[str, str]:
+        """Every parent section of one document (empty if it has none)."""
+        return dict(self._load(source))
+
+    def get_many(self, section_ids: List[str]) -> Dict[str, str]:
+        """Parent text per section id; sections without a stored parent are left out."""
+        parents = {}
+        for section in dict.fromkeys(section_ids):
+            text = self._load(_source_of(section)).get(section)
+            if text is not None:
+                parents[section] = text
+        return parents
+
+    def remove(self, source: str):
+        with self._lock:
+            try:
+                os.remove(self._path(source))
+            except FileNotFoundError:
+                pass
+
+    def sources(self) -> set:
+        """Documents with stored parent sections."""
+        if not os.path.exists(self.directory):
+            return set()
+        return {name[:-len(".json")] for name in os.listdir(self.directory) if name.endswith(".json")}
+
+    def clear(self):
+        with self._lock:
+            if os.path.exists(self.directory):
+                for name in os.listdir(self.directory):
+                    os.remove(os.path.join(self.directory, name))
+            self._cache.clear()
+
+    def get_stats(self) -> dict:
+        return self._cache.get_stats()
@@ -0,0 +1,60 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Tuple
+from pypdf import PdfReader
+
+# Pages extracted per worker task; small enough to keep workers busy, big enough to amortise opening the file
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", 16))
+# Below this many pages a process pool costs more than it saves
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 32))
+
+
+def _extract_page_range(filepath: str, start: int, end: int) -> List[str]:
+    """Worker: extracts text of pages [start, end). Each worker opens the file itself."""
+    reader = PdfReader(filepath)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def iter_pdf_pages(filepath: str, max_workers: int = None,
+                   pages_per_task: int = PDF_PAGES_PER_TASK) -> Iterator[Tuple[int, str]]:
+    """
+    Yields (page_number, text) in page order, 1-based.
+    Page ranges are extracted across a process pool; only a bounded window of ranges
+    is in flight at once, so peak memory does not grow with the page count.
+    """
+    try:
+        num_pages = len(PdfReader(filepath).pages)
+    except Exception as e:
+        raise RuntimeError(f"Error reading PDF {filepath}: {e}")
+
+    if num_pages < PDF_PARALLEL_MIN_PAGES or max_workers == 1:
+        reader = PdfReader(filepath)
+        for i, page in enumerate(reader.pages):
+            yield i + 1, page.extract_text() or ""
+        return
+
+    workers = max_workers or os.cpu_count() or 1
+    ranges = iter([(s, min(s + pages_per_task, num_pages)) for s in range(0, num_pages, pages_per_task)])
+    window = workers * 2
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for start, end in ranges:
+            pending.append((start, pool.submit(_extract_page_range, filepath, start, end)))
+            if len(pending) >= window:
+                break
+
+        while pending:
+            start, future = pending.popleft()
+            texts = future.result()
+            next_range = next(ranges, None)
+            if next_range:
+                pending.append((next_range[0], pool.submit(_extract_page_range, filepath, *next_range)))
+            for offset, text in enumerate(texts):
+                yield start + offset + 1, text
+
+
+def load_pdf(filepath: str, max_workers: int = None) -> str:
+    """Loads the full text of a PDF, one page per line block."""
+    return "".join(text + "\n" for _, text in iter_pdf_pages(filepath, max_workers=max_workers))
@@ -0,0 +1,151 @@
+import asyncio
+import os
+import time
+from typing import List, Optional, Tuple
+
+# Chunks indexed while the embedding provider failed carry this metadata flag (and a zero vector)
+PENDING_KEY = "pending_embedding"
+# Interval between re-embedding passes; doubled (up to 16x) while the provider keeps failing
+REEMBED_INTERVAL_SECONDS = float(os.getenv("REEMBED_INTERVAL_SECONDS", 120))
+REEMBED_BATCH = int(os.getenv("REEMBED_BATCH", 64))
+# Seconds without live traffic before a pass spends provider quota
+REEMBED_IDLE_SECONDS = float(os.getenv("REEMBED_IDLE_SECONDS", 10))
+MAX_BACKOFF = 16
+
+
+def is_zero_embedding(embedding) -> bool:
+    # Embedding failures come back from the providers' wrappers as zero vectors
+    return not any(embedding)
+
+
+def flag_pending(metadatas: List[dict], embeddings: list) -> Tuple[List[dict], int]:
+    """Marks the metadata of chunks whose embedding is a zero vector. Returns (metadatas, chunks marked)."""
+    flagged, pending = [], 0
+    for metadata, embedding in zip(metadatas, embeddings):
+        if is_zero_embedding(embedding):
+            metadata = {**(metadata or {}), PENDING_KEY: True}
+            pending += 1
+        flagged.append(metadata)
+    return flagged, pending
+
+
+def exclude_pending(where: Optional[dict]) -> dict:
+    # $ne also matches chunks without the key, i.e. every chunk indexed normally
+    clause = {PENDING_KEY: {"$ne": True}}
+    return {"$and": [where, clause]} if where else clause
+
+
+class PendingEmbeddings:
+    """
+    Chunks of a vector store's serving index that were stored with a zero vector because
+    the provider failed. They stay out of search (a where clause, only added while any
+    exist) until reembed() gives them real vectors. Counts are kept per index in memory,
+    scanned from the chunk metadata on first use.
+    """
+    def __init__(self, vector_store):
+        self.vector_store = vector_store
+        self._counts = {}
+
+    def _scan(self) -> int:
+        return sum(
+            len(collection.get(where={PENDING_KEY: True}, include=[])["ids"] or [])
+            for collection in self.vector_store.physical_collections()
+        )
+
+    def count(self) -> int:
+        name = self.vector_store.collection_name
+        if self._counts.get(name) is None:
+            try:
+                self._counts[name] = self._scan()
+            except Exception as e:
+                print(f"[Pending] Error counting pending chunks: {e}")
+                return 0
+        return self._counts[name]
+
+    def note(self, added: int):
+        """Records chunks just written with a zero vector."""
+        name = self.vector_store.collection_name
+        if self._counts.get(name) is not None:
+            self._counts[name] += added
+
+    def invalidate(self):
+        self._counts.clear()
+
+    def where(self, filter_metadata: Optional[dict] = None) -> Optional[dict]:
+        """The search filter, excluding pending chunks when there are any."""
+        return exclude_pending(filter_metadata) if self.count() else filter_metadata
+
+    def reembed(self, batch_size: int = REEMBED_BATCH) -> dict:
+        """
+        Embeds pending chunks again, batch by batch, and clears their flag. Stops at the
+        first batch the provider still fails on. Returns what it re-embedded.
+        """
+        stats = {"reembedded": 0, "still_pending": 0}
+        sources = set()
+        try:
+            for collection in self.vector_store.physical_collections():
+                rows = collection.get(where={PENDING_KEY: True}, include=["documents", "metadatas"])
+                for start in range(0, len(rows["ids"] or []), batch_size):
+                    ids = rows["ids"][start:start + batch_size]
+                    metadatas = rows["metadatas"][start:start + batch_size]
+                    embeddings = self.vector_store.embed_documents(rows["documents"][start:start + batch_size])
+                    done = [i for i, embedding in enumerate(embeddings) if not is_zero_embedding(embedding)]
+                    if done:
+                        # None removes the flag (Chroma merges updated metadata into the stored one)
+                        collection.update(ids=[ids[i] for i in done], embeddings=[embeddings[i] for i in done],
+                                          metadatas=[{PENDING_KEY: None} for _ in done])
+                        sources.update(metadatas[i].get("source") for i in done)
+                        stats["reembedded"] += len(done)
+                    if len(done) < len(ids):
+                        raise RuntimeError(f"{len(ids) - len(done)} of {len(ids)} embeddings still failing")
+        except RuntimeError as e:
+            print(f"[Pending] Provider not recovered ({e}). Retrying later.")
+        finally:
+            self.invalidate()
+            # Summary centroids leave zero vectors out: recompute them with the new vectors
+            for source in sorted(s for s in sources if s):
+                self.vector_store.summaries.update_document(source)
+        stats["still_pending"] = self.count()
+        if stats["reembedded"]:
+            print(f"[Pending] Re-embedded {stats['reembedded']} chunks ({stats['still_pending']} still pending).")
+        return stats
+
+
+class ReembedWorker:
+    """Background re-embedding of pending chunks while the server is quiet, backing off while the provider fails."""
+    def __init__(self, vector_store, activity=None):
+        self.vector_store = vector_store
+        self.activity = activity
+        self.reembedded = 0
+        self.passes = 0
+        self.last_pass_at = None
+
+    async def reembed_once(self) -> dict:
+        if not await asyncio.to_thread(self.vector_store.pending.count):
+            return {"reembedded": 0, "still_pending": 0}
+        while self.activity and self.activity.idle_for() < REEMBED_IDLE_SECONDS:
+            await asyncio.sleep(REEMBED_IDLE_SECONDS - self.activity.idle_for() + 0.1)
+        stats = await asyncio.to_thread(self.vector_store.pending.reembed)
+        self.reembedded += stats["reembedded"]
+        self.passes += 1
+        self.last_pass_at = time.time()
+        return stats
+
+    async def run_forever(self, interval: float = REEMBED_INTERVAL_SECONDS):
+        backoff = 1
+        while True:
+            await asyncio.sleep(interval * backoff)
+            try:
+                stats = await self.reembed_once()
+                stalled = stats["still_pending"] and not stats["reembedded"]
+                backoff = min(backoff * 2, MAX_BACKOFF) if stalled else 1
+            except Exception as e:
+                print(f"[Pending] Re-embedding pass failed: {e}")
+
+    def get_stats(self) -> dict:
+        return {
+            "pending": self.vector_store.pending.count(),
+            "reembedded": self.reembedded,
+            "passes": self.passes,
+            "last_pass_at": self.last_pass_at
+        }
@@ -0,0 +1,326 @@
+import asyncio
+import os
+import time
+import uuid
+from .file_store import hash_file
+from .ingestion import ingest_document, record_document, IMAGES_DIR
+from .image_store import ImageStore, is_content_addressed, image_refs, split_image_refs
+
+# Seconds without live traffic before the reconciler spends provider quota
+SYNC_IDLE_SECONDS = float(os.getenv("SYNC_IDLE_SECONDS", 30))
+# Pause between two re-indexed files
+SYNC_PAUSE_SECONDS = float(os.getenv("SYNC_PAUSE_SECONDS", 2))
+# Interval between scheduled reconciliation passes
+SYNC_INTERVAL_SECONDS = float(os.getenv("SYNC_INTERVAL_SECONDS", 900))
+# Leftover temp uploads older than this are considered crash debris
+STALE_INCOMING_SECONDS = 3600
+
+
+class IngestActivity:
+    """
+    Tracks live traffic (chat and uploads) so background work can yield to it,
+    and the sources currently being ingested by a request so they are not touched.
+    """
+    def __init__(self):
+        self.last_activity = 0.0
+        self._in_flight = set()
+
+    def mark(self):
+        self.last_activity = time.time()
+
+    def idle_for(self) -> float:
+        return time.time() - self.last_activity
+
+    def begin(self, source: str):
+        self.mark()
+        self._in_flight.add(source)
+
+    def end(self, source: str):
+        self._in_flight.discard(source)
+
+    def is_in_flight(self, source: str) -> bool:
+        return source in self._in_flight
+
+    def in_flight(self) -> set[str]:
+        return set(self._in_flight)
+
+
+# Shared by the API endpoints and the reconciler
+ingest_activity = IngestActivity()
+
+
+def guess_category(filename: str) -> str:
+    """Category heuristic for files that arrived without an upload request."""
+    name = filename.lower()
+    return "product" if "manual" in name or "guide" in name else "hr"
+
+
+class VectorStoreReconciler:
+    """
+    Brings uploads/, static/images, the document catalog and the rag_docs collection
+    back in line after crashes, manual file drops or provider switches.
+    """
+    def __init__(self, vector_store, upload_dir: str = "uploads", images_dir: str = IMAGES_DIR):
+        self.vector_store = vector_store
+        self.catalog = vector_store.catalog
+        self.upload_dir = upload_dir
+        self.images_dir = images_dir
+        self.image_store = ImageStore(images_dir, self.catalog)
+        self._lock = asyncio.Lock()
+
+    def _disk_sources(self) -> set[str]:
+        if not os.path.exists(self.upload_dir):
+            return set()
+        return {
+            f for f in os.listdir(self.upload_dir)
+            if not f.startswith('.') and os.path.isfile(os.path.join(self.upload_dir, f))
+        }
+
+    def _remove_stale_incoming(self):
+        if not os.path.exists(self.upload_dir):
+            return
+        for f in os.listdir(self.upload_dir):
+            path = os.path.join(self.upload_dir, f)
+            if f.startswith(".incoming_") and time.time() - os.path.getmtime(path) > STALE_INCOMING_SECONDS:
+                os.remove(path)
+                print(f"[Sync] Removed stale partial upload {f}")
+
+    def _remove_orphaned_images(self, disk_sources: set[str]) -> int:
+        # Images extracted before the content-addressed store are named <upload filename>_<image name>;
+        # they are kept while their document exists and has not been re-indexed into the store
+        if not os.path.exists(self.images_dir):
+            return 0
+        live_sources = {
+            source for source in disk_sources
+            if "images" not in (self.catalog.get(source) or {})
+        } | ingest_activity.in_flight()
+        removed = 0
+        for img_name in os.listdir(self.images_dir):
+            if is_content_addressed(img_name) or img_name.startswith(".incoming_"):
+                continue
+            if any(img_name.startswith(f"{source}_") for source in live_sources):
+                continue
+            try:
+                os.remove(os.path.join(self.images_dir, img_name))
+                removed += 1
+            except Exception as e:
+                print(f"[Sync] Error deleting image {img_name}: {e}")
+        return removed
+
+    def _adopt_serving_index(self) -> int:
+        """
+        After an online switch (or rollback) by upgrade_model.py, restamps the catalog
+        entries whose chunks are in the now serving collection, and moves the dedup
+        signatures along. Documents it lacks are left to the re-index pass below.
+        """
+        collection = self.vector_store.collection_name
+        stale = [e for e in self.catalog.list_documents() if e.get("collection", collection) != collection]
+        if not stale:
+            return 0
+        adopted = 0
+        with self.catalog.transaction():
+            for entry in stale:
+                chunk_count = len(self.vector_store.get_chunk_ids_by_source(entry["source_id"]))
+                if not chunk_count:
+                    continue
+                record_document(self.vector_store, entry["source_id"], chunk_count=chunk_count)
+                adopted += 1
+        for old in {e["collection"] for e in stale}:
+            self.vector_store.dedup_index.retag_collection(old, collection)
+        print(f"[Sync] Adopted {adopted} documents into {collection}.")
+        return adopted
+
+    def _remove_orphaned_sources(self, disk_sources: set[str], indexed_sources: set[str]) -> set[str]:
+        """Deletes the chunks of indexed sources whose file is gone from uploads/. Returns those sources."""
+        orphaned = {s for s in indexed_sources - disk_sources if not ingest_activity.is_in_flight(s)}
+        if not disk_sources:
+            # An empty or unmounted uploads dir must not wipe the whole index or image store
+            print(f"[Sync] {self.upload_dir} is empty ({len(indexed_sources)} sources indexed). Skipping cleanup.")
+            return set()
+        removed = set()
+        for source in orphaned:
+            try:
+                self.vector_store.delete_documents_by_source(source)
+            except Exception as e:
+                # Catalog entry kept: the next pass tries again
+                print(f"[Sync] Error deleting chunks of {source}: {e}")
+                continue
+            self.catalog.remove(source)
+            removed.add(source)
+        return removed
+
+    def _remove_orphaned_entries(self, disk_sources: set[str]) -> int:
+        """Catalog entries whose file is gone, then images nothing references any more. Returns images removed."""
+        removed = self._remove_orphaned_images(disk_sources)
+        for entry in self.catalog.list_documents():
+            if entry["source_id"] not in disk_sources and not ingest_activity.is_in_flight(entry["source_id"]):
+                self.catalog.remove(entry["source_id"])
+        return removed + self.image_store.collect_garbage()
+
+    def _remove_orphaned_parents(self, indexed_sources: set[str]) -> int:
+        """Parent sections left behind by documents no longer indexed (e.g. an ingest that crashed halfway)."""
+        parents = self.vector_store.parents
+        removed = 0
+        for source in parents.sources() - indexed_sources:
+            if not ingest_activity.is_in_flight(source):
+                parents.remove(source)
+                removed += 1
+        return removed
+
+    async def remove_orphans(self) -> dict:
+        """Orphan cleanup on its own, outside a full reconciliation pass (run by index maintenance)."""
+        async with self._lock:
+            stats = {"orphaned_sources": 0, "orphaned_images": 0, "orphaned_parents": 0}
+            disk_sources = self._disk_sources()
+            indexed_sources = await asyncio.to_thread(self.vector_store.scan_indexed_sources)
+            orphaned = await asyncio.to_thread(self._remove_orphaned_sources, disk_sources, indexed_sources)
+            # Before the image sweep below, which only keeps images some catalog entry references
+            for source in disk_sources & indexed_sources:
+                if self.catalog.get(source) is None:
+                    await asyncio.to_thread(self._backfill_catalog, source)
+
+            if disk_sources:
+                stats["orphaned_sources"] = len(orphaned)
+                stats["orphaned_images"] = await asyncio.to_thread(self._remove_orphaned_images, disk_sources)
+                stats["orphaned_parents"] = await asyncio.to_thread(self._remove_orphaned_parents,
+                                                                    indexed_sources - orphaned)
+            return stats
+
+    async def _wait_for_quiet(self):
+        """Throttle: never compete with live chat traffic for provider quota."""
+        while ingest_activity.idle_for() < SYNC_IDLE_SECONDS:
+            await asyncio.sleep(SYNC_IDLE_SECONDS - ingest_activity.idle_for() + 0.1)
+
+    def _indexed_images(self, source: str, metadatas: list[dict]) -> list[str]:
+        """Images an indexed document references, read back from its chunks and parent sections."""
+        images = set()
+        for metadata in metadatas:
+            images.update(split_image_refs((metadata or {}).get("images")))
+        for text in self.vector_store.parents.get_sections(source).values():
+            images.update(image_refs(text))
+        return sorted(images)
+
+    def _backfill_catalog(self, source: str):
+        """Records a document indexed before the catalog existed (or whose entry was lost)."""
+        metadatas = self.vector_store.get_chunks_by_sources([source], include=["metadatas"])["metadatas"]
+        metadata = metadatas[0] if metadatas else {}
+        filepath = os.path.join(self.upload_dir, source)
+        images = self._indexed_images(source, metadatas)
+        # Without them the image garbage collector would take the document's images for unreferenced;
+        # a document still using pre-store images is left without, so those are kept by name
+        fields = {"image_count": len(images), "images": images} if all(map(is_content_addressed, images)) else {}
+        record_document(
+            self.vector_store,
+            source,
+            display_name=source.split('_', 1)[-1],
+            category=metadata.get("category", guess_category(source)),
+            content_hash=hash_file(filepath),
+            size=os.path.getsize(filepath),
+            chunk_count=len(metadatas),
+            **fields
+        )
+
+    async def _index_file(self, source: str) -> bool:
+        filepath = os.path.join(self.upload_dir, source)
+        entry = self.catalog.get(source) or {}
+        category = entry.get("category") or guess_category(source)
+        doc_id = source.split('_', 1)[0] if '_' in source else str(uuid.uuid4())
+
+        ingest_activity.begin(source)
+        try:
+            stats = await ingest_document(self.vector_store, filepath, doc_id, source, category,
+                                          image_dir=self.images_dir)
+            if not stats["chunks"]:
+                print(f"[Sync] Skipping {source}: no text extracted.")
+                return False
+            content_hash = entry.get("content_hash") or await asyncio.to_thread(hash_file, filepath)
+            record_document(
+                self.vector_store,
+                source,
+                display_name=entry.get("display_name", source.split('_', 1)[-1]),
+                category=category,
+                content_hash=content_hash,
+                size=os.path.getsize(filepath),
+                chunk_count=stats["chunks"],
+                image_count=stats["image_count"],
+                images=stats["images"],
+                timings=stats["timings"]
+            )
+            # Images only the previous index of this file used
+            self.image_store.release(entry.get("images", []))
+            return True
+        finally:
+            ingest_activity.end(source)
+
+    async def reconcile_once(self, full_scan: bool = False) -> dict:
+        """
+        Runs a single reconciliation pass and returns what it changed. The uploads are
+        compared with the catalog; full_scan (at startup) reads every chunk's source from
+        the collection instead, to repair a catalog that drifted from it.
+        """
+        async with self._lock:
+            stats = {"indexed": 0, "failed": 0, "orphaned_sources": 0, "orphaned_images": 0}
+            self._remove_stale_incoming()
+            await asyncio.to_thread(self._adopt_serving_index)
+            await asyncio.to_thread(self.vector_store.partition_existing)
+
+            disk_sources = self._disk_sources()
+            # Chroma reads and deletes are kept off the event loop so chat is not blocked. A failed
+            # read raises and aborts the pass, so nothing is re-indexed on a partial view
+            if full_scan:
+                indexed_sources = await asyncio.to_thread(self.vector_store.scan_indexed_sources)
+            else:
+                indexed_sources = self.vector_store.get_indexed_sources()
+                # A file without a catalog entry may still be indexed (a lost entry): ask the collection, per file
+                for source in disk_sources - indexed_sources:
+                    if not ingest_activity.is_in_flight(source) and \
+                            await asyncio.to_thread(self.vector_store.get_chunk_ids_by_source, source):
+                        indexed_sources.add(source)
+
+            orphaned = await asyncio.to_thread(self._remove_orphaned_sources, disk_sources, indexed_sources)
+            missing = sorted(s for s in disk_sources - indexed_sources if not ingest_activity.is_in_flight(s))
+
+            # Before the image sweep below, which only keeps images some catalog entry references
+            for source in disk_sources & indexed_sources:
+                if self.catalog.get(source) is None:
+                    await asyncio.to_thread(self._backfill_catalog, source)
+
+            if disk_sources:
+                stats["orphaned_sources"] = len(orphaned)
+                stats["orphaned_images"] = await asyncio.to_thread(self._remove_orphaned_entries, disk_sources)
+
+            # Documents indexed before the summary index existed, or restored from a bundle
+            live_sources = indexed_sources - orphaned if disk_sources else indexed_sources
+            await asyncio.to_thread(self.vector_store.summaries.build_missing, live_sources)
+
+            if missing:
+                print(f"[Sync] {len(missing)} files on disk are not indexed. Re-indexing in the background...")
+            for source in missing:
+                await self._wait_for_quiet()
+                # Another request may have indexed it meanwhile
+                if ingest_activity.is_in_flight(source) or \
+                        await asyncio.to_thread(self.vector_store.get_chunk_ids_by_source, source):
+                    continue
+                if not os.path.exists(os.path.join(self.upload_dir, source)):
+                    continue
+                try:
+                    if await self._index_file(source):
+                        stats["indexed"] += 1
+                except Exception as e:
+                    stats["failed"] += 1
+                    print(f"[Sync] Failed to index {source}: {e}")
+                await asyncio.sleep(SYNC_PAUSE_SECONDS)
+
+            print(f"[Sync] Reconciliation complete: {stats}")
+            return stats
+
+    async def run_forever(self, interval: float = SYNC_INTERVAL_SECONDS):
+        """Reconciles at startup (with a full scan, until one succeeds) and then on a fixed schedule."""
+        full_scan = True
+        while True:
+            try:
+                await self.reconcile_once(full_scan=full_scan)
+                full_scan = False
+            except Exception as e:
+                print(f"[Sync] Reconciliation pass failed: {e}")
+            await asyncio.sleep(interval)
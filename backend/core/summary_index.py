@@ -0,0 +1,198 @@
+import os
+from collections import Counter
+from typing import Dict, List, Optional
+import numpy as np
+
+# Two-stage retrieval: pick the best documents, then their best sections, then search only those chunks
+TWO_STAGE_ENABLED = os.getenv("TWO_STAGE_ENABLED", "true").lower() == "true"
+# Below this many indexed documents a flat search is fast and exact, so it is used instead
+TWO_STAGE_MIN_DOCUMENTS = int(os.getenv("TWO_STAGE_MIN_DOCUMENTS", 50))
+TWO_STAGE_TOP_DOCUMENTS = int(os.getenv("TWO_STAGE_TOP_DOCUMENTS", 8))
+TWO_STAGE_TOP_SECTIONS = int(os.getenv("TWO_STAGE_TOP_SECTIONS", 16))
+
+
+def summary_collection_name(collection_name: str) -> str:
+    """rag_docs_openai -> rag_docs_openai_summaries (no '-': that would read as a partition)"""
+    return f"{collection_name}_summaries"
+
+
+def centroid(embeddings: list) -> Optional[List[float]]:
+    """Normalised mean of the unit-normalised embeddings; zero vectors (failed embeddings) are left out."""
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1)
+    vectors = vectors[norms > 0] / norms[norms > 0, None]
+    if not len(vectors):
+        return None
+    mean = vectors.mean(axis=0)
+    norm = np.linalg.norm(mean)
+    return (mean / norm).tolist() if norm > 0 else None
+
+
+def summary_entries(source: str, metadatas: List[dict], embeddings: list) -> Dict[str, list]:
+    """
+    Coarse index rows for one document: a document entry over all its chunks and one
+    entry per section (chunks sharing a section_id). Returns ids, documents, metadatas, embeddings.
+    """
+    entries = {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
+    sections = {}
+    for i, metadata in enumerate(metadatas):
+        if metadata.get("section_id"):
+            sections.setdefault(metadata["section_id"], []).append(i)
+    category = Counter(m.get("category") for m in metadatas).most_common(1)[0][0]
+
+    def add(entry_id, document, embedding, metadata):
+        if embedding is None:
+            return
+        entries["ids"].append(entry_id)
+        entries["documents"].append(document)
+        entries["metadatas"].append({"source": source, "category": category, **metadata})
+        entries["embeddings"].append(embedding)
+
+    headers = []
+    for section_id, rows in sections.items():
+        header = metadatas[rows[0]].get("section", "")
+        headers.append(header)
+        add(f"section::{section_id}", header, centroid([embeddings[i] for i in rows]),
+            {"level": "section", "section_id": section_id, "chunks": len(rows)})
+    sectioned = len(entries["ids"])
+    add(f"document::{source}", "\n".join([source] + headers), centroid(embeddings),
+        {"level": "document", "sections": sectioned, "chunks": len(metadatas)})
+    return entries
+
+
+def _and(*clauses) -> dict:
+    clauses = [c for c in clauses if c]
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def _category_clause(categories: Optional[List[str]]) -> Optional[dict]:
+    if not categories:
+        return None
+    return {"category": categories[0]} if len(categories) == 1 else {"category": {"$in": list(categories)}}
+
+
+def select_scope(collection, query_embedding: List[float], categories: Optional[List[str]] = None,
+                 top_documents: int = TWO_STAGE_TOP_DOCUMENTS, top_sections: int = TWO_STAGE_TOP_SECTIONS) -> Optional[dict]:
+    """
+    Stage one: the best documents by their summary vector, then the best sections of
+    those documents. Returns a where clause restricting the chunk search to those
+    sections (and to whole documents that have no sections), or None if nothing matched.
+    """
+    documents = collection.query(
+        query_embeddings=[query_embedding],
+        n_results=top_documents,
+        where=_and({"level": "document"}, _category_clause(categories)),
+        include=["metadatas"]
+    )["metadatas"][0]
+    if not documents:
+        return None
+    whole = [m["source"] for m in documents if not m.get("sections")]
+    sectioned = [m["source"] for m in documents if m.get("sections")]
+
+    section_ids = []
+    if sectioned:
+        sections = collection.query(
+            query_embeddings=[query_embedding],
+            n_results=top_sections,
+            where={"$and": [{"level": "section"}, {"source": {"$in": sectioned}}]},
+            include=["metadatas"]
+        )["metadatas"][0]
+        section_ids = [m["section_id"] for m in sections]
+
+    clauses = []
+    if whole:
+        clauses.append({"source": {"$in": whole}})
+    if section_ids:
+        clauses.append({"section_id": {"$in": section_ids}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+class SummaryIndex:
+    """
+    Coarse index next to a document index (<collection>_summaries): one vector per
+    document and per section, the normalised mean of their chunks' embeddings, so it
+    costs no embedding or LLM calls. Kept in step by the ingestion and delete paths;
+    documents indexed before it existed are added by the reconciler (build_missing),
+    and two-stage retrieval only starts once every document is covered.
+    """
+    def __init__(self, vector_store):
+        self.vector_store = vector_store
+        # Document indexes whose every document has its summaries
+        self._complete = set()
+
+    @property
+    def name(self) -> str:
+        return summary_collection_name(self.vector_store.collection_name)
+
+    @property
+    def collection(self):
+        # Rows are always written with their embeddings; the function is never called
+        return self.vector_store.client.get_or_create_collection(
+            name=self.name,
+            embedding_function=self.vector_store.embedding_fn_doc,
+            metadata=self.vector_store.collection_metadata()
+        )
+
+    def update_document(self, source: str) -> int:
+        """Recomputes a document's summaries from its stored chunk embeddings. Returns the entries written."""
+        try:
+            chunks = self.vector_store.get_chunks_by_sources([source], include=["metadatas", "embeddings"])
+            collection = self.collection
+            stale = set(collection.get(where={"source": source}, include=[])["ids"] or [])
+            entries = summary_entries(source, chunks["metadatas"], chunks["embeddings"]) if chunks["ids"] else None
+            if entries and entries["ids"]:
+                collection.upsert(**entries)
+                stale -= set(entries["ids"])
+            if stale:
+                collection.delete(ids=list(stale))
+            return len(entries["ids"]) if entries else 0
+        except Exception as e:
+            # Without its summaries the document could not be found: search flat until rebuilt
+            self._complete.discard(self.name)
+            print(f"[Summary] Error updating summaries for {source}: {e}")
+            return 0
+
+    def remove_source(self, source: str):
+        try:
+            self.collection.delete(where={"source": source})
+        except Exception as e:
+            print(f"[Summary] Error removing summaries for {source}: {e}")
+
+    def clear(self):
+        try:
+            self.vector_store.client.delete_collection(self.name)
+        except Exception:
+            pass
+
+    def invalidate(self):
+        """Forgets which indexes are complete (after collections were dropped wholesale)."""
+        self._complete.clear()
+
+    def build_missing(self, sources: set) -> int:
+        """Adds summaries for indexed documents that lack them and drops those of documents gone."""
+        name = self.name
+        have = {
+            m["source"] for m in self.collection.get(where={"level": "document"}, include=["metadatas"])["metadatas"] or []
+        }
+        for source in have - set(sources):
+            self.remove_source(source)
+        missing = set(sources) - have
+        for source in sorted(missing):
+            self.update_document(source)
+        if missing:
+            print(f"[Summary] Summarised {len(missing)} documents into {name}.")
+        self._complete.add(name)
+        return len(missing)
+
+    def applies(self, filter_metadata: dict = None) -> bool:
+        """Whether a search with this filter goes through the two stages."""
+        if not TWO_STAGE_ENABLED or self.name not in self._complete:
+            return False
+        if filter_metadata and set(filter_metadata) - {"category"}:
+            return False
+        return len(self.vector_store.get_indexed_sources()) >= TWO_STAGE_MIN_DOCUMENTS
+
+    def select(self, query_embedding: List[float], categories: Optional[List[str]] = None) -> Optional[dict]:
+        return select_scope(self.collection, query_embedding, categories)
@@ -0,0 +1,138 @@
+import os
+from typing import Iterator, List, Tuple
+
+# (sheet name, header, batch of (row number, cells)); row numbers are the file's / sheet's own
+RowBatch = Tuple[str, List[str], List[Tuple[int, List[str]]]]
+
+# Rows read from disk per batch
+TABLE_READ_BATCH_ROWS = int(os.getenv("TABLE_READ_BATCH_ROWS", 1000))
+# Records packed into one chunk (the header is repeated in every chunk)
+TABLE_ROWS_PER_CHUNK = int(os.getenv("TABLE_ROWS_PER_CHUNK", 40))
+TABLE_MAX_CHUNK_CHARS = int(os.getenv("TABLE_MAX_CHUNK_CHARS", 1500))
+
+TABULAR_EXTENSIONS = ('.csv', '.xlsx', '.xls')
+
+
+def _cell(value) -> str:
+    if value is None:
+        return ""
+    text = str(value).strip()
+    # Keep one record per line and the separator unambiguous
+    return text.replace("\n", " ").replace("|", "/")
+
+
+def _numbered(df, first_row: int) -> List[Tuple[int, List[str]]]:
+    """Rows of a DataFrame chunk with their row numbers (the index counts data rows from 0), blank ones dropped."""
+    rows = []
+    for index, *values in df.itertuples(index=True, name=None):
+        cells = [_cell(v) for v in values]
+        if any(cells):
+            rows.append((index + first_row, cells))
+    return rows
+
+
+def _iter_csv_rows(filepath: str, batch_rows: int) -> Iterator[RowBatch]:
+    import pandas as pd
+    # Blank lines are kept so the index stays the line number; they are dropped afterwards
+    for batch in pd.read_csv(filepath, chunksize=batch_rows, dtype=str, keep_default_na=False,
+                             skip_blank_lines=False):
+        header = [_cell(c) for c in batch.columns]
+        # The header is row 1
+        yield "", header, _numbered(batch, 2)
+
+
+def _iter_xlsx_rows(filepath: str, batch_rows: int) -> Iterator[RowBatch]:
+    import openpyxl
+    # read_only streams rows from the sheet XML instead of building the whole workbook
+    workbook = openpyxl.load_workbook(filepath, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            header = None
+            batch = []
+            # Read-only sheets stream from A1: start at the used range so the numbers and columns line up
+            first_row, first_col = sheet.min_row or 1, sheet.min_column or 1
+            rows = sheet.iter_rows(min_row=first_row, min_col=first_col, values_only=True)
+            # Blank rows are skipped below but still take their number
+            for row_number, row in enumerate(rows, start=first_row):
+                cells = [_cell(v) for v in row]
+                if not any(cells):
+                    continue
+                if header is None:
+                    header = cells
+                    continue
+                batch.append((row_number, cells))
+                if len(batch) >= batch_rows:
+                    yield sheet.title, header, batch
+                    batch = []
+            if header is not None and batch:
+                yield sheet.title, header, batch
+    finally:
+        workbook.close()
+
+
+def _iter_xls_rows(filepath: str, batch_rows: int) -> Iterator[RowBatch]:
+    # Legacy .xls has no streaming reader; load one sheet at a time and batch it
+    import pandas as pd
+    sheets = pd.read_excel(filepath, sheet_name=None, dtype=str, keep_default_na=False)
+    for name, df in sheets.items():
+        header = [_cell(c) for c in df.columns]
+        rows = _numbered(df, 2)
+        for start in range(0, len(rows), batch_rows):
+            yield str(name), header, rows[start:start + batch_rows]
+
+
+def iter_table_rows(filepath: str, batch_rows: int = TABLE_READ_BATCH_ROWS) -> Iterator[RowBatch]:
+    """Yields (sheet name, header, batch of (row number, cells)) without loading the whole table."""
+    ext = os.path.splitext(filepath)[1].lower()
+    if ext == '.csv':
+        return _iter_csv_rows(filepath, batch_rows)
+    if ext == '.xlsx':
+        return _iter_xlsx_rows(filepath, batch_rows)
+    if ext == '.xls':
+        return _iter_xls_rows(filepath, batch_rows)
+    raise ValueError(f"Unsupported table type: {ext}")
+
+
+def iter_table_chunks(filepath: str, rows_per_chunk: int = TABLE_ROWS_PER_CHUNK,
+                      max_chars: int = TABLE_MAX_CHUNK_CHARS) -> Iterator[Tuple[str, dict]]:
+    """
+    Yields compact record chunks: a context line, the header, then one
+    '|'-separated record per line. Cells are not padded to column width.
+    Returns (chunk text, metadata with sheet and row range, as numbered in the file).
+    """
+    name = os.path.basename(filepath).split('_', 1)[-1]
+    row_number = 0
+    current_sheet = None
+
+    lines, first_row, size = [], 0, 0
+
+    def flush(sheet, header_line):
+        label = f"{name} / {sheet}" if sheet else name
+        text = f"Table: {label} (rows {first_row}-{row_number})\n{header_line}\n" + "\n".join(lines)
+        return text, {"sheet": sheet, "row_start": first_row, "row_end": row_number}
+
+    header_line = ""
+    for sheet, header, rows in iter_table_rows(filepath):
+        if sheet != current_sheet:
+            if lines:
+                yield flush(current_sheet, header_line)
+                lines, size = [], 0
+            current_sheet = sheet
+        header_line = " | ".join(header)
+        for number, row in rows:
+            record = " | ".join(row)
+            if lines and (len(lines) >= rows_per_chunk or size + len(record) > max_chars):
+                yield flush(current_sheet, header_line)
+                lines, size = [], 0
+            row_number = number
+            if not lines:
+                first_row = row_number
+            lines.append(record)
+            size += len(record) + 1
+    if lines:
+        yield flush(current_sheet, header_line)
+
+
+def load_table(filepath: str) -> str:
+    """Loads a table as compact text (header repeated per chunk of records)."""
+    return "\n\n".join(text for text, _ in iter_table_chunks(filepath))
@@ -1,14 +1,70 @@
 import os
+import re
+from collections import Counter
 import chromadb
 from chromadb import Documents, EmbeddingFunction, Embeddings
 from .llm import get_llm, BaseLLM
+from .document_catalog import DocumentCatalog
+from .dedup import CorpusDedupIndex
+from .index_state import IndexState
+from .summary_index import SummaryIndex
+from .parent_store import ParentStore, expand_results
+from .advanced_chunker import SMALL_TO_BIG_ENABLED
+from .index_profiles import resolve_profile, hnsw_metadata
+from .embedding_reduction import EmbeddingReducer, EMBEDDING_DIMENSION, native_dimension
+from .pending_embeddings import PendingEmbeddings, flag_pending
+from .image_store import image_refs, split_image_refs
+
+CHROMA_PATH = "./chroma_data"
+
+# One physical collection per category under the logical collection name, so a category's
+# searches walk a graph of its own vectors only instead of post-filtering a shared one
+INDEX_PARTITION_BY_CATEGORY = os.getenv("INDEX_PARTITION_BY_CATEGORY", "true").lower() == "true"
+# Chunks moved per batch when an unpartitioned collection is split
+PARTITION_MOVE_BATCH = 1000
+
+# Small-to-big: child chunks matched per question (expanded to at most SMALL_TO_BIG_MAX_PARENTS sections)
+SMALL_TO_BIG_CHILD_RESULTS = int(os.getenv("SMALL_TO_BIG_CHILD_RESULTS", 10))
+
+
+def partition_key(category: str) -> str:
+    # No '-': it separates the key from the collection name
+    return re.sub(r'[^a-zA-Z0-9_]+', '_', str(category).lower()).strip('_') or "none"
+
+
+def partition_name(collection_name: str, category: str) -> str:
+    """rag_docs_openai + hr -> rag_docs_openai-hr"""
+    return f"{collection_name}-{partition_key(category)}"
+
+
+def _group_by_category(metadatas: list[dict]) -> dict:
+    groups = {}
+    for i, metadata in enumerate(metadatas):
+        groups.setdefault((metadata or {}).get("category"), []).append(i)
+    return groups
+
+
+def _format_context(results: list[tuple[str, dict]]) -> tuple[str, list[str]]:
+    if not results:
+        return "No relevant information found in the knowledge base.", []
+    images = []
+    for doc, meta in results[:5]:
+        images.extend(split_image_refs(meta["images"]) if "images" in meta else image_refs(doc))
+    # Return top 5 chunks to keep context comprehensive
+    return "\n\n---\n\n".join(doc for doc, _ in results[:5]), list(dict.fromkeys(images))
+
 
 class UniversalEmbeddingFunction(EmbeddingFunction):
-    def __init__(self, llm: BaseLLM, task_type: str = "retrieval_document"):
+    def __init__(self, llm: BaseLLM, task_type: str = "retrieval_document", reducer: EmbeddingReducer = None):
         self.llm = llm
         self.task_type = task_type
+        self.reducer = reducer
 
     def __call__(self, input: Documents) -> Embeddings:
+        embeddings = self._embed(input)
+        return self.reducer(embeddings) if self.reducer else embeddings
+
+    def _embed(self, input: Documents) -> Embeddings:
         # Optimization: Pass the entire list for batch embedding if supported by the provider
         # This is much faster than one-by-one calls
         try:
@@ -22,87 +78,390 @@ class UniversalEmbeddingFunction(EmbeddingFunction):
         
 
 class VectorStore:
-    def __init__(self):
-        self.client = chromadb.PersistentClient(path="./chroma_data")
+    """
+    Chroma collections for one provider. By default the store serves whatever
+    index_state.json marks active (collection and the embedding model it was built
+    with) and follows online switches made by upgrade_model.py. Passing a collection
+    name or embedding model pins the store instead, as the migration does to build
+    a shadow collection (with its own dedup_path, so it never rewrites the live one).
+    Without any recorded switch, the model is the one the catalog stamped on the
+    default collection, so editing .env alone never mixes two models in one collection.
+    """
+    def __init__(self, collection_name: str = None, embedding_model: str = None,
+                 dedup_path: str = "dedup_index.json", embedding_dimension: int = None):
+        self.client = chromadb.PersistentClient(path=CHROMA_PATH)
         self.llm = get_llm()
         
-        # Determine provider name for collection isolation
         # Determine provider name for collection isolation
         from .llm import OpenAILLM, FallbackLLM
         
         real_llm = self.llm
         if isinstance(real_llm, FallbackLLM):
             real_llm = real_llm.primary
+        self._real_llm = real_llm
             
         self._provider = "openai" if isinstance(real_llm, OpenAILLM) else "google"
+        self._configured_embedding_model = getattr(real_llm, "embedding_model", None) or real_llm.model_name
+        self._embedding_model = self._configured_embedding_model
+        self._collection_name = collection_name or f"rag_docs_{self._provider}"
+        self._history_collection_name = f"chat_history_{self._provider}"
         
-        self.embedding_fn_doc = UniversalEmbeddingFunction(self.llm, "retrieval_document")
-        self.embedding_fn_query = UniversalEmbeddingFunction(self.llm, "retrieval_query")
+        # Per-document manifest kept in step with the collection by the ingestion/delete paths
+        self.catalog = DocumentCatalog(storage_path="document_catalog.json")
+        # MinHash signatures of indexed chunks, for cross-document near-duplicate detection
+        self.dedup_index = CorpusDedupIndex(storage_path=dedup_path)
+        
+        # Cuts embeddings to the index's dimension (EMBEDDING_DIMENSION for collections built from now on)
+        self.reducer = EmbeddingReducer(self._embedding_model)
+        self.embedding_fn_doc = UniversalEmbeddingFunction(self.llm, "retrieval_document", self.reducer)
+        self.embedding_fn_query = UniversalEmbeddingFunction(self.llm, "retrieval_query", self.reducer)
+
+        # (logical collection name, partition key -> physical collection name)
+        self._partition_cache = None
+        # Per-document and per-section vectors for two-stage retrieval
+        self.summaries = SummaryIndex(self)
+        # Full sections that small-to-big child chunks expand to
+        self.parents = ParentStore()
+        # Chunks stored with a zero vector while the provider failed, waiting to be re-embedded
+        self.pending = PendingEmbeddings(self)
+        # HNSW parameters of the collections this store creates
+        self.index_profile, self.hnsw_params = resolve_profile()
+
+        self.index_state = IndexState(storage_path="index_state.json")
+        self._follows_index_state = collection_name is None and embedding_model is None
+        if embedding_model:
+            self._use_embedding_model(embedding_model)
+        if self._follows_index_state:
+            self._apply_index_state()
+        else:
+            # Pinned stores build collections: at the given dimension, else the configured one
+            self._use_embedding_dimension(embedding_dimension or EMBEDDING_DIMENSION)
+
+    def _use_embedding_model(self, embedding_model: str):
+        if embedding_model != self._embedding_model and hasattr(self._real_llm, "embedding_model"):
+            self._real_llm.embedding_model = embedding_model
+            self._embedding_model = embedding_model
+        self.reducer.configure(self._embedding_model, self.reducer.dimension)
+
+    def _use_embedding_dimension(self, dimension: int | None):
+        # The model's full width needs no reduction
+        if dimension and dimension == native_dimension(self._embedding_model):
+            dimension = None
+        self._real_llm.output_dimension = dimension or None
+        self.reducer.configure(self._embedding_model, dimension)
+
+    def _recorded_dimension(self) -> int | None:
+        """
+        Dimension of the default collection: recorded in its metadata, the configured one
+        if nothing is indexed yet, else the model's full width (built before it was recorded).
+        """
+        collections = self.physical_collections()
+        # Listed again on first use: partitions may be created by another process until then
+        self._partition_cache = None
+        for collection in collections:
+            if (collection.metadata or {}).get("dimension"):
+                return collection.metadata["dimension"]
+        return None if collections else EMBEDDING_DIMENSION
+
+    def _apply_index_state(self):
+        active = self.index_state.active(self._provider)
+        if active:
+            self._collection_name = active["collection"]
+            self._history_collection_name = active.get("history_collection") or f"chat_history_{self._provider}"
+            self._use_embedding_model(active["embedding_model"])
+            self._use_embedding_dimension(active.get("dimension"))
+        else:
+            self._collection_name = f"rag_docs_{self._provider}"
+            self._history_collection_name = f"chat_history_{self._provider}"
+            self._use_embedding_model(self._stamped_embedding_model() or self._configured_embedding_model)
+            self._use_embedding_dimension(self._recorded_dimension())
+        print(f"[VectorStore] Serving {self._collection_name} (embedding model: {self._embedding_model}, "
+              f"{self.embedding_dimension or 'native'} dims).")
+        if self._embedding_model != self._configured_embedding_model:
+            print(f"[VectorStore] Configured embedding model {self._configured_embedding_model} is not indexed yet. "
+                  f"Run `python upgrade_model.py --online` to migrate.")
+        elif EMBEDDING_DIMENSION and EMBEDDING_DIMENSION != self.embedding_dimension:
+            print(f"[VectorStore] Configured EMBEDDING_DIMENSION {EMBEDDING_DIMENSION} is not indexed yet. "
+                  f"Run `python upgrade_model.py --online` to migrate.")
+
+    def _stamped_embedding_model(self) -> str | None:
+        """The model the catalog says the default collection was built with (before any online switch)."""
+        models = Counter(
+            e["embedding_model"] for e in self.catalog.list_documents()
+            if e.get("embedding_model") and e.get("collection", self._collection_name) == self._collection_name
+        )
+        return models.most_common(1)[0][0] if models else None
+
+    def _sync_index_state(self):
+        # One stat() per access; a switch made by another process takes effect on the next request
+        if self._follows_index_state and self.index_state.refresh():
+            self._apply_index_state()
 
     @property
     def provider(self):
         return self._provider
 
+    @property
+    def embedding_model(self) -> str:
+        self._sync_index_state()
+        return self._embedding_model
+
+    @property
+    def configured_embedding_model(self) -> str:
+        """The embedding model set in .env, which may differ from the one the serving index was built with."""
+        return self._configured_embedding_model
+
+    @property
+    def collection_name(self) -> str:
+        self._sync_index_state()
+        return self._collection_name
+
+    @property
+    def history_collection_name(self) -> str:
+        self._sync_index_state()
+        return self._history_collection_name
+
+    @property
+    def embedding_dimension(self) -> int | None:
+        """Width of this index's embeddings (None: the model's own, if not known)."""
+        self._sync_index_state()
+        return self.reducer.dimension or native_dimension(self._embedding_model)
+
+    def collection_metadata(self) -> dict:
+        """
+        Metadata for new collections (ignored for existing ones): the index profile's HNSW
+        parameters, and the embedding model and dimension the vectors are built with.
+        """
+        metadata = {**hnsw_metadata(self.hnsw_params), "embedding_model": self._embedding_model}
+        if self.embedding_dimension:
+            metadata["dimension"] = self.embedding_dimension
+        return metadata
+
     @property
     def collection(self):
-        return self.client.get_or_create_collection(
-            name=f"rag_docs_{self.provider}",
-            embedding_function=self.embedding_fn_doc
-        )
+        """The unpartitioned collection (indexes built before partitioning, or with INDEX_PARTITION_BY_CATEGORY=false)."""
+        return self._open(self.collection_name)
 
     @property
     def history_collection(self):
-        return self.client.get_or_create_collection(
-            name=f"chat_history_{self.provider}",
-            embedding_function=self.embedding_fn_doc
-        )
+        return self._open(self.history_collection_name)
+
+    def embed_documents(self, documents: list[str]) -> list[list[float]]:
+        """Embeds documents without writing them, so embedding can run apart from Chroma writes."""
+        return self.embedding_fn_doc(documents)
+
+    def _open(self, name: str):
+        return self.client.get_or_create_collection(name=name, embedding_function=self.embedding_fn_doc,
+                                                    metadata=self.collection_metadata())
+
+    def _partition_names(self) -> dict:
+        """Partition key -> physical collection of the serving index (None: the unpartitioned collection)."""
+        base = self.collection_name
+        if self._partition_cache is None or self._partition_cache[0] != base:
+            names = {}
+            for col in self.client.list_collections():
+                if col.name == base:
+                    names[None] = base
+                elif col.name.startswith(base + "-") and "-" not in col.name[len(base) + 1:]:
+                    names[col.name[len(base) + 1:]] = col.name
+            self._partition_cache = (base, names)
+        return self._partition_cache[1]
+
+    def _write_name(self, category: str) -> str:
+        """Collection that new chunks of a category are written to."""
+        names = self._partition_names()
+        key = partition_key(category) if INDEX_PARTITION_BY_CATEGORY else None
+        name = names.get(key) or (partition_name(self.collection_name, category) if key else self.collection_name)
+        names[key] = name
+        return name
+
+    def _write_collection(self, category: str):
+        return self._open(self._write_name(category))
+
+    def _read_collections(self, categories: list[str] = None) -> list:
+        """
+        Existing collections that can hold chunks of the given categories (all of them
+        when None). The unpartitioned collection always takes part.
+        """
+        names = self._partition_names()
+        if categories is None:
+            selected = list(names.values())
+        else:
+            selected = [names[key] for key in dict.fromkeys(partition_key(c) for c in categories) if key in names]
+            if None in names:
+                selected.append(names[None])
+        return [self._open(name) for name in selected]
+
+    @staticmethod
+    def _where_categories(where: dict = None) -> list[str] | None:
+        for clause in (where or {}).get("$and", []):
+            categories = VectorStore._where_categories(clause)
+            if categories is not None:
+                return categories
+        value = (where or {}).get("category")
+        if isinstance(value, str):
+            return [value]
+        if isinstance(value, dict):
+            if "$eq" in value:
+                return [value["$eq"]]
+            if "$in" in value:
+                return list(value["$in"])
+        return None
+
+    def physical_collections(self) -> list:
+        """Every Chroma collection holding chunks of the serving index."""
+        return self._read_collections()
+
+    def get_embeddings(self, ids: list[str]) -> dict:
+        """Returns stored embeddings by chunk id (ids that no longer exist are left out)."""
+        if not ids:
+            return {}
+        embeddings = {}
+        for collection in self._read_collections():
+            results = collection.get(ids=list(ids), include=["embeddings"])
+            if not results or results.get('embeddings') is None:
+                continue
+            embeddings.update((chunk_id, list(embedding)) for chunk_id, embedding in zip(results['ids'], results['embeddings']))
+        return embeddings
+
+    def get_chunks(self, ids: list[str] = None, include: list[str] = ("documents", "metadatas"), limit: int = None) -> dict:
+        """Chunks by id (every chunk when ids is None) with the requested fields, gathered across partitions."""
+        merged = {"ids": [], **{field: [] for field in include}}
+        for collection in self._read_collections():
+            remaining = None if limit is None else limit - len(merged["ids"])
+            if remaining is not None and remaining <= 0:
+                break
+            results = collection.get(ids=list(ids) if ids is not None else None, limit=remaining, include=list(include))
+            merged["ids"].extend(results['ids'] or [])
+            for field in include:
+                merged[field].extend(results[field] if results.get(field) is not None else [])
+        return merged
 
-    def add_documents(self, documents: list[str], metadatas: list[dict], ids: list[str]):
-        """Adds documents to the vector store."""
+    def add_documents(self, documents: list[str], metadatas: list[dict], ids: list[str],
+                      embeddings: list[list[float]] = None):
+        """
+        Adds documents to their category's partition. Precomputed embeddings skip the embedding
+        call. Chunks whose embedding failed (zero vector) are flagged pending and kept out of search.
+        """
         if not documents:
             return
-        self.collection.add(
-            documents=documents,
-            metadatas=metadatas,
-            ids=ids
-        )
+        if embeddings is None:
+            embeddings = self.embed_documents(documents)
+        metadatas, pending = flag_pending(metadatas, embeddings)
+        if pending:
+            self.pending.note(pending)
+            print(f"[Pending] {pending} of {len(documents)} chunks got no embedding. Queued for re-embedding.")
+        for category, rows in _group_by_category(metadatas).items():
+            self._write_collection(category).add(
+                documents=[documents[i] for i in rows],
+                metadatas=[metadatas[i] for i in rows],
+                ids=[ids[i] for i in rows],
+                embeddings=[embeddings[i] for i in rows]
+            )
 
     def search(self, query: str, n_results: int = 3, filter_metadata: dict = None) -> list[str]:
         """Searches for relevant documents."""
+        return [doc for doc, _ in self.search_with_metadata(query, n_results, filter_metadata)]
+
+    def search_with_metadata(self, query: str, n_results: int = 3, filter_metadata: dict = None) -> list[tuple[str, dict]]:
+        """Searches for relevant documents, returning (document, metadata) pairs in rank order."""
         # We manually embed the query using the query-specific embedding function
         query_embeddings = self.embedding_fn_query([query])
-        
-        results = self.collection.query(
-            query_embeddings=query_embeddings,
-            n_results=n_results,
-            where=filter_metadata
-        )
-        if results['documents']:
-            return results['documents'][0]
-        return []
+        return self.retrieve(query_embeddings, n_results, filter_metadata)[0]
+
+    def query_embeddings(self, query_embeddings: list[list[float]], n_results: int = 3,
+                         filter_metadata: dict = None) -> list[list[tuple[str, dict]]]:
+        """
+        Nearest chunks for each query embedding, as (document, metadata) pairs best first.
+        A category filter only searches that category's partition; otherwise every
+        partition is searched and the results are merged by distance.
+        """
+        hits = [{} for _ in query_embeddings]
+        for collection in self._read_collections(self._where_categories(filter_metadata)):
+            if not collection.count():
+                continue
+            results = collection.query(
+                query_embeddings=query_embeddings,
+                n_results=n_results,
+                where=self.pending.where(filter_metadata),
+                include=["documents", "metadatas", "distances"]
+            )
+            for i, ids in enumerate(results['ids'] or []):
+                metadatas = (results.get('metadatas') or [None] * len(query_embeddings))[i] or [{}] * len(ids)
+                for chunk_id, doc, meta, distance in zip(ids, results['documents'][i], metadatas, results['distances'][i]):
+                    # A chunk being moved between partitions can briefly be in both
+                    if chunk_id not in hits[i] or distance < hits[i][chunk_id][0]:
+                        hits[i][chunk_id] = (distance, doc, meta or {})
+        return [
+            [(doc, meta) for _, doc, meta in sorted(found.values(), key=lambda hit: hit[0])[:n_results]]
+            for found in hits
+        ]
+
+    def retrieve(self, query_embeddings: list[list[float]], n_results: int = 3,
+                 filter_metadata: dict = None) -> list[list[tuple[str, dict]]]:
+        """
+        query_embeddings for answering questions. Once the corpus is large, each query first
+        picks its documents and sections from the summary index and only their chunks are
+        searched; if that finds fewer than n_results chunks the flat search is used instead.
+        """
+        if not self.summaries.applies(filter_metadata):
+            return self.query_embeddings(query_embeddings, n_results, filter_metadata)
+        categories = self._where_categories(filter_metadata)
+        results = []
+        for embedding in query_embeddings:
+            scope = self.summaries.select(embedding, categories)
+            hits = []
+            if scope:
+                where = {"$and": [filter_metadata, scope]} if filter_metadata else scope
+                hits = self.query_embeddings([embedding], n_results, where)[0]
+            if len(hits) < n_results:
+                hits = self.query_embeddings([embedding], n_results, filter_metadata)[0]
+            results.append(hits)
+        return results
 
     def get_indexed_sources(self) -> set[str]:
-        """Returns a set of all source filenames currently in the vector store."""
-        try:
-            results = self.collection.get(include=["metadatas"])
-            if not results or not results['metadatas']:
-                return set()
-            return {m.get("source") for m in results['metadatas'] if m.get("source")}
-        except Exception:
-            return set()
+        """Returns a set of all source filenames currently in the vector store (from the catalog)."""
+        return {
+            e["source_id"] for e in self.catalog.list_documents()
+            if e.get("chunk_count") and e.get("collection", self.collection_name) == self.collection_name
+        }
+
+    def scan_indexed_sources(self) -> set[str]:
+        """
+        Full scan of chunk metadata. Only used to repair the catalog against the collection.
+        Raises if the collection can't be read: an empty answer would make every file look unindexed.
+        """
+        metadatas = self.get_chunks(include=["metadatas"])["metadatas"]
+        return {m.get("source") for m in metadatas if m and m.get("source")}
 
     def search_as_tool(self, query: str, category: str = None) -> str:
         """
         Optimized Search: Fetches top 2 most relevant chunks for precise answers.
         """
-        # Search with k=5 to find good candidates
-        docs = self.search(query, n_results=5, filter_metadata={"category": category} if category else None)
-        
-        if not docs:
-            return "No relevant information found in the knowledge base."
-            
-        # Return top 5 chunks to keep context comprehensive
-        return "\n\n---\n\n".join(docs[:5])
+        return self.search_context(query, category)[0]
+
+    def search_context(self, query: str, category: str = None) -> tuple[str, list[str]]:
+        """
+        search_as_tool plus the images referenced by the returned chunks, in rank order,
+        read from chunk metadata (chunks indexed before it was recorded are scanned instead).
+        """
+        return self.search_contexts(query, [category])[category]
+
+    def search_contexts(self, query: str, categories: list[str]) -> dict:
+        """search_context for each category of a multi-intent query, embedding the query only once."""
+        query_embeddings = self.embedding_fn_query([query])
+        contexts = {}
+        for category in categories:
+            # Search with k=5 to find good candidates (more when small child chunks are matched)
+            results = self.retrieve(query_embeddings, n_results=SMALL_TO_BIG_CHILD_RESULTS if SMALL_TO_BIG_ENABLED else 5,
+                                    filter_metadata={"category": category} if category else None)[0]
+            contexts[category] = _format_context(self.expand_to_parents(results))
+        return contexts
+
+    def expand_to_parents(self, results: list[tuple[str, dict]], max_results: int = 5) -> list[tuple[str, dict]]:
+        """Small-to-big: matched child chunks become their parent sections (see parent_store.expand_results)."""
+        parents = self.parents.get_many([meta["section_id"] for _, meta in results if meta.get("section_id")])
+        return expand_results(results, parents, max_results=max_results)
 
 
     def add_chat_history(self, user_id: str, role: str, content: str, timestamp: float, conversation_id: str = None):
@@ -161,39 +520,166 @@ class VectorStore:
         except Exception as e:
             print(f"Error deleting history for {conversation_id}: {e}")
 
-    def delete_documents_by_source(self, source_filename: str):
-        """Deletes all document chunks from a specific source file."""
-        try:
-            self.collection.delete(
-                where={"source": source_filename}
+    def delete_documents_by_source(self, source_filename: str, category: str = None):
+        """
+        Deletes all document chunks from a specific source file. The delete only touches
+        the partition of the document's category (given, or from the catalog). Raises if
+        Chroma fails, so callers keep the document's catalog entry and file.
+        """
+        category = category or (self.catalog.get(source_filename) or {}).get("category")
+        for collection in self._read_collections([category] if category else None):
+            collection.delete(where={"source": source_filename})
+        self.dedup_index.remove_source(source_filename)
+        self.summaries.remove_source(source_filename)
+        self.parents.remove(source_filename)
+        self.pending.invalidate()
+        print(f"Deleted documents from source: {source_filename}")
+
+    def get_chunk_ids_by_source(self, source_filename: str) -> list[str]:
+        """Returns the ids of all chunks indexed for a source file. Raises if the collection can't be read."""
+        ids = []
+        for collection in self._read_collections():
+            ids.extend(collection.get(where={"source": source_filename}, include=[])['ids'] or [])
+        return ids
+
+    def get_source_metadata(self, source_filename: str) -> dict | None:
+        """Returns the metadata of one chunk of a source file (category, etc.), if indexed."""
+        for collection in self._read_collections():
+            results = collection.get(where={"source": source_filename}, limit=1, include=["metadatas"])
+            if results and results['metadatas']:
+                return results['metadatas'][0]
+        return None
+
+    def get_chunks_by_sources(self, source_filenames: list[str], include: list[str] = ("documents", "metadatas")) -> dict:
+        """Returns ids and the requested fields (documents and metadatas) of all chunks from the given source files."""
+        chunks = {"ids": [], **{field: [] for field in include}}
+        if not source_filenames:
+            return chunks
+        where = {"source": source_filenames[0]} if len(source_filenames) == 1 else {"source": {"$in": source_filenames}}
+        for collection in self._read_collections():
+            results = collection.get(where=where, include=list(include))
+            for field in chunks:
+                chunks[field].extend(results[field] if results.get(field) is not None else [])
+        return chunks
+
+    def _move(self, source, ids: list[str], metadatas: dict):
+        """Moves chunks with their embeddings to the partitions of their (new) metadata."""
+        rows = source.get(ids=ids, include=["documents", "embeddings"])
+        # New metadata never carries the pending flag: a zero vector still needs it
+        targets, _ = flag_pending([metadatas[chunk_id] for chunk_id in rows['ids']], rows['embeddings'])
+        for category, idx in _group_by_category(targets).items():
+            # upsert: a move interrupted after this write is simply redone
+            self._write_collection(category).upsert(
+                ids=[rows['ids'][i] for i in idx],
+                documents=[rows['documents'][i] for i in idx],
+                metadatas=[targets[i] for i in idx],
+                embeddings=[list(rows['embeddings'][i]) for i in idx]
             )
-            print(f"Deleted documents from source: {source_filename}")
-        except Exception as e:
-            print(f"Error deleting documents for {source_filename}: {e}")
+        source.delete(ids=rows['ids'])
+
+    def update_metadatas(self, ids: list[str], metadatas: list[dict]):
+        """Updates chunk metadata in place (no re-embedding); chunks whose category changed move partition."""
+        if not ids:
+            return
+        targets = dict(zip(ids, metadatas))
+        for collection in self._read_collections():
+            found = collection.get(ids=ids, include=[])['ids'] or []
+            if not found:
+                continue
+            stay = [i for i in found if self._write_name(targets[i].get("category")) == collection.name]
+            if stay:
+                collection.update(ids=stay, metadatas=[targets[i] for i in stay])
+            move = [i for i in found if self._write_name(targets[i].get("category")) != collection.name]
+            if move:
+                self._move(collection, move, targets)
+
+    def delete_documents_by_ids(self, ids: list[str]):
+        """Deletes specific chunks by id."""
+        if ids:
+            for collection in self._read_collections():
+                collection.delete(ids=ids)
+            self.dedup_index.remove_ids(ids)
+            self.pending.invalidate()
+
+    def update_category_by_source(self, source_filename: str, category: str) -> int:
+        """Re-tags all chunks of a source file with a new category (moving them to its partition) without re-embedding."""
+        results = self.get_chunks_by_sources([source_filename])
+        if not results['ids']:
+            return 0
+        self.update_metadatas(results['ids'], [{**m, "category": category} for m in results['metadatas']])
+        self.summaries.update_document(source_filename)
+        print(f"Re-tagged {len(results['ids'])} chunks from {source_filename} as {category}")
+        return len(results['ids'])
+
+    def partition_existing(self, batch_size: int = PARTITION_MOVE_BATCH) -> int:
+        """
+        Moves the chunks of an unpartitioned collection (indexed before partitioning) into
+        their category partitions, keeping their embeddings, then drops it. Searches keep
+        including it until it is gone, so nothing disappears while this runs.
+        """
+        names = self._partition_names()
+        if not INDEX_PARTITION_BY_CATEGORY or None not in names:
+            return 0
+        base = self._open(names[None])
+        moved = 0
+        while True:
+            batch = base.get(limit=batch_size, include=["metadatas"])
+            if not batch['ids']:
+                break
+            self._move(base, batch['ids'], dict(zip(batch['ids'], batch['metadatas'])))
+            moved += len(batch['ids'])
+        self.client.delete_collection(names.pop(None))
+        if moved:
+            print(f"[VectorStore] Moved {moved} chunks of {self.collection_name} into category partitions.")
+        return moved
 
     def clear_all_documents(self):
-        """Deletes all documents from the active provider's rag_docs collection."""
+        """Deletes all documents (every partition) of the active provider's rag_docs collection. Raises if Chroma fails."""
         try:
-            col_name = f"rag_docs_{self.provider}"
-            self.client.delete_collection(col_name)
-            # Collection will be recreated lazily by the .collection property
-            print(f"Cleared all documents for provider: {self.provider}")
-        except Exception as e:
-            print(f"Error clearing documents: {e}")
+            for collection in self._read_collections():
+                self.client.delete_collection(collection.name)
+        finally:
+            # Some partitions may be gone even if a later one failed
+            self._partition_cache = None
+            self.pending.invalidate()
+        self.dedup_index.remove_collection(self.collection_name)
+        self.summaries.clear()
+        self.parents.clear()
+        # Partitions are recreated lazily on the next write
+        print(f"Cleared all documents for provider: {self.provider}")
 
     def get_document_count(self) -> int:
-        """Returns the number of documents in the active collection."""
+        """Returns the number of documents in the active collection (all partitions)."""
         try:
-            return self.collection.count()
+            return sum(collection.count() for collection in self._read_collections())
         except Exception:
             return 0
 
+    def export_bundle(self, bundle_path: str, **kwargs) -> dict:
+        """Writes the serving index with its embeddings, catalog, uploads and images to a portable bundle."""
+        from .index_bundle import export_bundle
+        return export_bundle(self, bundle_path, **kwargs)
+
+    def import_bundle(self, bundle_path: str, **kwargs) -> dict:
+        """Restores a bundle written by export_bundle (server stopped), without re-embedding anything."""
+        from .index_bundle import import_bundle
+        return import_bundle(self, bundle_path, **kwargs)
+
     def reset_database(self):
         """Resets the vector store by deleting all RITE-related collections."""
         try:
              for col in self.client.list_collections():
                  if col.name.startswith(("rag_docs_", "chat_history_")):
                      self.client.delete_collection(col.name)
+                     self.dedup_index.remove_collection(col.name)
+             self._partition_cache = None
+             self.summaries.invalidate()
+             self.parents.clear()
+             self.pending.invalidate()
+             # Nothing left to switch between: serve the default collection with the configured model
+             self.index_state.reset()
+             if self._follows_index_state:
+                 self._apply_index_state()
              print("All RITE vector collections deleted.")
         except Exception as e:
              print(f"Error resetting database: {e}")
@@ -14,12 +14,17 @@ from core.persistent_session_service import PersistentSessionService
 from google.adk.sessions import Session
 from google.genai import types
 
-from core.loader import load_file, load_file_with_structure
-from core.chunker import chunk_text
-from core.advanced_chunker import StructureAwareChunker, TaskBasedChunker, ProceduralChunker, DynamicChunker
+from core.ingestion import record_document
 from core.image_processor import image_processor
+from core.ingestion_executor import IngestionExecutor
+from core.advanced_chunker import StructureAwareChunker, TaskBasedChunker, ProceduralChunker, DynamicChunker
 from core.vector_store import VectorStore
 from core.session_manager import SessionManager
+from core.file_store import stream_upload_to_disk
+from core.image_store import ImageStore, is_content_addressed, attachment_metrics, IMMUTABLE_CACHE_CONTROL
+from core.reconciler import VectorStoreReconciler, ingest_activity
+from core.pending_embeddings import ReembedWorker
+from core.index_maintenance import IndexMaintenance
 from agents.master_agent import master_agent
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
@@ -29,9 +34,11 @@ async def lifespan(app: FastAPI):
     # Startup logic
     import asyncio
     asyncio.create_task(sync_vector_store())
+    asyncio.create_task(reembed_worker.run_forever())
+    asyncio.create_task(index_maintenance.run_forever())
     yield
-    # Shutdown logic (if any)
-    pass
+    # Shutdown logic
+    ingestion_executor.shutdown()
 
 app = FastAPI(title="RITE AI Unified Platform", lifespan=lifespan)
 
@@ -57,6 +64,7 @@ vector_store = agent.vector_store
 print("[Main] Initializing PersistentSessionService...")
 session_service = PersistentSessionService(storage_path="sessions.json")
 session_manager = SessionManager()
+document_catalog = vector_store.catalog
 print("[Main] Components Initialized.")
 
 # Initialize Unified Mastery Runner
@@ -75,12 +83,28 @@ IMAGES_DIR = os.path.join(STATIC_DIR, "images")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(IMAGES_DIR, exist_ok=True)
 
+class ImageFiles(StaticFiles):
+    """Serves extracted images; content-addressed ones are marked immutable."""
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if is_content_addressed(os.path.basename(full_path)):
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+# Mounted before /static so image requests are matched here first
+app.mount("/static/images", ImageFiles(directory=IMAGES_DIR), name="images")
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
+image_store = ImageStore(IMAGES_DIR, document_catalog)
+
+reconciler = VectorStoreReconciler(vector_store, upload_dir=UPLOAD_DIR, images_dir=IMAGES_DIR)
+ingestion_executor = IngestionExecutor(vector_store, image_dir=IMAGES_DIR)
+reembed_worker = ReembedWorker(vector_store, activity=ingest_activity)
+index_maintenance = IndexMaintenance(vector_store, reconciler=reconciler)
+
 async def sync_vector_store():
     """Background task to sync disk files with current LLM index."""
-    # Simplified sync task
-    pass
+    await reconciler.run_forever()
 
 class ChatRequest(BaseModel):
     query: str
@@ -104,126 +128,166 @@ async def test_llm():
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+def _find_previous_versions(display_name: str, replace_source: str = None) -> list[str]:
+    """Finds the stored sources of a logical document (same original filename), newest first."""
+    if replace_source:
+        return [replace_source] if os.path.exists(os.path.join(UPLOAD_DIR, replace_source)) else []
+    
+    sources = [e["source_id"] for e in document_catalog.find_by_display_name(display_name)]
+    # Uploads that predate the catalog are matched by their uuid_filename naming
+    if os.path.exists(UPLOAD_DIR):
+        for filename in os.listdir(UPLOAD_DIR):
+            if filename.split('_', 1)[-1] == display_name and filename not in sources:
+                sources.append(filename)
+    return [s for s in sources if os.path.exists(os.path.join(UPLOAD_DIR, s))]
+
 @app.post("/upload")
 async def upload_document(
     files: list[UploadFile] = File(...), 
-    category: str = Form(..., pattern="^(hr|product)$")
+    category: str = Form(..., pattern="^(hr|product)$"),
+    mode: str = Form("new", pattern="^(new|replace)$"),
+    replace_source: str | None = Form(None)
 ):
+    """
+    Uploads and indexes documents.
+    mode='replace' treats the upload as a new version of the document with the same
+    original filename (or of `replace_source`) and only re-embeds chunks that changed.
+    """
     if not files:
         raise HTTPException(status_code=400, detail="No files provided")
     
-    results = []
-    
-    # Initialize intelligent chunker
-    dynamic_chunker = DynamicChunker()
+    results = [None] * len(files)
+    jobs, pending = [], []
     
-    import re
-    image_pattern = re.compile(r'!\[(.*?)\]\((.*?)\)')
-
-    for file in files:
-        try:
-            file_id = str(uuid.uuid4())
-            filename = f"{file_id}_{file.filename}"
-            filepath = os.path.join(UPLOAD_DIR, filename)
-            
-            with open(filepath, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            
-            # Load text with structure if possible
-            if filename.lower().endswith(('.doc', '.docx')):
-                text_content = load_file_with_structure(filepath, output_image_dir=IMAGES_DIR)
-                
-                # PROCESS IMAGES: Detect, Describe, Replace
-                # Find all markdown images: ![description](path)
-                matches = image_pattern.findall(text_content)
-                
-                if matches and (category == 'product' or 'step' in text_content.lower()):
-                    import asyncio
-                    print(f"Found {len(matches)} images in {filename}. Generating descriptions concurrently...")
-                    
-                    tasks = []
-                    valid_matches = []
-                    
-                    # Prepare tasks
-                    for alt_text, img_rel_path in matches:
-                        # Resolve absolute path
-                        if img_rel_path.startswith('/static/'):
-                            clean_path = img_rel_path.replace('/static/', '', 1) 
-                            full_img_path = os.path.join(STATIC_DIR, clean_path)
-                        else:
-                            full_img_path = img_rel_path
-                        
-                        if os.path.exists(full_img_path):
-                            tasks.append(image_processor.generate_description_async(full_img_path))
-                            valid_matches.append((alt_text, img_rel_path))
-                    
-                    if tasks:
-                        # Run all descriptions in parallel, return exceptions instead of failing
-                        descriptions_or_errors = await asyncio.gather(*tasks, return_exceptions=True)
-                        
-                        processed_descriptions = []
-                        for result in descriptions_or_errors:
-                            if isinstance(result, Exception):
-                                print(f"Image processing error: {result}")
-                                processed_descriptions.append("Image description unavailable due to error.")
-                            else:
-                                processed_descriptions.append(result)
-                        
-                        # Replace in content
-                        for (alt_text, img_rel_path), description in zip(valid_matches, processed_descriptions):
-                            original_md = f"![{alt_text}]({img_rel_path})"
-                            new_md = f"![Image: {description}]({img_rel_path})"
-                            text_content = text_content.replace(original_md, new_md)
-                            
-                    print(f"Processed {len(tasks)} images concurrently.")
-                        
-            else:
-                text_content = load_file(filepath)
-            
-            # Dynamic chunking - Pass explicit category
-            chunks = dynamic_chunker.chunk(text_content, category=category)
-            
-            if not chunks:
-                # Ultimate fallback
-                chunks = chunk_text(text_content)
-            
-            if not chunks:
-                 results.append({"filename": file.filename, "status": "failed", "error": "No text content found or chunking failed."})
-                 continue
-
+    try:
+        # Stage every file on disk first; duplicates are answered right away
+        for position, file in enumerate(files):
+            filename = None
             try:
-                print(f"Indexing {len(chunks)} chunks for {file.filename} using {category} category...")
-                # Add explicit category metadata for retrieval filtering
-                metadatas = [{"source": filename, "category": category} for _ in chunks]
+                old_sources = _find_previous_versions(file.filename, replace_source) if mode == "replace" else []
+                # A new version keeps the document id of the version it replaces
+                file_id = old_sources[0].split('_', 1)[0] if old_sources else str(uuid.uuid4())
+                filename = f"{file_id}_{file.filename}"
+                filepath = os.path.join(UPLOAD_DIR, filename)
+                ingest_activity.begin(filename)
                 
-                vector_store.add_documents(
-                    documents=chunks, 
-                    metadatas=metadatas, 
-                    ids=[f"{file_id}_{i}" for i in range(len(chunks))]
-                )
-                print(f"Successfully generated embeddings and indexed {file.filename}")
+                # Stream to a temp name first so we can hash before committing to a new document
+                incoming_path = os.path.join(UPLOAD_DIR, f".incoming_{uuid.uuid4()}")
+                content_hash, file_size = await stream_upload_to_disk(file, incoming_path)
                 
-                # Verification
-                count = vector_store.get_document_count()
-                print(f"Total documents in Vector Store: {count}")
+                # DUPLICATE SHORT-CIRCUIT: identical bytes were already parsed, described and embedded
+                existing = document_catalog.find_by_hash(content_hash)
+                if existing and os.path.exists(os.path.join(UPLOAD_DIR, existing["source_id"])):
+                    os.remove(incoming_path)
+                    ingest_activity.end(filename)
+                    source_id = existing["source_id"]
+                    if existing.get("category") != category:
+                        vector_store.update_category_by_source(source_id, category)
+                        document_catalog.upsert(source_id, category=category)
+                    print(f"Duplicate upload of {file.filename} matches {source_id}. Skipping re-processing.")
+                    results[position] = {
+                        "filename": file.filename,
+                        "status": "duplicate",
+                        "source_id": source_id,
+                        "category": category,
+                        "chunks": existing.get("chunk_count", 0),
+                        "chunk_ids": vector_store.get_chunk_ids_by_source(source_id)
+                    }
+                    continue
                 
+                # A new version under the same name is indexed from a staged copy (same extension) and only
+                # moved over the old bytes once indexed, so a failure leaves file, index and catalog as they were
+                staged_path = filepath
+                if os.path.exists(filepath):
+                    staged_path = os.path.join(UPLOAD_DIR, f".incoming_{uuid.uuid4()}_{filename}")
+                os.replace(incoming_path, staged_path)
+                jobs.append({"filepath": staged_path, "doc_id": file_id, "source": filename,
+                             "category": category, "old_sources": old_sources})
+                pending.append({"position": position, "display_name": file.filename, "source": filename,
+                                "old_sources": old_sources, "content_hash": content_hash, "size": file_size,
+                                "filepath": filepath, "staged_path": staged_path})
             except Exception as e:
-                print(f"Index error for {file.filename}: {e}")
-                results.append({"filename": file.filename, "status": "failed", "error": f"Indexing failed: {str(e)}"})
+                import traceback
+                traceback.print_exc()
+                if filename:
+                    ingest_activity.end(filename)
+                results[position] = {"filename": file.filename, "status": "failed", "error": str(e)}
+        
+        # Parse/chunk in worker processes, describe and embed concurrently, write in batches
+        outcomes, throughput = await ingestion_executor.ingest_many(jobs)
+        
+        for item, stats in zip(pending, outcomes):
+            display_name, filename, old_sources = item["display_name"], item["source"], item["old_sources"]
+            filepath = item["filepath"]
+            if "error" in stats:
+                print(f"Index error for {display_name}: {stats['error']}")
+                results[item["position"]] = {"filename": display_name, "status": "failed", "error": f"Indexing failed: {stats['error']}"}
                 continue
+            if not stats["chunks"]:
+                results[item["position"]] = {"filename": display_name, "status": "failed", "error": "No text content found or chunking failed."}
+                continue
+            print(f"Successfully generated embeddings and indexed {display_name}")
             
-            results.append({"filename": file.filename, "status": "success", "chunks": len(chunks)})
-        except Exception as e:
-            import traceback
-            traceback.print_exc()
-            results.append({"filename": file.filename, "status": "failed", "error": str(e)})
+            # Images of the versions being replaced; freed below unless the new version still uses them
+            released = [name for s in old_sources for name in (document_catalog.get(s) or {}).get("images", [])]
+            try:
+                # Catalog and files change together: a failure rolls the catalog back
+                with document_catalog.transaction():
+                    record_document(
+                        vector_store,
+                        filename,
+                        display_name=display_name,
+                        category=category,
+                        content_hash=item["content_hash"],
+                        size=item["size"],
+                        chunk_count=stats["chunks"],
+                        image_count=stats["image_count"],
+                        images=stats["images"],
+                        timings=stats["timings"]
+                    )
+                    
+                    if item["staged_path"] != filepath:
+                        os.replace(item["staged_path"], filepath)
+                    
+                    # Older versions stored under a different name are superseded
+                    for old_source in old_sources:
+                        if old_source != filename:
+                            document_catalog.remove(old_source)
+                            os.remove(os.path.join(UPLOAD_DIR, old_source))
+            except Exception as e:
+                results[item["position"]] = {"filename": display_name, "status": "failed", "error": str(e)}
+                continue
+            image_store.release(released)
+            
+            results[item["position"]] = {
+                "filename": display_name,
+                "status": "replaced" if old_sources else "success",
+                "source_id": filename,
+                "chunks": stats["chunks"],
+                "embedded": stats["embedded"],
+                "kept": stats["kept"],
+                "deleted": stats["deleted"],
+                "deduplicated": stats["deduplicated"],
+                "reused_embeddings": stats["reused"]
+            }
+        
+        # Verification
+        count = vector_store.get_document_count()
+        print(f"Total documents in Vector Store: {count}")
+    finally:
+        for item in pending:
+            # Staged copies of versions that failed to index (moved into place on success)
+            if item["staged_path"] != item["filepath"] and os.path.exists(item["staged_path"]):
+                os.remove(item["staged_path"])
+            ingest_activity.end(item["source"])
     
-    return {"files": results}
+    return {"files": results, "throughput": throughput}
 
 
 @app.post("/chat")
 async def chat_unified(request: ChatRequest):
     try:
+        ingest_activity.mark()
         user_id = request.user_id
         query = request.query
         conversation_id = request.conversation_id
@@ -287,6 +351,7 @@ async def chat_stream(request: ChatRequest):
     
     async def generate():
         try:
+            ingest_activity.mark()
             user_id = request.user_id
             query = request.query
             conversation_id = request.conversation_id
@@ -390,27 +455,49 @@ async def get_history(user_id: str = "user_1", query: str = ""):
 
 @app.get("/files")
 async def list_files():
-    """Lists all uploaded files."""
+    """Lists all uploaded files (served from the document catalog)."""
     try:
-        files = []
-        if os.path.exists(UPLOAD_DIR):
-            for filename in os.listdir(UPLOAD_DIR):
-                filepath = os.path.join(UPLOAD_DIR, filename)
-                if os.path.isfile(filepath):
-                    # We store files with uuid prefix: uuid_filename.ext
-                    # Try to separate them for clearer display
-                    parts = filename.split('_', 1)
-                    display_name = parts[1] if len(parts) > 1 else filename
-                    files.append({
-                        "id": filename,
-                        "name": display_name,
-                        "size": os.path.getsize(filepath),
-                        "timestamp": os.path.getmtime(filepath)
-                    })
+        files = [
+            {
+                "id": entry["source_id"],
+                "name": entry.get("display_name", entry["source_id"]),
+                "category": entry.get("category"),
+                "size": entry.get("size", 0),
+                "chunks": entry.get("chunk_count", 0),
+                "images": entry.get("image_count", 0),
+                "timestamp": entry.get("updated_at", 0)
+            }
+            for entry in document_catalog.list_documents()
+        ]
         return {"files": sorted(files, key=lambda x: x['timestamp'], reverse=True)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/stats")
+async def index_stats():
+    """Document and chunk counts per category, answered from the catalog."""
+    return {
+        **document_catalog.get_stats(),
+        "embedding_model": vector_store.embedding_model,
+        "collection": vector_store.collection_name,
+        "embedding_dimension": vector_store.embedding_dimension,
+        "index_profile": {"name": vector_store.index_profile, **vector_store.hnsw_params},
+        "dedup": vector_store.dedup_index.get_stats(),
+        "image_descriptions": image_processor.cache.get_stats() if image_processor.cache else None,
+        "vision": image_processor.metrics.get_stats(),
+        "image_store": image_store.get_stats(),
+        "image_attachments": attachment_metrics.get_stats(),
+        "image_part_cache": master_agent.image_parts.get_stats(),
+        "parent_cache": vector_store.parents.get_stats(),
+        "pending_embeddings": reembed_worker.get_stats(),
+        "maintenance": index_maintenance.get_stats()
+    }
+
+@app.post("/maintenance")
+async def run_maintenance():
+    """Runs an index maintenance pass now (orphan cleanup, dimension checks, stats; rebuilds are offline only)."""
+    return await index_maintenance.run_once()
+
 @app.delete("/files/{filename}")
 async def delete_file(filename: str):
     """Deletes a specific uploaded file and its vector store entries."""
@@ -419,11 +506,18 @@ async def delete_file(filename: str):
         if not os.path.exists(filepath):
             raise HTTPException(status_code=404, detail="File not found")
         
-        # 1. Delete from Vector Store
-        vector_store.delete_documents_by_source(filename)
+        entry = document_catalog.get(filename) or {}
+        # 1. Delete from Vector Store, outside the catalog lock; on failure the document stays listed
+        vector_store.delete_documents_by_source(filename, category=entry.get("category"))
+
+        with document_catalog.transaction():
+            document_catalog.remove(filename)
+            
+            # 2. Delete from Disk (if this fails the entry comes back and the reconciler re-indexes the file)
+            os.remove(filepath)
         
-        # 2. Delete from Disk
-        os.remove(filepath)
+        # 3. Images no other document references
+        image_store.release(entry.get("images", []))
         
         return {"message": f"Successfully deleted {filename}"}
     except Exception as e:
@@ -433,8 +527,9 @@ async def delete_file(filename: str):
 async def clear_all_files():
     """Deletes all uploaded files and clears the RAG vector store."""
     try:
-        # 1. Clear Vector Store
+        # 1. Clear Vector Store, then the catalog (kept if Chroma fails; the reconciler re-indexes what was dropped)
         vector_store.clear_all_documents()
+        document_catalog.clear()
         
         # 2. Delete files from disk
         if os.path.exists(UPLOAD_DIR):
@@ -0,0 +1,68 @@
+
+import argparse
+import asyncio
+import os
+from core.vector_store import VectorStore
+from core.index_bundle import BUNDLE_PRECISION, BUNDLE_PRECISIONS
+from core.embedding_reduction import EMBEDDING_DIMENSION, PCA_FIT_SAMPLE, fit_pca
+from core.index_tuning import TUNE_SAMPLE, TUNE_QUERIES, TUNE_K, TUNE_MIN_RECALL, TUNE_GRID, tune
+from core.index_maintenance import IndexMaintenance
+from core.reconciler import VectorStoreReconciler
+
+UPLOAD_DIR = "uploads"
+IMAGE_DIR = os.path.join("static", "images")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_cmd = commands.add_parser("export", help="write the serving index, catalog, uploads and images to a bundle")
+    export_cmd.add_argument("bundle", help="bundle file to write (zip)")
+    export_cmd.add_argument("--precision", choices=BUNDLE_PRECISIONS, default=BUNDLE_PRECISION,
+                            help="vector storage precision in the bundle")
+
+    import_cmd = commands.add_parser("import", help="restore a bundle into this node (stop the server first)")
+    import_cmd.add_argument("bundle", help="bundle file written by export")
+    import_cmd.add_argument("--replace", action="store_true", help="overwrite a non-empty collection")
+
+    tune_cmd = commands.add_parser("tune", help="sweep HNSW parameters on a sample of the index and save the best as a profile")
+    tune_cmd.add_argument("--sample", type=int, default=TUNE_SAMPLE, help="indexed chunks to build the test indexes from")
+    tune_cmd.add_argument("--queries", type=int, default=TUNE_QUERIES, help="held-out queries (chat questions, then chunks)")
+    tune_cmd.add_argument("--k", type=int, default=TUNE_K, help="neighbours for recall@k")
+    tune_cmd.add_argument("--min-recall", type=float, default=TUNE_MIN_RECALL, help="recall the recommendation must reach")
+    tune_cmd.add_argument("--m", type=int, nargs="+", default=TUNE_GRID["M"])
+    tune_cmd.add_argument("--ef-construction", type=int, nargs="+", default=TUNE_GRID["ef_construction"])
+    tune_cmd.add_argument("--ef-search", type=int, nargs="+", default=TUNE_GRID["ef_search"])
+    tune_cmd.add_argument("--name", default="tuned", help="profile name to save (select it with INDEX_PROFILE)")
+    tune_cmd.add_argument("--dry-run", action="store_true", help="report only, do not save the profile")
+
+    pca_cmd = commands.add_parser("fit-pca", help="fit the projection to EMBEDDING_DIMENSION for models the provider cannot cut")
+    pca_cmd.add_argument("--dimension", type=int, default=EMBEDDING_DIMENSION or None, required=not EMBEDDING_DIMENSION)
+    pca_cmd.add_argument("--sample", type=int, default=PCA_FIT_SAMPLE, help="chunks to fit on")
+
+    maintain_cmd = commands.add_parser("maintain", help="remove orphans, check dimensions, rebuild degraded collections "
+                                                        "and record index stats (stop the server first)")
+    maintain_cmd.add_argument("--no-compact", action="store_true", help="report deleted ratios without rebuilding")
+
+    args = parser.parse_args()
+    vs = VectorStore()
+    if args.command == "export":
+        vs.export_bundle(args.bundle, upload_dir=UPLOAD_DIR, images_dir=IMAGE_DIR, precision=args.precision)
+    elif args.command == "import":
+        vs.import_bundle(args.bundle, upload_dir=UPLOAD_DIR, images_dir=IMAGE_DIR, replace=args.replace)
+    elif args.command == "tune":
+        grid = {"M": args.m, "ef_construction": args.ef_construction, "ef_search": args.ef_search}
+        tune(vs, grid=grid, sample=args.sample, queries=args.queries, k=args.k, min_recall=args.min_recall,
+             profile_name=args.name, write=not args.dry_run)
+    elif args.command == "fit-pca":
+        fit_pca(vs, args.dimension, sample=args.sample)
+    elif args.command == "maintain":
+        reconciler = VectorStoreReconciler(vs, upload_dir=UPLOAD_DIR, images_dir=IMAGE_DIR)
+        asyncio.run(IndexMaintenance(vs, reconciler=reconciler).run_once(compact=not args.no_compact))
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+    main()
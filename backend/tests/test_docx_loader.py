@@ -0,0 +1,44 @@
+import os
+import sys
+import zipfile
+
+# Add parent dir to path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.docx_loader import load_docx_with_structure
+
+W_DECL = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+
+STYLES = f"""<w:styles {W_DECL}>
+<w:style w:styleId="ListNumber"><w:name w:val="List Number"/><w:pPr><w:numPr><w:numId w:val="1"/></w:numPr></w:pPr></w:style>
+<w:style w:styleId="ListBullet"><w:name w:val="List Bullet"/><w:pPr><w:numPr><w:numId w:val="2"/></w:numPr></w:pPr></w:style>
+</w:styles>"""
+
+NUMBERING = f"""<w:numbering {W_DECL}>
+<w:abstractNum w:abstractNumId="0"><w:lvl w:ilvl="0"><w:start w:val="1"/><w:numFmt w:val="decimal"/></w:lvl></w:abstractNum>
+<w:abstractNum w:abstractNumId="1"><w:lvl w:ilvl="0"><w:numFmt w:val="bullet"/></w:lvl></w:abstractNum>
+<w:num w:numId="1"><w:abstractNumId w:val="0"/></w:num>
+<w:num w:numId="2"><w:abstractNumId w:val="1"/></w:num>
+</w:numbering>"""
+
+
+def _paragraph(text, style):
+    return f'<w:p><w:pPr><w:pStyle w:val="{style}"/></w:pPr><w:r><w:t>{text}</w:t></w:r></w:p>'
+
+
+def test_list_styles_number_items_in_sequence(tmp_path):
+    body = "".join([
+        _paragraph("Open the installer", "ListNumber"),
+        _paragraph("Accept the licence", "ListNumber"),
+        _paragraph("Click Finish", "ListNumber"),
+        _paragraph("Reboot if asked", "ListBullet"),
+    ])
+    path = tmp_path / "setup.docx"
+    with zipfile.ZipFile(path, "w") as package:
+        package.writestr("word/document.xml", f"<w:document {W_DECL}><w:body>{body}</w:body></w:document>")
+        package.writestr("word/styles.xml", STYLES)
+        package.writestr("word/numbering.xml", NUMBERING)
+
+    lines = [line for line in load_docx_with_structure(str(path)).splitlines() if line]
+
+    assert lines == ["1. Open the installer", "2. Accept the licence", "3. Click Finish", "* Reboot if asked"]
@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+
+# Add parent dir to path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.tabular_loader import iter_table_chunks
+
+openpyxl = pytest.importorskip("openpyxl")
+
+
+def test_xlsx_rows_are_numbered_from_the_used_range(tmp_path):
+    # Header at B3, a blank row between records
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = "Staff"
+    sheet["B3"], sheet["C3"] = "name", "age"
+    sheet["B4"], sheet["C4"] = "ana", 31
+    sheet["B6"], sheet["C6"] = "ben", 42
+    path = tmp_path / "1abc_staff.xlsx"
+    workbook.save(path)
+
+    chunks = list(iter_table_chunks(str(path)))
+
+    assert len(chunks) == 1
+    text, meta = chunks[0]
+    assert meta == {"sheet": "Staff", "row_start": 4, "row_end": 6}
+    assert text.splitlines() == [
+        "Table: staff.xlsx / Staff (rows 4-6)",
+        "name | age",
+        "ana | 31",
+        "ben | 42",
+    ]
@@ -1,11 +1,16 @@
 
+import argparse
+import asyncio
 import os
 import shutil
-import uuid
 from core.vector_store import VectorStore
-from core.loader import load_file_with_structure, load_file
-from core.advanced_chunker import DynamicChunker
-from core.chunker import chunk_text
+from core.index_state import IndexState
+from core.index_migration import OnlineMigration, rollback
+from core.ingestion import record_document
+from core.ingestion_executor import IngestionExecutor
+from core.file_store import hash_file
+from core.image_store import ImageStore
+from core.reconciler import guess_category
 
 UPLOAD_DIR = "uploads"
 IMAGE_DIR = os.path.join("static", "images")
@@ -28,59 +33,86 @@ def upgrade_embeddings():
 
     # 2. Re-initialize Vector Store (will recreate empty DB with new dims)
     print("Initializing new Vector Store...")
-    vs = VectorStore()
-    chunker = DynamicChunker()
+    # The collections recorded by earlier online migrations are gone with the directory
+    IndexState(storage_path="index_state.json").reset()
+    default = VectorStore()
+    # The catalog still names the old model: pin the one configured in .env
+    vs = VectorStore(collection_name=default.collection_name, embedding_model=default.configured_embedding_model)
     
     # 3. Process Uploads
     if not os.path.exists(UPLOAD_DIR):
         print("No uploads directory found. Nothing to re-index.")
         return
 
-    files = [f for f in os.listdir(UPLOAD_DIR) if os.path.isfile(os.path.join(UPLOAD_DIR, f))]
+    files = [f for f in os.listdir(UPLOAD_DIR) if os.path.isfile(os.path.join(UPLOAD_DIR, f)) and not f.startswith('.')]
     print(f"Found {len(files)} files to re-index.")
     
+    jobs = []
     for filename in files:
-        filepath = os.path.join(UPLOAD_DIR, filename)
-        print(f"Processing: {filename}...")
-        
-        try:
+        entry = vs.catalog.get(filename) or {}
+        jobs.append({
+            "filepath": os.path.join(UPLOAD_DIR, filename),
             # Deterministic ID prefix
-            file_id_prefix = filename.split('_')[0]
-            
-            # Load Content
-            if filename.lower().endswith(('.doc', '.docx')):
-                content = load_file_with_structure(filepath, output_image_dir=IMAGE_DIR)
-            else:
-                content = load_file(filepath)
-            
-            # Chunk
-            chunks = chunker.chunk(content)
-            if not chunks:
-                chunks = chunk_text(content)
-                
-            if not chunks:
-                print(f"Skipping {filename}: No text extracted.")
-                continue
-                
-            print(f" - Generated {len(chunks)} chunks.")
-            
-            # Determine Category
-            category = "product" if "manual" in filename.lower() or "guide" in filename.lower() else "hr"
-            
-            # Index
-            vs.add_documents(
-                documents=chunks,
-                metadatas=[{"source": filename, "category": category} for _ in chunks],
-                ids=[f"{file_id_prefix}_{i}_{uuid.uuid4().hex[:6]}" for i in range(len(chunks))]
-            )
-            print(" - Indexed successfully.")
-            
-        except Exception as e:
-            print(f"Failed to index {filename}: {e}")
+            "doc_id": filename.split('_')[0],
+            "source": filename,
+            "category": entry.get("category") or guess_category(filename)
+        })
+    
+    # Parse/chunk across processes, embed concurrently, write in batches
+    executor = IngestionExecutor(vs, image_dir=IMAGE_DIR)
+    image_store = ImageStore(IMAGE_DIR, vs.catalog)
+    try:
+        outcomes, throughput = asyncio.run(executor.ingest_many(jobs))
+    finally:
+        executor.shutdown()
+    
+    for job, stats in zip(jobs, outcomes):
+        filename = job["source"]
+        if "error" in stats:
+            print(f"Failed to index {filename}: {stats['error']}")
+            continue
+        if not stats["chunks"]:
+            print(f"Skipping {filename}: No text extracted.")
+            continue
+        entry = vs.catalog.get(filename) or {}
+        filepath = job["filepath"]
+        record_document(
+            vs,
+            filename,
+            display_name=entry.get("display_name", filename.split('_', 1)[-1]),
+            category=job["category"],
+            content_hash=entry.get("content_hash") or hash_file(filepath),
+            size=os.path.getsize(filepath),
+            chunk_count=stats["chunks"],
+            image_count=stats["image_count"],
+            images=stats["images"],
+            timings=stats["timings"]
+        )
+        image_store.release(entry.get("images", []))
+        print(f" - {filename}: {stats['chunks']} chunks indexed.")
+
+    print(f"\nRe-indexed {throughput['documents']}/{len(jobs)} documents in {throughput['elapsed_s']}s "
+          f"({throughput['docs_per_min']} docs/min).")
+    print("Upgrade Complete! Database is now using text-embedding-004.")
 
-    print("\nUpgrade Complete! Database is now using text-embedding-004.")
+def upgrade_embeddings_online():
+    """Builds the new index next to the live one and switches over once verified."""
+    migration = OnlineMigration(UPLOAD_DIR, IMAGE_DIR)
+    if asyncio.run(migration.run()):
+        print("Upgrade Complete! The server picks up the new index on its next request.")
 
 if __name__ == "__main__":
     from dotenv import load_dotenv
     load_dotenv()
-    upgrade_embeddings()
+    parser = argparse.ArgumentParser(description="Re-index uploads with the embedding model configured in .env")
+    parser.add_argument("--online", action="store_true",
+                        help="build a shadow collection while the server keeps serving, then switch (resumable)")
+    parser.add_argument("--rollback", action="store_true",
+                        help="serve the index replaced by the last online switch again")
+    args = parser.parse_args()
+    if args.rollback:
+        rollback(VectorStore())
+    elif args.online:
+        upgrade_embeddings_online()
+    else:
+        upgrade_embeddings()